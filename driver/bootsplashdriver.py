@@ -1,8 +1,10 @@
 from waveshare_epd import epd7in5_V2
+import warmstart
 from PIL import Image
 
 WALLMOUNT = False
 
+warmstart.invalidate()
 epd = epd7in5_V2.EPD()
 
 epd.init()
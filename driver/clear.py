@@ -1,5 +1,7 @@
 from waveshare_epd import epd7in5_V2
+import warmstart
 
+warmstart.invalidate()
 epd = epd7in5_V2.EPD()
 
 epd.init()
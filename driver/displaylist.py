@@ -0,0 +1,82 @@
+from collections import Counter
+from typing import NamedTuple, Optional
+import hashlib
+
+# Display list primitives. Coordinates are in layout space (portrait, EPD_HEIGHT x EPD_WIDTH),
+# fonts are referenced by key so lists stay hashable and independent of the rasterizer.
+
+class Text(NamedTuple):
+    xy: tuple
+    text: str
+    font: str
+    fill: int = 0x00
+    anchor: Optional[str] = None
+    align: str = "left"
+
+class Rect(NamedTuple):
+    box: tuple
+    fill: Optional[int] = None
+    outline: Optional[int] = None
+    width: int = 1
+
+class RoundedRect(NamedTuple):
+    box: tuple
+    radius: int
+    fill: Optional[int] = None
+    outline: Optional[int] = None
+    width: int = 1
+
+class Line(NamedTuple):
+    xy: tuple
+    fill: int = 0x00
+    width: int = 1
+
+class Circle(NamedTuple):
+    center: tuple
+    radius: int
+    fill: Optional[int] = None
+    outline: Optional[int] = None
+    width: int = 1
+
+class Sprite(NamedTuple):
+    xy: tuple
+    path: str
+
+PRIMITIVES = (Text, Rect, RoundedRect, Line, Circle, Sprite)
+
+def hashList(displayList):
+    """Stable content hash of a display list, used as a frame cache key."""
+    h = hashlib.sha1()
+    for primitive in displayList:
+        h.update(type(primitive).__name__.encode())
+        h.update(repr(tuple(primitive)).encode())
+    return h.hexdigest()
+
+def diffLists(old, new):
+    """Return (removed, added) primitives between two display lists.
+
+    All ink on the panel is the same black, so a pixel can only change if a primitive covering it
+    was removed or added. Primitives present in both lists are ignored.
+    """
+    oldCount = Counter(old)
+    newCount = Counter(new)
+    removed = list((oldCount - newCount).elements())
+    added = list((newCount - oldCount).elements())
+    return removed, added
+
+def unionBox(boxes):
+    boxes = list(boxes)
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+def dirtyRegions(old, new, bounds):
+    """Bounding boxes (x0, y0, x1, y1, exclusive) of everything that changed between two lists.
+
+    `bounds` maps a primitive to its box, usually `Rasterizer.bounds`. Returns None if there is no
+    previous list, meaning the whole screen is dirty.
+    """
+    if old is None:
+        return None
+    removed, added = diffLists(old, new)
+    return [bounds(p) for p in removed + added]
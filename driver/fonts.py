@@ -0,0 +1,131 @@
+"""Font loading for the driver.
+
+Faces are loaded once per (file, size) and shared by every rasterizer and widget. If a subset of
+a font exists in SUBSET_DIR it is used instead of the full face; build the subsets once with
+
+    python3 fonts.py subset
+
+(needs fontTools, which is only required on the machine building the subsets) and check the
+effect on startup with
+
+    python3 fonts.py report
+"""
+from PIL import ImageFont
+import os
+import string
+import sys
+import time
+
+SUBSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts-subset')
+
+def charRange(first, last):
+    return "".join(chr(code) for code in range(first, last + 1))
+
+# Everything the screen may render: calendar subjects, mail senders and room names come from
+# users, so Latin-1 and Latin Extended-A (Western, Central and Eastern European languages) plus
+# the typographic punctuation word processors and mail clients insert
+GLYPHS = (
+    string.ascii_letters + string.digits + string.punctuation + " "
+    + charRange(0x00A0, 0x00FF)  # Latin-1 Supplement
+    + charRange(0x0100, 0x017F)  # Latin Extended-A
+    + "‐‑‒–—―‘’‚‛“”„‟†‡•…‰′″‹›⁄€™−"
+)
+
+# (file, size) -> ImageFont
+_cache = {}
+# (file, size) -> {"file": resolved file, "load_ms": ..., "rss_kb": ...}
+_stats = {}
+
+def rssKb():
+    """Resident set size of this process in kB, or None where /proc is not available."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def subsetPath(path):
+    return os.path.join(SUBSET_DIR, os.path.basename(path))
+
+def resolveFont(path):
+    """Prefer the subset of a font if it has been built."""
+    subset = subsetPath(path)
+    if os.path.exists(subset):
+        return subset
+    return path
+
+def getFont(path, size):
+    key = (path, size)
+    font = _cache.get(key)
+    if font is None:
+        resolved = resolveFont(path)
+        rss = rssKb()
+        start = time.perf_counter()
+        font = ImageFont.truetype(resolved, size)
+        loadMs = (time.perf_counter() - start) * 1000
+        after = rssKb()
+        _cache[key] = font
+        _stats[key] = {
+            "file": resolved,
+            "load_ms": round(loadMs, 3),
+            "rss_kb": after - rss if rss is not None and after is not None else None,
+        }
+    return font
+
+def loadFonts(fonts):
+    """Load a font key -> (file, size) mapping, sharing faces with everything loaded before."""
+    return {key: getFont(path, size) for key, (path, size) in fonts.items()}
+
+def fontStats():
+    return {
+        "fonts": [{"path": path, "size": size, **stats} for (path, size), stats in _stats.items()],
+        "load_ms": round(sum(s["load_ms"] for s in _stats.values()), 3),
+        "rss_kb": rssKb(),
+    }
+
+def clearFonts():
+    _cache.clear()
+    _stats.clear()
+
+def subsetFont(path, dst, text=GLYPHS):
+    from fontTools import subset
+
+    options = subset.Options()
+    options.layout_features = ['kern', 'liga']
+    options.name_IDs = ['*']
+    options.notdef_outline = True
+    font = subset.load_font(path, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+    subset.save_font(font, dst, options)
+
+def subsetFonts(fonts):
+    os.makedirs(SUBSET_DIR, exist_ok=True)
+    for path in sorted({path for path, _ in fonts.values()}):
+        dst = subsetPath(path)
+        subsetFont(path, dst)
+        print(f"{path}: {os.path.getsize(path)} -> {os.path.getsize(dst)} bytes")
+
+def report(fonts):
+    clearFonts()
+    before = rssKb()
+    loadFonts(fonts)
+    stats = fontStats()
+    for entry in stats["fonts"]:
+        print(f'{entry["file"]} @ {entry["size"]}: {entry["load_ms"]} ms, {entry["rss_kb"]} kB')
+    print(f'total: {stats["load_ms"]} ms, RSS {before} -> {stats["rss_kb"]} kB')
+
+if __name__ == "__main__":
+    from screen import FONTS
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    if command == "subset":
+        subsetFonts(FONTS)
+    elif command == "report":
+        report(FONTS)
+    else:
+        print("usage: fonts.py [subset|report]")
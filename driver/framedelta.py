@@ -0,0 +1,197 @@
+"""Delta frame protocol between a renderer (the API's /render/delta) and the panel.
+
+A message carries one frame, either as a keyframe or as the XOR against the frame the client
+acknowledged (its base), run-length encoded, plus the dirty rectangles the panel has to
+partially refresh. Little endian:
+
+    header   b'OCFD', version u8, flags u8 (1 = keyframe), rect count u16,
+             sha1 of the base frame (zeros for keyframes), sha1 of the frame, payload length u32
+    rects    rect count x (x0, y0, x1, y1) u16: panel pixels, exclusive, x multiple of 8
+    payload  RLE of the XOR (keyframe: of the frame itself)
+
+RLE tokens start with a varint n: n & 1 = 0 -> n >> 1 literal bytes follow, n & 1 = 1 -> the
+next byte repeated n >> 1 times. A second hand step is ~150 bytes instead of 48000. The client
+applies a message in place on its packed buffer, checks the frame hash and asks for a keyframe
+(no base) whenever something doesn't add up.
+"""
+import hashlib
+import struct
+import numpy as np
+
+MAGIC = b'OCFD'
+VERSION = 1
+FLAG_KEYFRAME = 1
+HEADER = struct.Struct('<4sBBH20s20sI')
+RECT = struct.Struct('<HHHH')
+NO_FRAME = bytes(20)
+
+# Deltas a client may chain before the renderer sends a keyframe again
+KEYFRAME_INTERVAL = 300
+# Shorter runs are cheaper as part of a literal
+MIN_RUN = 3
+# Dirty row bands closer than this are refreshed as one rectangle
+MERGE_ROWS = 8
+
+def frameHash(frame):
+    return hashlib.sha1(frame).digest()
+
+def putVarint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def readVarint(data, i):
+    value = 0
+    shift = 0
+    while True:
+        b = data[i]
+        i += 1
+        value |= (b & 0x7F) << shift
+        shift += 7
+        if not b & 0x80:
+            return value, i
+
+def rleEncode(data):
+    arr = np.frombuffer(data, dtype=np.uint8)
+    out = bytearray()
+    if not len(arr):
+        return bytes(out)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(arr)) + 1))
+    lengths = np.diff(np.append(starts, len(arr)))
+    literal = None
+    for start, length in zip(starts.tolist(), lengths.tolist()):
+        if length < MIN_RUN:
+            if literal is None:
+                literal = start
+            continue
+        if literal is not None:
+            putVarint(out, (start - literal) << 1)
+            out += data[literal:start]
+            literal = None
+        putVarint(out, length << 1 | 1)
+        out.append(int(arr[start]))
+    if literal is not None:
+        putVarint(out, (len(arr) - literal) << 1)
+        out += data[literal:]
+    return bytes(out)
+
+def rleApply(buffer, payload, xor):
+    """Decode `payload` into `buffer` (a bytearray) in place: XOR it in, or overwrite."""
+    view = np.frombuffer(buffer, dtype=np.uint8)
+    i = 0
+    pos = 0
+    while i < len(payload):
+        header, i = readVarint(payload, i)
+        length = header >> 1
+        if pos + length > len(view):
+            raise ValueError("payload longer than the frame")
+        if header & 1:
+            value = payload[i]
+            i += 1
+            if not xor:
+                view[pos:pos + length] = value
+            elif value:
+                # zero runs are the unchanged parts, nothing to do
+                view[pos:pos + length] ^= value
+        else:
+            chunk = np.frombuffer(payload, dtype=np.uint8, count=length, offset=i)
+            i += length
+            if xor:
+                view[pos:pos + length] ^= chunk
+            else:
+                view[pos:pos + length] = chunk
+        pos += length
+    if pos != len(view):
+        raise ValueError("payload shorter than the frame")
+
+def dirtyRects(xor, rowBytes):
+    """Panel rectangles (x0, y0, x1, y1, exclusive) covering every changed byte."""
+    grid = np.asarray(xor, dtype=np.uint8).reshape(-1, rowBytes)
+    rows = np.flatnonzero(grid.any(axis=1))
+    if not len(rows):
+        return []
+    breaks = np.flatnonzero(np.diff(rows) > MERGE_ROWS)
+    bands = zip(np.concatenate(([rows[0]], rows[breaks + 1])).tolist(), np.append(rows[breaks], rows[-1]).tolist())
+    rects = []
+    for y0, y1 in bands:
+        cols = np.flatnonzero(grid[y0:y1 + 1].any(axis=0))
+        rects.append((int(cols[0]) * 8, y0, (int(cols[-1]) + 1) * 8, y1 + 1))
+    return rects
+
+def encodeFrame(frame, base=None, rowBytes=100, keyframe=False):
+    """Message for `frame`: a delta against `base`, or a keyframe if there is no base, it is
+    forced, or the delta would not be much smaller."""
+    frame = bytes(frame)
+    digest = frameHash(frame)
+    if base is not None and not keyframe:
+        xor = np.frombuffer(frame, dtype=np.uint8) ^ np.frombuffer(base, dtype=np.uint8)
+        payload = rleEncode(xor.tobytes())
+        if len(payload) < len(frame) // 4:
+            rects = dirtyRects(xor, rowBytes)
+            return packMessage(0, rects, frameHash(base), digest, payload)
+    return packMessage(FLAG_KEYFRAME, [], NO_FRAME, digest, rleEncode(frame))
+
+def packMessage(flags, rects, baseDigest, digest, payload):
+    out = bytearray(HEADER.pack(MAGIC, VERSION, flags, len(rects), baseDigest, digest, len(payload)))
+    for rect in rects:
+        out += RECT.pack(*rect)
+    out += payload
+    return bytes(out)
+
+def unpackMessage(message):
+    """(flags, rects, base digest, frame digest, payload) of a message."""
+    if len(message) < HEADER.size:
+        raise ValueError("truncated delta frame message")
+    magic, version, flags, count, baseDigest, digest, length = HEADER.unpack_from(message)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a delta frame message")
+    offset = HEADER.size
+    if len(message) < offset + count * RECT.size:
+        raise ValueError("truncated delta frame message")
+    rects = [RECT.unpack_from(message, offset + i * RECT.size) for i in range(count)]
+    offset += count * RECT.size
+    payload = memoryview(message)[offset:offset + length]
+    if len(payload) != length:
+        raise ValueError("truncated delta frame message")
+    return flags, rects, baseDigest, digest, payload
+
+def isKeyframe(message):
+    return bool(unpackMessage(message)[0] & FLAG_KEYFRAME)
+
+class DeltaReceiver:
+    """Panel side: the current frame, updated in place by each message."""
+
+    def __init__(self, frameSize):
+        self.frame = bytearray(frameSize)
+        self.digest = NO_FRAME
+        self.chain = 0
+
+    @property
+    def base(self):
+        """Hex hash to send as base, None when a keyframe is needed."""
+        return self.digest.hex() if self.digest != NO_FRAME else None
+
+    def apply(self, message):
+        """Apply a message. Returns the dirty rects, or None for a keyframe (whole panel)."""
+        flags, rects, baseDigest, digest, payload = unpackMessage(message)
+        keyframe = bool(flags & FLAG_KEYFRAME)
+        if not keyframe and baseDigest != self.digest:
+            raise ValueError("delta against a frame this client doesn't have")
+        try:
+            rleApply(self.frame, payload, xor=not keyframe)
+            if frameHash(self.frame) != digest:
+                raise ValueError("frame hash mismatch")
+        except (ValueError, IndexError):
+            self.digest = NO_FRAME  # buffer is garbage now, start over with a keyframe
+            raise
+        self.digest = digest
+        self.chain = 0 if keyframe else self.chain + 1
+        return None if keyframe else rects
+
+def displayRects(epd, frame, rects, rowBytes=100):
+    """Partially refresh only the dirty rectangles of `frame` (the panel is in partial mode)."""
+    grid = np.frombuffer(bytes(frame), dtype=np.uint8).reshape(-1, rowBytes)
+    for x0, y0, x1, y1 in rects:
+        region = grid[y0:y1, x0 // 8:x1 // 8].tobytes()
+        epd.display_Partial(region, x0, y0, x1, y1)
@@ -0,0 +1,195 @@
+"""On-disk history of the frames the panel displayed.
+
+Frames are stored in segment files. Each segment starts with a keyframe; every following frame is
+stored as the XOR against the previous one, encoded as (gap, byte) pairs of the changed bytes.
+Records go through one zlib stream per segment that is sync-flushed after every frame, so a
+segment can be read back up to its last complete frame even after a crash. A second-hand update
+costs ~120 bytes. Old segments are deleted once the directory grows past the byte budget.
+
+Replay:
+
+    python3 framehistory.py list
+    python3 framehistory.py png 2026-10-19T10:17:42 frame.png
+"""
+from pathlib import Path
+import datetime
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+
+HISTORY_DIR = './history'
+BUDGET_BYTES = 16 * 1024 * 1024
+SEGMENT_FRAMES = 3600
+
+MAGIC = b'OCFH1\n'
+SUFFIX = '.ocfh'
+
+# record: timestamp, refresh mode, kind, payload length
+RECORD = struct.Struct('<dBBI')
+KEYFRAME = 0
+DELTA = 1
+
+MODES = ["full", "fast", "partial"]
+
+def encodeDelta(previous, frame):
+    """Changed bytes of `frame` against `previous` as varint gap + xor byte pairs."""
+    xor = np.frombuffer(frame, dtype=np.uint8) ^ np.frombuffer(previous, dtype=np.uint8)
+    changed = np.flatnonzero(xor)
+    out = bytearray()
+    last = -1
+    for index, value in zip(changed.tolist(), xor[changed].tolist()):
+        gap = index - last - 1
+        while gap >= 0x80:
+            out.append(gap & 0x7F | 0x80)
+            gap >>= 7
+        out.append(gap)
+        out.append(value)
+        last = index
+    return bytes(out)
+
+def applyDelta(frame, delta):
+    """Apply an encoded delta to `frame` (a bytearray) in place."""
+    i = 0
+    index = -1
+    while i < len(delta):
+        gap = 0
+        shift = 0
+        while True:
+            b = delta[i]
+            i += 1
+            gap |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                break
+        index += gap + 1
+        frame[index] ^= delta[i]
+        i += 1
+    return frame
+
+class FrameHistory:
+    def __init__(self, directory=HISTORY_DIR, budget=BUDGET_BYTES, segmentFrames=SEGMENT_FRAMES):
+        self.directory = Path(directory)
+        self.budget = budget
+        self.segmentFrames = segmentFrames
+        self.file = None
+        self.stream = None
+        self.frames = 0
+        self.previous = None
+        self.bytesWritten = 0
+
+    def openSegment(self, timestamp):
+        self.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{int(timestamp * 1000):015d}{SUFFIX}"
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.stream = zlib.compressobj(9)
+        self.frames = 0
+        self.previous = None
+        self.trim()
+
+    def trim(self):
+        """Delete the oldest segments until the history fits the byte budget."""
+        segments = sorted(self.directory.glob('*' + SUFFIX))
+        sizes = [s.stat().st_size for s in segments]
+        total = sum(sizes)
+        # never delete the segment being written
+        for segment, size in zip(segments[:-1], sizes[:-1]):
+            if total <= self.budget:
+                break
+            segment.unlink()
+            total -= size
+
+    def record(self, frame, mode, timestamp=None):
+        """Append a displayed frame (packed panel buffer) with its refresh mode."""
+        if timestamp is None:
+            timestamp = time.time()
+        if self.file is None or self.frames >= self.segmentFrames:
+            self.openSegment(timestamp)
+
+        frame = bytes(frame)
+        if self.previous is None or len(frame) != len(self.previous):
+            kind, payload = KEYFRAME, frame
+        else:
+            kind, payload = DELTA, encodeDelta(self.previous, frame)
+
+        data = self.stream.compress(RECORD.pack(timestamp, MODES.index(mode), kind, len(payload)) + payload)
+        data += self.stream.flush(zlib.Z_SYNC_FLUSH)
+        self.file.write(data)
+        self.file.flush()
+        self.bytesWritten += len(data)
+        self.previous = frame
+        self.frames += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.write(self.stream.flush())
+            self.file.close()
+            self.file = None
+            self.stream = None
+
+def readSegment(path):
+    """Yield (timestamp, mode, frame) for every complete frame in a segment file."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a frame history segment")
+        data = zlib.decompressobj().decompress(f.read())
+
+    frame = None
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        timestamp, mode, kind, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break
+        payload = data[offset:offset + length]
+        offset += length
+        if kind == KEYFRAME:
+            frame = bytearray(payload)
+        else:
+            frame = applyDelta(frame, payload)
+        yield timestamp, MODES[mode], bytes(frame)
+
+def segments(directory=HISTORY_DIR):
+    return sorted(Path(directory).glob('*' + SUFFIX))
+
+def frameAt(when, directory=HISTORY_DIR):
+    """The frame that was on the panel at `when` (a unix timestamp), or None."""
+    found = None
+    for segment in segments(directory):
+        start = int(segment.stem) / 1000
+        if start > when:
+            break
+        for timestamp, mode, frame in readSegment(segment):
+            if timestamp > when:
+                break
+            found = (timestamp, mode, frame)
+    return found
+
+def fmt(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+
+if __name__ == "__main__":
+    from rasterizer import unpackFrame
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "list":
+        directory = sys.argv[2] if len(sys.argv) > 2 else HISTORY_DIR
+        for segment in segments(directory):
+            entries = [(t, m) for t, m, _ in readSegment(segment)]
+            if entries:
+                print(f"{segment.name}: {len(entries)} frames, {fmt(entries[0][0])} - {fmt(entries[-1][0])}, {os.path.getsize(segment)} bytes")
+    elif len(sys.argv) >= 4 and sys.argv[1] == "png":
+        directory = sys.argv[4] if len(sys.argv) > 4 else HISTORY_DIR
+        when = datetime.datetime.fromisoformat(sys.argv[2]).timestamp()
+        found = frameAt(when, directory)
+        if found is None:
+            print(f"No frame recorded before {sys.argv[2]}")
+            sys.exit(1)
+        timestamp, mode, frame = found
+        unpackFrame(frame).save(sys.argv[3])
+        print(f"Wrote frame from {fmt(timestamp)} ({mode} refresh) to {sys.argv[3]}")
+    else:
+        print("usage: framehistory.py list [dir] | png <time> <out.png> [dir]")
@@ -0,0 +1,84 @@
+"""Quiet hours for the display driver.
+
+Reads the quiet hours settings the API stores in its config file (ConfigModel.quiet_hours,
+quiet_start, quiet_end, quiet_refresh). Inside the quiet window the driver redraws once a minute
+(without the second hand) or once an hour and leaves the panel in deep sleep in between.
+"""
+from pathlib import Path
+import datetime
+import json
+import os
+
+# Same file the API writes (config_api.CONFIG_FILE)
+CONFIG_FILE = Path.home() / ".config" / "openclock" / "config.json"
+
+def parseTime(value):
+    return datetime.datetime.strptime(value, "%H:%M").time()
+
+class QuietHours:
+    def __init__(self, configFile=CONFIG_FILE):
+        self.configFile = configFile
+        self.mtime = None
+        self.enabled = False
+        self.start = datetime.time(22, 0)
+        self.end = datetime.time(6, 0)
+        self.refresh = "minute"
+        # refreshes a full-cadence driver (one per second) would have done while quiet
+        self.avoided = 0
+        self.performed = 0
+
+    def reload(self):
+        """Re-read the config file if it changed. Keeps the last good settings on errors."""
+        try:
+            mtime = os.stat(self.configFile).st_mtime
+        except OSError:
+            return
+        if mtime == self.mtime:
+            return
+        self.mtime = mtime
+        try:
+            with open(self.configFile, "r") as f:
+                data = json.load(f)
+            # parse everything first, so a bad value leaves all settings as they were
+            start = parseTime(data.get("quiet_start", "22:00"))
+            end = parseTime(data.get("quiet_end", "06:00"))
+            self.enabled = bool(data.get("quiet_hours", False))
+            self.start = start
+            self.end = end
+            self.refresh = data.get("quiet_refresh", "minute")
+        except (OSError, ValueError) as e:
+            print(f"Failed to read quiet hours from {self.configFile}: {e}")
+
+    def isQuiet(self, now):
+        if not self.enabled or self.start == self.end:
+            return False
+        t = now.time()
+        if self.start < self.end:
+            return self.start <= t < self.end
+        # window wraps around midnight
+        return t >= self.start or t < self.end
+
+    def quietEnd(self, now):
+        end = datetime.datetime.combine(now.date(), self.end)
+        if end <= now:
+            end += datetime.timedelta(days=1)
+        return end
+
+    def nextWake(self, now):
+        """When to redraw next while quiet: the next minute or hour, or the end of the window."""
+        wake = now.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        if self.refresh == "hour":
+            wake = now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+        return min(wake, self.quietEnd(now))
+
+    def record(self, start, wake, refreshed):
+        """Account for a quiet sleep from `start` to `wake`: the refresh before it if one was
+        `refreshed`, every other second of it avoided."""
+        seconds = max(0, int((wake - start).total_seconds()))
+        if refreshed:
+            self.performed += 1
+            seconds = max(0, seconds - 1)
+        self.avoided += seconds
+
+    def stats(self):
+        return {"performed": self.performed, "avoided": self.avoided}
@@ -0,0 +1,231 @@
+from PIL import Image,ImageChops,ImageDraw
+import numpy as np
+from displaylist import Text, Rect, RoundedRect, Line, Circle, Sprite, unionBox
+from fonts import loadFonts
+from screen import EPD_WIDTH, EPD_HEIGHT
+
+def toPanel(box, wallmount=False):
+    """Map a layout-space box to panel coordinates (landscape, as sent by getbuffer)."""
+    x0, y0, x1, y1 = box
+    if not wallmount:
+        x0, y0, x1, y1 = EPD_HEIGHT - x1, EPD_WIDTH - y1, EPD_HEIGHT - x0, EPD_WIDTH - y0
+    # getbuffer rotates the portrait image by 90 degrees counter clockwise
+    return (y0, EPD_HEIGHT - x1, y1, EPD_HEIGHT - x0)
+
+def fromPanel(box, wallmount=False):
+    """Inverse of toPanel."""
+    x0, y0, x1, y1 = box
+    x0, y0, x1, y1 = EPD_HEIGHT - y1, x0, EPD_HEIGHT - y0, x1
+    if not wallmount:
+        x0, y0, x1, y1 = EPD_HEIGHT - x1, EPD_WIDTH - y1, EPD_HEIGHT - x0, EPD_WIDTH - y0
+    return (x0, y0, x1, y1)
+
+def packFrame(image):
+    """Pack a rendered layout image into the panel buffer, like EPD.getbuffer but without hardware."""
+    img = image.rotate(90, expand=True).convert('1')
+    # PIL uses 0=black, the panel uses 1=black
+    return ImageChops.invert(img).tobytes('raw')
+
+def unpackFrame(frame):
+    """Turn a packed panel buffer back into the image PILRasterizer.render would return."""
+    panel = Image.frombytes('1', (EPD_WIDTH, EPD_HEIGHT), bytes(frame))
+    return ImageChops.invert(panel).transpose(Image.ROTATE_270)
+
+class PILRasterizer:
+    """Draws a display list with PIL ImageDraw onto a mode '1' image."""
+
+    def __init__(self, fonts):
+        self.fonts = loadFonts(fonts)
+        self.sprites = {}
+        self.boxes = {}
+        self._measure = ImageDraw.Draw(Image.new('1', (1, 1)))
+
+    def sprite(self, path):
+        if path not in self.sprites:
+            self.sprites[path] = Image.open(path).convert('1')
+        return self.sprites[path]
+
+    def draw(self, draw, image, p):
+        if type(p) is Text:
+            draw.text(p.xy, p.text, font=self.fonts[p.font], fill=p.fill, anchor=p.anchor, align=p.align)
+        elif type(p) is Rect:
+            draw.rectangle(p.box, fill=p.fill, outline=p.outline, width=p.width)
+        elif type(p) is RoundedRect:
+            draw.rounded_rectangle(p.box, p.radius, fill=p.fill, outline=p.outline, width=p.width)
+        elif type(p) is Line:
+            draw.line(p.xy, fill=p.fill, width=p.width)
+        elif type(p) is Circle:
+            draw.circle(p.center, p.radius, fill=p.fill, outline=p.outline, width=p.width)
+        elif type(p) is Sprite:
+            image.paste(self.sprite(p.path), tuple(int(v) for v in p.xy))
+        else:
+            raise TypeError(f"Unknown display list primitive: {p!r}")
+
+    def renderPacked(self, displayList, wallmount=False):
+        """Render straight to the packed panel buffer (1 bit per pixel, 1=black)."""
+        return bytearray(packFrame(self.render(displayList, wallmount)))
+
+    def render(self, displayList, wallmount=False):
+        image = Image.new('1', (EPD_HEIGHT, EPD_WIDTH), 255)  # 255: clear the frame    L -> Greyscale  1 -> B/W
+        draw = ImageDraw.Draw(image)
+        for p in displayList:
+            self.draw(draw, image, p)
+
+        if not wallmount:
+            image = image.transpose(Image.ROTATE_180)
+
+        return image
+
+    def bounds(self, p):
+        """Layout-space box (x0, y0, x1, y1, exclusive) a primitive can touch."""
+        box = self.boxes.get(p)
+        if box is None:
+            if len(self.boxes) >= 4096:
+                self.boxes.clear()
+            box = self.boxes[p] = self.measure(p)
+        return box
+
+    def measure(self, p):
+        if type(p) is Text:
+            x0, y0, x1, y1 = self._measure.textbbox(p.xy, p.text, font=self.fonts[p.font], anchor=p.anchor, align=p.align)
+        elif type(p) in (Rect, RoundedRect):
+            (x0, y0), (x1, y1) = p.box
+            x1 += 1
+            y1 += 1
+        elif type(p) is Line:
+            xy = p.xy
+            if not isinstance(xy[0], (int, float)):
+                xy = [v for point in xy for v in point]
+            xs, ys = xy[0::2], xy[1::2]
+            pad = p.width // 2 + 1
+            x0, y0, x1, y1 = min(xs) - pad, min(ys) - pad, max(xs) + pad + 1, max(ys) + pad + 1
+        elif type(p) is Circle:
+            (cx, cy), r = p.center, p.radius
+            x0, y0, x1, y1 = cx - r, cy - r, cx + r + 1, cy + r + 1
+        elif type(p) is Sprite:
+            w, h = self.sprite(p.path).size
+            x0, y0 = p.xy
+            x1, y1 = x0 + w, y0 + h
+        else:
+            raise TypeError(f"Unknown display list primitive: {p!r}")
+        return (max(0, int(x0)), max(0, int(y0)), min(EPD_HEIGHT, int(x1) + 1), min(EPD_WIDTH, int(y1) + 1))
+
+
+def isInt(*values):
+    return all(type(v) is int for v in values)
+
+class NumpyRasterizer(PILRasterizer):
+    """Draws axis-aligned geometry straight into a packed NumPy bit array in panel layout.
+
+    Rectangles, fills and horizontal/vertical lines are set as byte spans. Only text, curves
+    (circles, rounded rectangles) and diagonal lines go through PIL: they are drawn onto a scratch
+    image and only the area they cover is packed and OR'ed in at the end. All ink on the panel is black, which makes OR compositing exact; white geometry
+    only clears natively drawn bits and white PIL primitives are not supported.
+    """
+
+    ROW_BYTES = EPD_WIDTH // 8
+
+    def __init__(self, fonts):
+        super().__init__(fonts)
+        self.scratch = Image.new('1', (EPD_HEIGHT, EPD_WIDTH), 255)
+        self.scratchDraw = ImageDraw.Draw(self.scratch)
+        self.fallbacks = 0
+        self.pending = []
+
+    def fillPanel(self, buf, box, black=True):
+        """Set (or clear) the pixels of a panel-space box (x0, y0, x1, y1, exclusive)."""
+        x0, y0, x1, y1 = box
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(EPD_WIDTH, x1), min(EPD_HEIGHT, y1)
+        if x0 >= x1 or y0 >= y1:
+            return
+        b0, b1 = x0 >> 3, (x1 - 1) >> 3
+        left = 0xFF >> (x0 & 7)
+        right = (0xFF << (7 - ((x1 - 1) & 7))) & 0xFF
+        rows = buf[y0:y1]
+        spans = [(b0, left & right)] if b0 == b1 else [(b0, left), (b1, right)]
+        if black:
+            for b, mask in spans:
+                rows[:, b] |= mask
+            if b1 - b0 > 1:
+                rows[:, b0 + 1:b1] = 0xFF
+        else:
+            for b, mask in spans:
+                rows[:, b] &= ~mask & 0xFF
+            if b1 - b0 > 1:
+                rows[:, b0 + 1:b1] = 0x00
+
+    def fill(self, buf, box, wallmount, ink):
+        """Fill a layout-space box (x0, y0, x1, y1, exclusive)."""
+        self.fillPanel(buf, toPanel(box, wallmount), ink != 255)
+
+    def outline(self, buf, x0, y0, x1, y1, width, wallmount, ink):
+        """Draw a rectangle outline `width` px wide inside the inclusive box like ImageDraw.rectangle."""
+        self.fill(buf, (x0, y0, x1 + 1, y0 + width), wallmount, ink)
+        self.fill(buf, (x0, y1 - width + 1, x1 + 1, y1 + 1), wallmount, ink)
+        self.fill(buf, (x0, y0, x0 + width, y1 + 1), wallmount, ink)
+        self.fill(buf, (x1 - width + 1, y0, x1 + 1, y1 + 1), wallmount, ink)
+
+    def drawNative(self, buf, p, wallmount):
+        """Draw `p` straight into the packed buffer. Returns False if it needs PIL."""
+        if type(p) is Rect:
+            (x0, y0), (x1, y1) = p.box
+            if not isInt(x0, y0, x1, y1):
+                return False
+            if p.fill is not None:
+                self.fill(buf, (x0, y0, x1 + 1, y1 + 1), wallmount, p.fill)
+            if p.outline is not None and p.width > 0:
+                self.outline(buf, x0, y0, x1, y1, p.width, wallmount, p.outline)
+            return True
+
+        if type(p) is Line:
+            xy = p.xy
+            if not isinstance(xy[0], (int, float)):
+                xy = [v for point in xy for v in point]
+            if len(xy) != 4 or p.width != 1 or not isInt(*xy):
+                return False
+            x0, y0, x1, y1 = xy
+            if x0 != x1 and y0 != y1:
+                return False
+            x0, x1 = min(x0, x1), max(x0, x1)
+            y0, y1 = min(y0, y1), max(y0, y1)
+            self.fill(buf, (x0, y0, x1 + 1, y1 + 1), wallmount, p.fill)
+            return True
+
+        return False
+
+    def drawFallback(self, p):
+        """Draw `p` with PIL onto the scratch image, it is packed in `flush`."""
+        self.fallbacks += 1
+        self.draw(self.scratchDraw, self.scratch, p)
+        self.pending.append(self.bounds(p))
+
+    def flush(self, buf, wallmount):
+        """Pack the part of the scratch image covered by PIL primitives and OR it into the buffer."""
+        if not self.pending:
+            return
+        px0, py0, px1, py1 = toPanel(unionBox(self.pending), wallmount)
+        self.pending = []
+        # widen to whole bytes in panel layout so the crop packs straight into the buffer
+        px0 = max(0, px0) & ~7
+        px1 = min(EPD_WIDTH, (px1 + 7) & ~7)
+        py0, py1 = max(0, py0), min(EPD_HEIGHT, py1)
+        if px0 >= px1 or py0 >= py1:
+            return
+        box = fromPanel((px0, py0, px1, py1), wallmount)
+        crop = self.scratch.crop(box).transpose(Image.ROTATE_90 if wallmount else Image.ROTATE_270)
+        packed = np.frombuffer(ImageChops.invert(crop).tobytes('raw'), dtype=np.uint8)
+        buf[py0:py1, px0 >> 3:px1 >> 3] |= packed.reshape(py1 - py0, (px1 - px0) >> 3)
+        self.scratch.paste(255, box)
+
+    def renderPacked(self, displayList, wallmount=False):
+        buf = np.zeros((EPD_HEIGHT, self.ROW_BYTES), dtype=np.uint8)
+        for p in displayList:
+            if not self.drawNative(buf, p, wallmount):
+                self.drawFallback(p)
+        self.flush(buf, wallmount)
+        return bytearray(buf.tobytes())
+
+    def render(self, displayList, wallmount=False):
+        """Unpack the panel buffer back into a layout image, for previews."""
+        return unpackFrame(self.renderPacked(displayList, wallmount))
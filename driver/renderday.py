@@ -0,0 +1,109 @@
+"""Render a simulated day of frames as fast as possible, without a panel.
+
+Used for layout regression checks and for finding worst-case render times:
+
+    python3 renderday.py --date 2026-10-19 --step 60 --out ./renderday
+"""
+from multiprocessing import Pool
+import argparse
+import datetime
+import json
+import os
+import struct
+import time
+import zlib
+from rasterizer import PILRasterizer, NumpyRasterizer
+from screen import buildScreen, FONTS
+from timesource import FixedClock
+
+WALLMOUNT = False
+
+# frame file record: second of day, compressed length, zlib(packed frame)
+RECORD_HEADER = struct.Struct('<II')
+
+rasterizer = None
+clock = None
+
+BACKENDS = {"pil": PILRasterizer, "numpy": NumpyRasterizer}
+
+def initWorker(day, backend):
+    global rasterizer, clock
+    rasterizer = BACKENDS[backend](FONTS)
+    clock = FixedClock(day)
+
+def renderFrame(args):
+    day, second = args
+    clock.set(day + datetime.timedelta(seconds=second))
+    start = time.perf_counter()
+    frame = rasterizer.renderPacked(buildScreen(clock), WALLMOUNT)
+    return second, time.perf_counter() - start, frame
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def renderDay(day, step, workers, outDir, writeFrames=True, backend="numpy"):
+    os.makedirs(outDir, exist_ok=True)
+    seconds = [(day, s) for s in range(0, 86400, step)]
+    timings = []
+
+    start = time.perf_counter()
+    frames = open(os.path.join(outDir, "frames.bin"), "wb") if writeFrames else None
+    try:
+        with Pool(workers, initializer=initWorker, initargs=(day, backend)) as pool:
+            for second, duration, frame in pool.imap(renderFrame, seconds, chunksize=64):
+                timings.append((duration, second))
+                if frames:
+                    data = zlib.compress(frame)
+                    frames.write(RECORD_HEADER.pack(second, len(data)))
+                    frames.write(data)
+    finally:
+        if frames:
+            frames.close()
+    wall = time.perf_counter() - start
+
+    durations = sorted(d for d, _ in timings)
+    worst = sorted(timings, reverse=True)[:10]
+    stats = {
+        "date": day.date().isoformat(),
+        "step": step,
+        "workers": workers,
+        "backend": backend,
+        "frames": len(timings),
+        "wall_seconds": round(wall, 3),
+        "frames_per_second": round(len(timings) / wall, 1) if wall else None,
+        "render_ms": {
+            "mean": round(sum(durations) / len(durations) * 1000, 3),
+            "p50": round(percentile(durations, 0.50) * 1000, 3),
+            "p95": round(percentile(durations, 0.95) * 1000, 3),
+            "p99": round(percentile(durations, 0.99) * 1000, 3),
+            "max": round(durations[-1] * 1000, 3),
+        },
+        "worst": [
+            {"time": (day + datetime.timedelta(seconds=s)).strftime("%H:%M:%S"), "render_ms": round(d * 1000, 3)}
+            for d, s in worst
+        ],
+    }
+    with open(os.path.join(outDir, "stats.json"), "w") as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
+def readFrames(path):
+    """Yield (second of day, packed frame) from a frames.bin written by renderDay."""
+    with open(path, "rb") as f:
+        while header := f.read(RECORD_HEADER.size):
+            second, length = RECORD_HEADER.unpack(header)
+            yield second, zlib.decompress(f.read(length))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a simulated day of OpenClock frames")
+    parser.add_argument("--date", default=datetime.date.today().isoformat(), help="day to render (YYYY-MM-DD)")
+    parser.add_argument("--step", type=int, default=60, help="seconds between frames (1 renders all 86400)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="render processes")
+    parser.add_argument("--out", default="./renderday", help="output directory")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="numpy", help="rasterizer")
+    parser.add_argument("--no-frames", action="store_true", help="only collect timing stats")
+    args = parser.parse_args()
+
+    day = datetime.datetime.fromisoformat(args.date)
+    stats = renderDay(day, args.step, args.workers, args.out, not args.no_frames, args.backend)
+    print(json.dumps(stats, indent=2))
@@ -0,0 +1,164 @@
+import math
+import os
+from displaylist import Text, Rect, RoundedRect, Line, Circle
+from textfit import TextFitter
+from timesource import SYSTEM_CLOCK
+
+# Display resolution
+EPD_WIDTH       = 800
+EPD_HEIGHT      = 480
+
+#GRAY1  = 0xff #white
+#GRAY2  = 0xC0
+#GRAY3  = 0x80 #gray
+GRAY1 = GRAY2 = GRAY3 = GRAY4  = 0x00 #Blackest
+
+CENTER_X = EPD_HEIGHT - 128 - 24
+
+# fonts live next to this file, so the layout also works when imported from elsewhere (the API)
+DRIVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# font key -> (file, size)
+FONTS = {
+    "clock": (os.path.join(DRIVER_DIR, 'GeistMono-Regular.ttf'), 32),
+    "info": (os.path.join(DRIVER_DIR, 'GeistMono-Regular.ttf'), 12),
+    "timeTableHeader": (os.path.join(DRIVER_DIR, 'Geist-Regular.ttf'), 20),
+    "timeTableLesson": (os.path.join(DRIVER_DIR, 'GeistMono-Regular.ttf'), 20),
+    "timeTableNextEvent": (os.path.join(DRIVER_DIR, 'Geist-Regular.ttf'), 14),
+}
+
+# cell geometry text has to fit into (px)
+NOTIFICATION_TEXT_WIDTH = 175 - 4 - 4
+NOTIFICATION_CHANNEL_WIDTH = 120
+NOTIFICATION_BODY_LINES = 2
+LESSON_SUBJECT_WIDTH = 90 - 41
+LESSON_ROOM_WIDTH = 41 - 4 - 2
+
+textFitter = TextFitter(FONTS)
+
+def buildLessonColumn(x, current=None, cancelled=None, slots=None):
+    """Ten lesson slots at `x`. With `slots` (a view model column, see the API's viewmodel.py)
+    they show its lessons, otherwise the placeholder lesson."""
+    items = []
+    for i in range(1,11):
+        start = 314 + (i - 1) * 48
+        end = start + 46
+        slot = slots[i - 1] if slots else None
+        if slot is not None:
+            isCurrent, isCancelled = slot["current"], slot["cancelled"]
+        else:
+            isCurrent, isCancelled = i == current, i == cancelled
+        if isCurrent:
+            items.append(RoundedRect(((x, start), (x + 90, end)), 8, fill=GRAY3, outline=GRAY4, width=1))
+        else:
+            items.append(RoundedRect(((x, start), (x + 90, end)), 8, fill=None, outline=GRAY4, width=1))
+
+        if isCancelled:
+            items.append(Line(((x + 3, start + 3), (x + 90 - 3, end - 3)), fill=GRAY4, width=3))
+            items.append(Line(((x + 3, end - 3), (x + 90 - 3, start + 3)), fill=GRAY4, width=3))
+
+        if slot is None:
+            subject, startTime, endTime = textFitter.fit("timeTableLesson", "MEDT\nSIDE", LESSON_SUBJECT_WIDTH, 2), "01:00", "02:00"
+            room = textFitter.fit("info", "9-01", LESSON_ROOM_WIDTH)
+        elif slot["empty"]:
+            continue
+        else:
+            # already fitted by the view model
+            subject, startTime, endTime, room = slot["subject"], slot["start"], slot["end"], slot["room"]
+        items.append(Text((x + 41, start - 3), subject, "timeTableLesson", fill=GRAY4, align="right"))
+        items.append(Text((x + 4, start + 2), startTime, "info", fill=GRAY4, anchor="lt", align="left"))
+        items.append(Text((x + 4, end - 1), endTime, "info", fill=GRAY4, anchor="lb", align="left"))
+        items.append(Text((x + 4, start + (end - start) / 2), room, "info", fill=GRAY4, anchor="lm", align="left"))
+    return items
+
+def buildScreen(clock=SYSTEM_CLOCK, showSeconds=True, view=None):
+    """Build the display list for the screen at `clock.now()`. Pure layout, no drawing.
+
+    `view` is a display view model (the API's viewmodel.py): lessons and cards come from it
+    as they are, without placeholder data."""
+    now = clock.now()
+    items = []
+
+    # info
+    items.append(Text((0,2), "OpenClock Mini", "info", fill=GRAY4, anchor="lt", align="left"))
+    items.append(Text((EPD_HEIGHT,2), "192.168.1.100", "info", fill=GRAY4, anchor="rt", align="right"))
+
+    # notifications
+    for i in range(1, 13):
+        start = 20 + (i - 1) * 63
+        end = start + 60
+        items.append(RoundedRect(((2, start), (2 + 175, end)), 8, fill=None, outline=GRAY4, width=1))
+
+        card = view["cards"][i - 1] if view else None
+        if card is None:
+            channel, time, sender = textFitter.fit("info", "#klasse", NOTIFICATION_CHANNEL_WIDTH), "13:10", textFitter.fit("info", "Minichberger Jakob", NOTIFICATION_TEXT_WIDTH)
+            body = textFitter.fit("info", "Kann mir wer SYT\nerklärn?", NOTIFICATION_TEXT_WIDTH, NOTIFICATION_BODY_LINES)
+        elif card["empty"]:
+            continue
+        else:
+            channel, time, sender, body = card["channel"], card["time"], card["sender"], card["body"]
+        items.append(Text((2 + 4, start + 2), channel, "info", fill=GRAY4, anchor="lt", align="left"))
+        items.append(Text((175 - 2, start + 2), time, "info", fill=GRAY4, anchor="rt", align="right"))
+        items.append(Line(((2 + 1, start + 12), (175 - 100, start + 12)), fill=GRAY2, width=1))
+        items.append(Text((2 + 4, start + 2 + 12), sender, "info", fill=GRAY4, anchor="lt", align="left"))
+        items.append(Line(((2 + 1, start + 12 + 2 + 12), (175 + 1, start + 12 + 2 + 12)), fill=GRAY2, width=1))
+        items.append(Text((2 + 4, start + 12 + 2 + 12), body, "info", fill=GRAY4, align="left"))
+
+    # timetable
+    items.append(Rect(((180, 275), (EPD_HEIGHT, EPD_WIDTH)), fill=None, outline=GRAY4, width=1))
+    items.append(Line(((180, 309), (EPD_HEIGHT, 309)), fill=GRAY4, width=1))
+    items.append(Line(((280, 275), (280, EPD_WIDTH)), fill=GRAY4, width=1)) # vertical lines
+    items.append(Line(((380, 275), (380, EPD_WIDTH)), fill=GRAY4, width=1))
+
+    items.append(Text((200, 285), "Heute", "timeTableHeader", fill=GRAY4, anchor="lt", align="left"))
+    items.append(Text((295, 285), "Morgen", "timeTableHeader", fill=GRAY4, anchor="lt", align="left"))
+    items.append(Text((388, 272), "Nächster Tag\nmit Ereignis", "timeTableNextEvent", fill=GRAY4, align="left"))
+
+    # lessons
+    if view:
+        for x, column in zip((185, 285, 385), view["columns"]):
+            items += buildLessonColumn(x, slots=column["slots"])
+    else:
+        items += buildLessonColumn(185)
+        items += buildLessonColumn(285)
+        items += buildLessonColumn(385, current=3, cancelled=4)
+
+    # Clock stuff
+    items.append(Circle((CENTER_X, 128 + 14), 128, fill=None, outline=GRAY4, width=1)) # Clock face
+    items.append(Circle((CENTER_X, 128 + 14), 3, fill=GRAY4)) # Clock face center nub
+    items.append(Rect(((CENTER_X - 4, 14), (CENTER_X + 8 - 4, 14 + 8)), fill=GRAY4, width=9)) #12 o'clock marker
+    items.append(Rect(((CENTER_X - 4, 14 + (128 *2) - 8), (CENTER_X + 8 - 4, 14 + (128*2) + 8 - 8)), fill=GRAY4, width=9)) #6 o'clock marker
+    items.append(Rect(((EPD_HEIGHT - 24 - 8, 14 + 128 - 4), (EPD_HEIGHT - 24 + 8 - 8, 14 + 8 + 128 - 4)), fill=GRAY4, width=9)) #3 o'clock marker
+    items.append(Rect(((EPD_HEIGHT - 24 - (128 *2), 14 + 128 - 4), (EPD_HEIGHT - 24 + 8 - (128 *2), 14 + 8 + 128 - 4)), fill=GRAY4, width=9)) #9 o'clock marker
+    items.append(Text((CENTER_X, 128 + 32), now.strftime("%H:%M"), "clock", fill=GRAY4, anchor="mm", align="center"))
+
+    hour = now.hour % 12
+    if hour == 12:
+        hour = 0
+
+    minutes_decimal = now.minute / 60.0
+    currentHour = hour + minutes_decimal
+    currentMinute = now.minute + (now.second / 60.0)
+    currentSecond = now.second
+
+    a = (currentHour * 30) - 90
+    a_rad = math.radians(-a)
+    hxdiff = 90 * math.cos(a_rad)
+    hydiff = 90 * math.sin(a_rad)
+
+    a = (currentMinute * 6) - 90
+    a_rad = math.radians(-a)
+    mxdiff = 125 * math.cos(a_rad)
+    mydiff = 125 * math.sin(a_rad)
+
+    a = (currentSecond * 6) - 90
+    a_rad = math.radians(-a)
+    sxdiff = 135 * math.cos(a_rad)
+    sydiff = 135 * math.sin(a_rad)
+
+    items.append(Line((CENTER_X, 128 + 14, CENTER_X + hxdiff, 128 + 14 - hydiff), fill=GRAY4, width=2)) # Hour hand
+    items.append(Line((CENTER_X, 128 + 14, CENTER_X + mxdiff, 128 + 14 - mydiff), fill=GRAY4, width=2)) # Minute hand
+    if showSeconds:
+        items.append(Line((CENTER_X, 128 + 14, CENTER_X + sxdiff, 128 + 14 - sydiff), fill=GRAY4, width=2)) # Second hand
+
+    return items
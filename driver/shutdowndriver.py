@@ -1,9 +1,12 @@
 from waveshare_epd import epd7in5_V2
+import warmstart
 from PIL import Image
 import os
 
 WALLMOUNT = False
 
+warmstart.invalidate()
+
 if os.path.exists("/displaydriver/skipshutdown"):
     epd = epd7in5_V2.EPD()
     epd.init_fast()
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+DRIVER_DIR = Path(__file__).resolve().parents[1]
+
+# the driver modules import each other by name, like driver.py run from its directory
+sys.path.insert(0, str(DRIVER_DIR))
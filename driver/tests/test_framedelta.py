@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+import framedelta
+from framedelta import DeltaReceiver, encodeFrame, isKeyframe, rleApply, rleEncode
+
+ROW_BYTES = 100
+FRAME_SIZE = ROW_BYTES * 480
+
+
+def random_frame(seed):
+    return np.random.default_rng(seed).integers(0, 256, FRAME_SIZE, np.uint8).tobytes()
+
+
+def draw(frame, x0, y0, x1, y1, value=0xFF):
+    """`frame` with the byte columns x0..x1 of rows y0..y1 (exclusive) set to `value`."""
+    grid = np.frombuffer(frame, dtype=np.uint8).reshape(-1, ROW_BYTES).copy()
+    grid[y0:y1, x0:x1] = value
+    return grid.tobytes()
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"", b"\x00", b"ab", b"\x00" * 1000, b"abc" * 50 + b"\x07" * 200 + b"xy"],
+)
+def test_rle_round_trip(data):
+    buffer = bytearray(len(data))
+    rleApply(buffer, rleEncode(data), xor=False)
+    assert bytes(buffer) == data
+
+
+def test_keyframe_round_trip():
+    frame = random_frame(1)
+    message = encodeFrame(frame)
+    assert isKeyframe(message)
+
+    receiver = DeltaReceiver(FRAME_SIZE)
+    assert receiver.apply(message) is None
+    assert bytes(receiver.frame) == frame
+    assert receiver.base == framedelta.frameHash(frame).hex()
+
+
+def test_delta_chain_round_trip():
+    frames = [bytes(FRAME_SIZE)]
+    frames.append(draw(frames[-1], 10, 20, 12, 30))
+    frames.append(draw(frames[-1], 50, 400, 60, 410))
+    frames.append(draw(frames[-1], 10, 20, 12, 30, value=0))
+
+    receiver = DeltaReceiver(FRAME_SIZE)
+    receiver.apply(encodeFrame(frames[0]))
+    for base, frame in zip(frames, frames[1:]):
+        message = encodeFrame(frame, base)
+        assert not isKeyframe(message)
+        assert len(message) < 200
+        receiver.apply(message)
+        assert bytes(receiver.frame) == frame
+    assert receiver.chain == 3
+
+
+def test_dirty_rects_cover_changes():
+    base = bytes(FRAME_SIZE)
+    frame = draw(draw(base, 10, 20, 12, 30), 50, 400, 60, 410)
+
+    receiver = DeltaReceiver(FRAME_SIZE)
+    receiver.apply(encodeFrame(base))
+    assert receiver.apply(encodeFrame(frame, base)) == [
+        (80, 20, 96, 30),
+        (400, 400, 480, 410),
+    ]
+
+
+def test_large_change_sends_keyframe():
+    assert isKeyframe(encodeFrame(random_frame(2), random_frame(3)))
+
+
+def test_delta_against_unknown_base_is_refused():
+    base = bytes(FRAME_SIZE)
+    receiver = DeltaReceiver(FRAME_SIZE)
+    with pytest.raises(ValueError):
+        receiver.apply(encodeFrame(draw(base, 0, 0, 1, 1), base))
+    assert receiver.base is None
+
+
+def test_corrupt_payload_resets_receiver():
+    base = bytes(FRAME_SIZE)
+    receiver = DeltaReceiver(FRAME_SIZE)
+    receiver.apply(encodeFrame(base))
+    message = bytearray(encodeFrame(draw(base, 5, 5, 6, 6), base))
+    message[-1] ^= 0xFF
+
+    with pytest.raises(ValueError):
+        receiver.apply(bytes(message))
+    assert receiver.base is None
+
+
+@pytest.mark.parametrize("length", [0, 10, framedelta.HEADER.size + 3])
+def test_truncated_message_is_a_value_error(length):
+    base = bytes(FRAME_SIZE)
+    receiver = DeltaReceiver(FRAME_SIZE)
+    receiver.apply(encodeFrame(base))
+    message = encodeFrame(draw(base, 5, 5, 6, 6), base)
+
+    with pytest.raises(ValueError):
+        receiver.apply(message[:length])
+    assert bytes(receiver.frame) == base
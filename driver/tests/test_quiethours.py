@@ -0,0 +1,43 @@
+import datetime
+import json
+import os
+from quiethours import QuietHours
+
+
+def write_config(path, mtime, **settings):
+    path.write_text(json.dumps(settings))
+    os.utime(path, (mtime, mtime))
+
+
+def test_reload_reads_settings(tmp_path):
+    config = tmp_path / "config.json"
+    write_config(config, 1, quiet_hours=True, quiet_start="21:30", quiet_end="07:00")
+    quiet = QuietHours(config)
+    quiet.reload()
+
+    assert quiet.enabled
+    assert (quiet.start, quiet.end) == (datetime.time(21, 30), datetime.time(7, 0))
+    assert quiet.isQuiet(datetime.datetime(2026, 10, 19, 23, 0))
+    assert not quiet.isQuiet(datetime.datetime(2026, 10, 19, 12, 0))
+
+
+def test_bad_time_keeps_every_setting(tmp_path):
+    config = tmp_path / "config.json"
+    write_config(config, 1, quiet_hours=False, quiet_start="22:00", quiet_end="06:00")
+    quiet = QuietHours(config)
+    quiet.reload()
+
+    write_config(config, 2, quiet_hours=True, quiet_start="22:00", quiet_end="25:00")
+    quiet.reload()
+
+    assert not quiet.enabled
+    assert (quiet.start, quiet.end) == (datetime.time(22, 0), datetime.time(6, 0))
+
+
+def test_record_counts_only_refreshes_done():
+    quiet = QuietHours()
+    start = datetime.datetime(2026, 10, 19, 23, 0)
+    quiet.record(start, start + datetime.timedelta(minutes=1), refreshed=True)
+    quiet.record(start, start + datetime.timedelta(minutes=1), refreshed=False)
+
+    assert quiet.stats() == {"performed": 1, "avoided": 59 + 60}
@@ -0,0 +1,92 @@
+from fonts import loadFonts
+
+ELLIPSIS = "…"
+
+class TextFitter:
+    """Fits text into fixed-width cells: cached measuring, ellipsis truncation and line wrapping.
+
+    Widths are cached per (font, string) and finished results per (font, text, width, lines), so
+    redrawing the same messages every refresh costs a dict lookup per cell.
+    """
+
+    def __init__(self, fonts, maxEntries=8192):
+        self.fonts = loadFonts(fonts)
+        self.maxEntries = maxEntries
+        self.widths = {}
+        self.fits = {}
+        self.hits = 0
+        self.misses = 0
+
+    def width(self, font, text):
+        key = (font, text)
+        width = self.widths.get(key)
+        if width is None:
+            if len(self.widths) >= self.maxEntries:
+                self.widths.clear()
+            width = self.fonts[font].getlength(text)
+            self.widths[key] = width
+        return width
+
+    def longestPrefix(self, font, text, maxWidth, suffix=""):
+        """Length of the longest prefix of `text` that fits in `maxWidth` with `suffix` appended."""
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.width(font, text[:mid] + suffix) <= maxWidth:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def truncate(self, font, text, maxWidth, force=False):
+        """Cut `text` to fit, marking the cut with an ellipsis. `force` always appends one."""
+        if not force and self.width(font, text) <= maxWidth:
+            return text
+        n = self.longestPrefix(font, text, maxWidth, ELLIPSIS)
+        return text[:n].rstrip() + ELLIPSIS
+
+    def wrapLines(self, font, text, maxWidth):
+        lines = []
+        for paragraph in text.split("\n"):
+            rest = paragraph.strip()
+            while True:
+                n = self.longestPrefix(font, rest, maxWidth)
+                if n >= len(rest):
+                    lines.append(rest)
+                    break
+                cut = rest.rfind(" ", 0, n + 1)
+                if cut <= 0:
+                    # a single word wider than the cell, break it
+                    cut = max(n, 1)
+                    lines.append(rest[:cut])
+                    rest = rest[cut:]
+                else:
+                    lines.append(rest[:cut])
+                    rest = rest[cut + 1:].lstrip()
+        return lines
+
+    def wrap(self, font, text, maxWidth, maxLines):
+        lines = self.wrapLines(font, text, maxWidth)
+        if len(lines) > maxLines:
+            lines = lines[:maxLines]
+            lines[-1] = self.truncate(font, lines[-1], maxWidth, force=True)
+        return lines
+
+    def fit(self, font, text, maxWidth, maxLines=1):
+        """Text ready to draw into a cell `maxWidth` px wide and `maxLines` lines high."""
+        key = (font, text, maxWidth, maxLines)
+        fitted = self.fits.get(key)
+        if fitted is not None:
+            self.hits += 1
+            return fitted
+
+        self.misses += 1
+        if maxLines == 1:
+            fitted = self.truncate(font, " ".join(text.split("\n")), maxWidth)
+        else:
+            fitted = "\n".join(self.wrap(font, text, maxWidth, maxLines))
+
+        if len(self.fits) >= self.maxEntries:
+            self.fits.clear()
+        self.fits[key] = fitted
+        return fitted
@@ -0,0 +1,85 @@
+"""Panel driver that lets the API render: polls /render/delta and only applies deltas.
+
+Keyframes get a full (first) or fast refresh, deltas a partial refresh of their dirty
+rectangles. On any protocol error the client drops its base and asks for a keyframe.
+"""
+from waveshare_epd import epd7in5_V2
+import os
+import signal
+import time
+import urllib.error
+import urllib.request
+from framedelta import DeltaReceiver, displayRects
+from framehistory import FrameHistory
+from screen import EPD_WIDTH, EPD_HEIGHT
+
+API = os.environ.get("OPENCLOCK_API", "http://localhost:8080")
+POLL_INTERVAL = 0.5
+RETRY_INTERVAL = 5
+
+history = FrameHistory()
+receiver = DeltaReceiver(EPD_WIDTH * EPD_HEIGHT // 8)
+
+def handle_exit(sig, frame):
+    raise(SystemExit)
+signal.signal(signal.SIGTERM, handle_exit)
+
+def fetch():
+    """Next message, or None if the frame didn't change."""
+    url = f"{API}/render/delta?seconds=true&chain={receiver.chain}"
+    if receiver.base:
+        url += f"&base={receiver.base}"
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.read()
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+try:
+    epd = epd7in5_V2.EPD()
+    firstFrame = True
+    try:
+        while True:
+            try:
+                message = fetch()
+            except (urllib.error.URLError, OSError) as e:
+                print(f"API unreachable: {e}")
+                time.sleep(RETRY_INTERVAL)
+                continue
+            if message is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+            try:
+                rects = receiver.apply(message)
+            except ValueError as e:
+                print(f"Dropping frame, asking for a keyframe: {e}")
+                continue
+            if rects is None:
+                if firstFrame:
+                    epd.init()
+                    epd.Clear()
+                    mode = "full"
+                else:
+                    epd.init_fast()
+                    mode = "fast"
+                epd.display(receiver.frame)
+                firstFrame = False
+            else:
+                epd.init_part()
+                displayRects(epd, receiver.frame, rects, EPD_WIDTH // 8)
+                mode = "partial"
+            epd.sleep()
+            history.record(bytes(receiver.frame), mode)
+    except (KeyboardInterrupt, SystemExit):
+        epd.sleep()
+        history.close()
+        print("Exiting...")
+
+except IOError as e:
+    print(e)
+
+except KeyboardInterrupt:
+    epd7in5_V2.epdconfig.module_exit(cleanup=True)
+    exit()
@@ -0,0 +1,36 @@
+import datetime
+
+# Time sources for the driver and the layout code. Everything that needs "now" asks a clock,
+# so frames can be rendered for any point in time without waiting for it.
+
+class SystemClock:
+    def now(self):
+        return datetime.datetime.now()
+
+class FixedClock:
+    """Always returns the same instant. Used for offline and batch rendering."""
+
+    def __init__(self, instant):
+        self.instant = instant
+
+    def now(self):
+        return self.instant
+
+    def set(self, instant):
+        self.instant = instant
+
+class SimulatedClock:
+    """Starts at `start` and moves `step` forward every time `advance` is called."""
+
+    def __init__(self, start, step=datetime.timedelta(seconds=1)):
+        self.instant = start
+        self.step = step
+
+    def now(self):
+        return self.instant
+
+    def advance(self):
+        self.instant += self.step
+        return self.instant
+
+SYSTEM_CLOCK = SystemClock()
@@ -0,0 +1,91 @@
+"""Warm restart of the display driver.
+
+The last frame the driver put on the panel is in the frame history. When the driver is restarted
+(crash, deploy, Restart=always) it can continue from that frame with a differential partial
+update instead of init + Clear + full display. A clean full refresh is still done when the frame
+is missing, older than MAX_AGE, from before the last boot, or when something else (boot or
+shutdown splash, clear.py) has drawn on the panel since; those scripts call `invalidate()`.
+"""
+from pathlib import Path
+import json
+import os
+import time
+from framehistory import HISTORY_DIR, readSegment, segments
+
+# next to the scripts, the splash services don't run in the driver's working directory
+STATE_FILE = Path(__file__).resolve().parent / "panel.json"
+MAX_AGE = 15 * 60
+
+def bootTime():
+    try:
+        with open('/proc/uptime') as f:
+            return time.time() - float(f.read().split()[0])
+    except (OSError, ValueError):
+        return 0
+
+def invalidate():
+    """Mark the panel content as unknown, the next driver start does a full refresh."""
+    tmp = STATE_FILE.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({"invalidated": time.time()}, f)
+    os.replace(tmp, STATE_FILE)
+
+def invalidatedAt():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f).get("invalidated", 0)
+    except (OSError, ValueError):
+        return 0
+
+def lastFrame(directory=HISTORY_DIR, frameSize=None):
+    """(frame, reason): the frame still on the panel, or None and why it can't be trusted."""
+    history = segments(directory)
+    if not history:
+        return None, "no frame history"
+
+    last = None
+    try:
+        for last in readSegment(history[-1]):
+            pass
+    except (OSError, ValueError, IndexError) as e:
+        return None, f"unreadable frame history: {e}"
+    if last is None:
+        return None, "empty frame history"
+
+    timestamp, mode, frame = last
+    if frameSize is not None and len(frame) != frameSize:
+        return None, "frame size mismatch"
+    if timestamp < bootTime():
+        return None, "frame is from before the last boot"
+    if timestamp < invalidatedAt():
+        return None, "panel was redrawn by another script"
+    if time.time() - timestamp > MAX_AGE:
+        return None, f"frame is {int(time.time() - timestamp)}s old"
+    return frame, None
+
+def displayDifferential(epd, previous, frame):
+    """Partial update of the whole panel from `previous` (what it shows) to `frame`.
+
+    Like EPD.display_Partial, but also loads the old-data RAM (0x10) with the previous frame so a
+    freshly reset controller drives only the pixels that actually change.
+    """
+    epd.send_command(0x50)
+    epd.send_data(0xA9)
+    epd.send_data(0x07)
+
+    epd.send_command(0x91)		#This command makes the display enter partial mode
+    epd.send_command(0x90)		#resolution setting
+    for value in (0, epd.width - 1, 0, epd.height - 1):
+        epd.send_data(value // 256)
+        epd.send_data(value % 256)
+    epd.send_data(0x01)
+
+    # partial mode takes inverted data, same as display_Partial
+    epd.send_command(0x10)
+    epd.send_data2([~b & 0xFF for b in previous])
+    epd.send_command(0x13)
+    epd.send_data2([~b & 0xFF for b in frame])
+
+    epd.send_command(0x12)
+    time.sleep(0.1)
+    epd.ReadBusy()
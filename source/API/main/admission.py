@@ -0,0 +1,125 @@
+"""Admission control for the expensive endpoints.
+
+Every route in LIMITS may run at most `concurrency` requests at once. Up to `queue` more wait
+for a slot, each for at most `timeout` seconds; everything beyond that is shed with a 503 and
+a Retry-After header instead of piling up on the event loop the sync jobs and the display data
+path share. Routes not listed are not limited. Limits are keyed by route template, so one
+limit covers e.g. the render route of every clock of a fleet.
+"""
+
+import asyncio
+from typing import Dict, Tuple
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from metrics import route_of
+from util import log
+
+
+class Limit:
+    """Concurrency limit with a bounded, time-limited wait queue."""
+
+    def __init__(self, concurrency: int, queue: int, timeout: float, retry_after: int):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = asyncio.Semaphore(concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+
+    async def acquire(self) -> bool:
+        """Take a slot; False if the queue is full or the wait timed out."""
+        if not self._slots.locked():
+            await self._slots.acquire()  # a slot is free, doesn't wait
+        elif self.waiting >= self.queue:
+            self.shed += 1
+            return False
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                return False
+            finally:
+                self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        self.active -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+# (method, route template): limit. Scans and subprocesses one or two at a time, a short queue for
+# double clicks, and the rest is told when to come back.
+LIMITS: Dict[Tuple[str, str], Limit] = {
+    ("POST", "/system/run"): Limit(concurrency=1, queue=2, timeout=10, retry_after=10),
+    ("GET", "/system/logs"): Limit(concurrency=2, queue=2, timeout=5, retry_after=5),
+    ("GET", "/system/metrics"): Limit(concurrency=1, queue=2, timeout=5, retry_after=5),
+    ("GET", "/network/scan"): Limit(concurrency=1, queue=4, timeout=10, retry_after=5),
+    ("GET", "/network/access-points"): Limit(
+        concurrency=1, queue=4, timeout=10, retry_after=5
+    ),
+    ("POST", "/network/connect"): Limit(
+        concurrency=1, queue=1, timeout=5, retry_after=10
+    ),
+    ("GET", "/untis/timetable"): Limit(
+        concurrency=2, queue=8, timeout=15, retry_after=5
+    ),
+    ("GET", "/dashboard/"): Limit(concurrency=2, queue=8, timeout=15, retry_after=5),
+    ("GET", "/render/frame"): Limit(concurrency=2, queue=8, timeout=10, retry_after=2),
+    ("GET", "/render/delta"): Limit(concurrency=2, queue=8, timeout=10, retry_after=2),
+    ("GET", "/render/frame.png"): Limit(
+        concurrency=1, queue=4, timeout=10, retry_after=2
+    ),
+    # every clock of a fleet polls these, the queue has room for a poll of each
+    ("GET", "/fleet/clocks/{clock_id}/render/delta"): Limit(
+        concurrency=2, queue=32, timeout=10, retry_after=2
+    ),
+    ("GET", "/fleet/clocks/{clock_id}/snapshot"): Limit(
+        concurrency=4, queue=32, timeout=5, retry_after=2
+    ),
+}
+
+
+async def admission_control(request: Request, call_next):
+    """Run limited routes within their limit, shed the excess with 503."""
+    limit = LIMITS.get((request.method, route_of(request)))
+    if limit is None:
+        return await call_next(request)
+
+    if not await limit.acquire():
+        log(
+            f"Shed {request.method} {request.url.path} "
+            f"({limit.active} running, {limit.waiting} waiting)",
+            level="warning",
+            module="admission",
+        )
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server busy, try again later"},
+            headers={"Retry-After": str(limit.retry_after)},
+        )
+    try:
+        return await call_next(request)
+    finally:
+        limit.release()
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    return {
+        f"{method} {path}": limit.stats() for (method, path), limit in LIMITS.items()
+    }
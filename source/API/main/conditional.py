@@ -0,0 +1,93 @@
+"""Conditional GET requests (ETag/304).
+
+Endpoints whose body only depends on some store slices are registered with `cacheable()`. The
+`conditional_requests` middleware derives their ETag from the path, the query string and the
+versions of those slices, so a matching `If-None-Match` gets a 304 before the handler runs. The
+ETag also carries a per-process epoch: versions start over when the API restarts, and in
+multi-worker mode each worker counts its own.
+"""
+
+import hashlib
+import os
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional
+from fastapi import Request, Response
+from db import store
+
+EPOCH = os.urandom(8).hex()
+
+
+class Cacheable(NamedTuple):
+    slices: tuple
+    extra: Optional[Callable[[], Any]]
+    fresh: Optional[Callable[[Request], bool]]
+    cache_control: str
+
+
+CACHEABLE: Dict[str, Cacheable] = {}
+hits = 0
+
+
+def cacheable(
+    path: str,
+    slices: Iterable[str] = (),
+    extra: Optional[Callable[[], Any]] = None,
+    fresh: Optional[Callable[[Request], bool]] = None,
+    max_age: int = 0,
+) -> None:
+    """Emit ETags for GET `path`.
+
+    `extra` returns anything else the body depends on, `fresh` tells whether the handler would
+    answer from stored data (if not, it runs and the ETag is taken afterwards). With `max_age`
+    clients may reuse the body without asking for that many seconds.
+    """
+    cache_control = f"max-age={max_age}" if max_age else "no-cache"
+    CACHEABLE[path] = Cacheable(tuple(slices), extra, fresh, cache_control)
+
+
+def etag(request: Request, entry: Cacheable) -> str:
+    versions = tuple(store.version(name) for name in entry.slices)
+    extra = entry.extra() if entry.extra else None
+    key = repr((EPOCH, request.url.path, request.url.query, versions, extra))
+    # weak: gzip and identity bodies share it
+    return f'W/"{hashlib.blake2b(key.encode(), digest_size=12).hexdigest()}"'
+
+
+def matches(if_none_match: str, tag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    weak = tag[2:]
+    return any(
+        candidate.strip().removeprefix("W/") == weak
+        for candidate in if_none_match.split(",")
+    )
+
+
+async def conditional_requests(request: Request, call_next):
+    """Answer If-None-Match from the store versions, tag cacheable responses."""
+    global hits
+    entry = CACHEABLE.get(request.url.path)
+    if entry is None or request.method not in ("GET", "HEAD"):
+        return await call_next(request)
+
+    try:
+        fresh = entry.fresh is None or entry.fresh(request)
+    except ValueError:  # e.g. bad query parameters, let the handler reject them
+        fresh = False
+    before = etag(request, entry) if fresh else None
+    if_none_match = request.headers.get("if-none-match")
+    if before and if_none_match and matches(if_none_match, before):
+        hits += 1
+        return Response(
+            status_code=304,
+            headers={"ETag": before, "Cache-Control": entry.cache_control},
+        )
+
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+    after = etag(request, entry)
+    # only tag the body if the data did not change while the handler built it
+    if before is None or before == after:
+        response.headers["ETag"] = after
+        response.headers["Cache-Control"] = entry.cache_control
+    return response
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 import json
 import subprocess
 import logging
@@ -6,10 +6,14 @@ import os
 import traceback
 from enum import Enum
 from pathlib import Path
-from dataClasses import ConfigModel, ClockType
-from db import DB
+from dataClasses import ConfigModel, ClockType, QuietRefresh, QUIET_TIME_PATTERN
+from db import store
+from metrics import upstream
+from response_cache import responses
 from util import handle_error, log
 import shutil
+import re
+from typing import List
 
 # Change config directory to be in user space instead of /etc
 CONFIG_DIR = Path.home() / ".config" / "openclock"
@@ -84,11 +88,9 @@ def get_relative_path(filename: str) -> Path:
 
 async def set_configFile():
     """Save config to file with enum handling."""
-    global DB
     try:
         with open(get_relative_path("config.json"), "w") as f:
-            config_dict = DB["config"]
-            f.write(DB["config"].toJSON())
+            f.write(store.get("config").toJSON())
     except Exception as e:
         tb = traceback.extract_tb(e.__traceback__)
         filename, line_no, func, text = tb[-1]
@@ -120,8 +122,8 @@ async def load_config() -> ConfigModel:
             with open(CONFIG_FILE, "r") as f:
                 data = json.load(f)
                 # Make sure to preserve setup state
-                if "setup" not in data and DB.get("config"):
-                    data["setup"] = DB["config"].setup
+                if "setup" not in data:
+                    data["setup"] = store.get("config").setup
 
                 config = ConfigModel(**data)
                 log(
@@ -130,35 +132,14 @@ async def load_config() -> ConfigModel:
                 )
                 return config
         except json.JSONDecodeError:
-            log("Invalid config file, loading from DB or default", module="config")
-            if DB.get("config"):
-                # Preserve existing config from DB
-                return DB["config"]
-
-            # Fallback to default if no DB config
-            return ConfigModel(
-                model=ClockType.Mini,
-                setup=False,
-                wallmounted=False,
-                debug=False,
-                hostname="openclock",
-                timezone="UTC",
-            )
+            log("Invalid config file, keeping the current config", module="config")
+            # Preserve the config already in the store (defaults at startup)
+            return store.get("config")
 
     except Exception as e:
         log(f"Failed to load configuration: {str(e)}", level="error", module="config")
-        # Try to preserve existing config from DB
-        if DB.get("config"):
-            return DB["config"]
-        # Ultimate fallback
-        return ConfigModel(
-            model=ClockType.Mini,
-            setup=False,
-            wallmounted=False,
-            debug=False,
-            hostname="openclock",
-            timezone="UTC",
-        )
+        # Preserve the config already in the store (defaults at startup)
+        return store.get("config")
 
 
 async def save_config(config: ConfigModel) -> bool:
@@ -180,13 +161,12 @@ async def save_config(config: ConfigModel) -> bool:
 
 async def set_configDB(config: ConfigModel = None):
     """Load or save configuration from/to file."""
-    global DB
     config_path = get_relative_path("config.json")
 
     try:
         if config:
             log(f"Saving new configuration", module="config")
-            DB["config"] = config
+            store.replace("config", config)
             with open(config_path, "w") as outfile:
                 outfile.write(config.toJSON())
             log("Configuration saved successfully", module="config")
@@ -198,7 +178,7 @@ async def set_configDB(config: ConfigModel = None):
             default_config = ConfigModel(
                 model=ClockType.Mini, setup=False, wallmounted=False
             )
-            DB["config"] = default_config
+            store.replace("config", default_config)
             await set_configDB(default_config)
             logging.info("Created default config")
             return
@@ -206,7 +186,7 @@ async def set_configDB(config: ConfigModel = None):
         # Load existing config
         with open(config_path, "r") as infile:
             data = json.load(infile)
-            DB["config"] = ConfigModel(**data)
+            store.replace("config", ConfigModel(**data))
             logging.info("Config loaded successfully")
 
     except Exception as e:
@@ -216,7 +196,9 @@ async def set_configDB(config: ConfigModel = None):
         error_loc = f"File: {filename}, Line: {line_no}, Function: {func}"
         logging.error(f"Failed to load/save config: {str(e)} at {error_loc}")
         # Use default config on error
-        DB["config"] = ConfigModel(model=ClockType.Mini, setup=False, wallmounted=False)
+        store.replace(
+            "config", ConfigModel(model=ClockType.Mini, setup=False, wallmounted=False)
+        )
         raise HTTPException(
             status_code=500,
             detail=f"Failed to load/save config: {str(e)} at {error_loc}",
@@ -230,7 +212,7 @@ async def set_configDB(config: ConfigModel = None):
 async def update_config(config: ConfigModel):
     """Update system configuration."""
     try:
-        DB["config"] = config
+        store.replace("config", config)
         if await save_config(config):
             return {"status": "success", "message": "Configuration updated"}
         raise ValueError("Failed to save configuration")
@@ -243,13 +225,14 @@ async def update_config(config: ConfigModel):
 @router.get(
     "/get", operation_id="get_config_legacy"
 )  # Keep for backwards compatibility
-async def get_config():
+async def get_config(request: Request):
     """Get current configuration."""
     try:
-        if not DB.get("config"):
+        if not store.get("config"):
             raise HTTPException(status_code=404, detail="No config found")
-        log("Returning current configuration", module="config")
-        return DB["config"]
+        return await responses.response(
+            request, "config", ("config",), lambda: store.get("config")
+        )
     except Exception as e:
         log(f"Failed to get config: {str(e)}", level="error", module="config")
         raise HTTPException(status_code=500, detail=str(e))
@@ -259,7 +242,9 @@ async def get_config():
 async def reset_config():
     """Reset configuration to defaults."""
     try:
-        DB["config"] = ConfigModel(model=ClockType.Mini, setup=False, wallmounted=False)
+        store.replace(
+            "config", ConfigModel(model=ClockType.Mini, setup=False, wallmounted=False)
+        )
         await set_configFile()
         return {"status": "success", "message": "Config reset to defaults"}
     except Exception as e:
@@ -269,8 +254,7 @@ async def reset_config():
 
 @router.post("/setWallmount")
 async def set_wallmount(wallmount: bool):
-    global DB
-    DB["config"].wallmounted = wallmount
+    store.update("config", wallmounted=wallmount)
     await set_configFile()
     return True
 
@@ -280,8 +264,8 @@ async def set_setup(setup: bool):
     """Update setup status."""
     try:
         log(f"Setting setup status to: {setup}", module="config")
-        DB["config"].setup = setup
-        if await save_config(DB["config"]):
+        config = store.update("config", setup=setup)
+        if await save_config(config):
             return {"status": "success", "setup": setup}
         raise ValueError("Failed to save setup state")
     except Exception as e:
@@ -293,13 +277,52 @@ async def set_setup(setup: bool):
 async def set_debug(debug: bool):
     """Update debug status."""
     try:
-        DB["config"].debug = debug
-        await set_configDB(DB["config"])
+        await set_configDB(store.update("config", debug=debug))
         return {"status": "success", "debug": debug}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/setQuietHours")
+async def set_quiet_hours(
+    enabled: bool,
+    start: str = "22:00",
+    end: str = "06:00",
+    refresh: QuietRefresh = QuietRefresh.Minute,
+):
+    """Update the display's quiet hours (times as HH:MM, local time)."""
+    try:
+        for value in (start, end):
+            if not re.match(QUIET_TIME_PATTERN, value):
+                raise HTTPException(status_code=400, detail=f"Invalid time: {value}")
+
+        log(
+            f"Setting quiet hours: enabled={enabled}, {start}-{end}, refresh={refresh.value}",
+            module="config",
+        )
+        config = store.update(
+            "config",
+            quiet_hours=enabled,
+            quiet_start=start,
+            quiet_end=end,
+            quiet_refresh=refresh,
+        )
+        if await save_config(config):
+            return {
+                "status": "success",
+                "quiet_hours": enabled,
+                "quiet_start": start,
+                "quiet_end": end,
+                "quiet_refresh": refresh.value,
+            }
+        raise ValueError("Failed to save quiet hours")
+    except HTTPException:
+        raise
+    except Exception as e:
+        log(f"Failed to set quiet hours: {str(e)}", level="error", module="config")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/getHostname", operation_id="get_system_hostname")
 async def getHostname():
     with open("/etc/hostname", "r") as f:
@@ -311,11 +334,11 @@ async def set_hostname(hostname: str):
     """Update hostname."""
     try:
         log(f"Setting hostname to: {hostname}", module="config")
-        DB["config"].hostname = hostname
-        await set_configDB(DB["config"])
+        await set_configDB(store.update("config", hostname=hostname))
 
         try:
-            subprocess.run(["hostnamectl", "set-hostname", hostname], check=True)
+            with upstream("subprocess", "hostnamectl"):
+                subprocess.run(["hostnamectl", "set-hostname", hostname], check=True)
             log(f"Hostname updated successfully", module="config")
         except subprocess.CalledProcessError as e:
             log(f"Failed to set system hostname: {e}", level="error", module="config")
@@ -339,11 +362,11 @@ async def set_timezone(timezone: str):
             )
             raise HTTPException(status_code=400, detail="Invalid timezone")
 
-        DB["config"].timezone = timezone
-        await set_configDB(DB["config"])
+        await set_configDB(store.update("config", timezone=timezone))
 
         try:
-            subprocess.run(["timedatectl", "set-timezone", timezone], check=True)
+            with upstream("subprocess", "timedatectl"):
+                subprocess.run(["timedatectl", "set-timezone", timezone], check=True)
             log(f"Timezone updated successfully", module="config")
         except subprocess.CalledProcessError as e:
             log(f"Failed to set system timezone: {e}", level="error", module="config")
@@ -358,7 +381,8 @@ async def set_timezone(timezone: str):
 @router.get("/getTimezone", operation_id="get_current_timezone")
 async def getTimezone():
     try:
-        sowh = subprocess.check_output(["timedatectl", "show"])
+        with upstream("subprocess", "timedatectl"):
+            sowh = subprocess.check_output(["timedatectl", "show"])
         for line in sowh.decode().splitlines():
             if "Timezone" in line:
                 return line.split("=")[1]
@@ -366,25 +390,30 @@ async def getTimezone():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def list_timezones() -> List[str]:
+    timezones = []
+    base_path = "/usr/share/zoneinfo"
+    for root, dirs, files in os.walk(base_path):
+        # Skip posix and right directories
+        if "posix" in root or "right" in root:
+            continue
+
+        for file in files:
+            full_path = os.path.join(root, file)
+            # Get relative path from zoneinfo directory
+            rel_path = os.path.relpath(full_path, base_path)
+            # Skip hidden files and non-timezone files
+            if not file.startswith(".") and "." not in file:
+                timezones.append(rel_path)
+
+    return sorted(timezones)  # Return sorted list for better readability
+
+
 @router.get("/getTimezones", operation_id="get_timezone_list")
-async def getTimezones():
+async def getTimezones(request: Request):
     try:
-        timezones = []
-        base_path = "/usr/share/zoneinfo"
-        for root, dirs, files in os.walk(base_path):
-            # Skip posix and right directories
-            if "posix" in root or "right" in root:
-                continue
-
-            for file in files:
-                full_path = os.path.join(root, file)
-                # Get relative path from zoneinfo directory
-                rel_path = os.path.relpath(full_path, base_path)
-                # Skip hidden files and non-timezone files
-                if not file.startswith(".") and "." not in file:
-                    timezones.append(rel_path)
-
-        return sorted(timezones)  # Return sorted list for better readability
+        # the zoneinfo database only changes with a package update, walk it once
+        return await responses.response(request, "timezones", (), list_timezones)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -392,7 +421,7 @@ async def getTimezones():
 def set_config(config: ConfigModel):
     """Set system configuration."""
     try:
-        DB["config"] = config
+        store.replace("config", config)
         # Save to file
         with open("config.json", "w") as f:
             f.write(config.toJSON())
@@ -0,0 +1,115 @@
+from fastapi import APIRouter, HTTPException, Request
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+from db import store
+from microsoft_api import device_flow_status, login_status
+from network_api import recent_access_points
+from response_cache import responses
+from system_api import system_status
+from untis_api import untis_status
+from util import log
+from warmup import warmup
+
+router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
+
+
+class View(NamedTuple):
+    """One part of the dashboard.
+
+    Attributes:
+        slices: Store slices the view is built from
+        build: Builds the view from the store
+        refresh: Brings the slices up to date first, if they can go stale
+        key: Anything besides the slice versions the view depends on
+    """
+
+    slices: tuple
+    build: Callable[[], Any]
+    refresh: Optional[Callable[[], Awaitable[Any]]] = None
+    key: Optional[Callable[[], Any]] = None
+
+
+def microsoft_expiry() -> tuple:
+    """Token and device flow expire without a store change."""
+    microsoft = store.get("microsoft")
+    now = time.time()
+    return (
+        (microsoft.result or {}).get("expires_on", 0) > now,
+        (microsoft.flow or {}).get("expires_at", 0) > now,
+    )
+
+
+# name: view, in the order the setup and dashboard pages use them
+VIEWS: Dict[str, View] = {
+    "status": View(("config",), system_status, key=warmup.fingerprint),
+    "config": View(("config",), lambda: store.get("config")),
+    "untis": View(("untis",), untis_status),
+    "microsoft": View(("microsoft",), login_status, key=microsoft_expiry),
+    "device_flow": View(("microsoft",), device_flow_status, key=microsoft_expiry),
+    "access_points": View(
+        ("network",),
+        lambda: store.get("network").access_points,
+        refresh=recent_access_points,
+    ),
+}
+
+
+def error_message(e: BaseException) -> str:
+    if isinstance(e, HTTPException):
+        return str(e.detail)
+    return str(e) or type(e).__name__
+
+
+def build(names: tuple, errors: Dict[str, str]) -> Dict[str, Any]:
+    dashboard = {}
+    for name in names:
+        if name in errors:
+            dashboard[name] = {"error": errors[name]}
+            continue
+        try:
+            dashboard[name] = VIEWS[name].build()
+        except Exception as e:
+            dashboard[name] = {"error": error_message(e)}
+    return dashboard
+
+
+# --- API Endpoints ---
+@router.get("/")
+async def get_dashboard(request: Request, views: Optional[str] = None):
+    """Several views in one response: status, config, untis, microsoft, device_flow and
+    access_points (comma separated, all by default).
+
+    Views that can go stale are refreshed concurrently; the response is cached until one of
+    the underlying slices changes. A failing view is reported as {"error": ...} next to the
+    others.
+    """
+    names = tuple(views.split(",")) if views else tuple(VIEWS)
+    unknown = [name for name in names if name not in VIEWS]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown views: {', '.join(unknown)}"
+        )
+
+    refreshing = [name for name in names if VIEWS[name].refresh]
+    results = await asyncio.gather(
+        *(VIEWS[name].refresh() for name in refreshing), return_exceptions=True
+    )
+    errors = {}
+    for name, result in zip(refreshing, results):
+        if isinstance(result, BaseException):
+            errors[name] = error_message(result)
+            log(
+                f"Dashboard view {name} failed: {errors[name]}",
+                level="warning",
+                module="dashboard",
+            )
+
+    slices = sorted({name for view in names for name in VIEWS[view].slices})
+    key = (
+        "dashboard",
+        names,
+        tuple(VIEWS[name].key() for name in names if VIEWS[name].key),
+        tuple(sorted(errors.items())),
+    )
+    return await responses.response(request, key, slices, lambda: build(names, errors))
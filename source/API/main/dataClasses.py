@@ -5,12 +5,15 @@ This module contains all the Pydantic models and enums used for:
 - Network credentials and WiFi settings
 - Microsoft email message formats
 - Untis calendar authentication
+- Runtime state slices held by the state store
+- Per-clock configuration in fleet mode
 """
 
 from enum import Enum
-from pydantic import BaseModel
-from typing import Optional, Dict, Any, Union
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Optional, Dict, Any, List, Union
 import json
+import re
 
 # CORS allowed origins
 origins = [
@@ -34,6 +37,18 @@ class ClockType(Enum):
     XL = "XL"
 
 
+class QuietRefresh(str, Enum):
+    """Display refresh cadence during quiet hours.
+
+    Attributes:
+        Minute: Redraw once a minute, without the second hand
+        Hour: Redraw once an hour
+    """
+
+    Minute = "minute"
+    Hour = "hour"
+
+
 class model(BaseModel):
     """System model and setup information.
 
@@ -113,6 +128,10 @@ class EmailMessage(BaseModel):
     body: Optional[str]
 
 
+# HH:MM, 24 hours, as the driver parses it (quiethours.parseTime)
+QUIET_TIME_PATTERN = r"^([01]\d|2[0-3]):[0-5]\d$"
+
+
 class ConfigModel(BaseModel):
     """System configuration settings."""
 
@@ -122,9 +141,229 @@ class ConfigModel(BaseModel):
     debug: bool = False
     hostname: str = f"openclock"
     timezone: str = "UTC"
+    quiet_hours: bool = False
+    quiet_start: str = Field(default="22:00", pattern=QUIET_TIME_PATTERN)
+    quiet_end: str = Field(default="06:00", pattern=QUIET_TIME_PATTERN)
+    quiet_refresh: QuietRefresh = QuietRefresh.Minute
+
+    @field_validator("quiet_start", "quiet_end", mode="before")
+    @classmethod
+    def pad_quiet_time(cls, value: Any) -> Any:
+        """Accept H:MM as older versions stored it, e.g. 7:00 -> 07:00."""
+        if isinstance(value, str) and re.match(r"^\d:\d\d$", value):
+            return "0" + value
+        return value
 
     def toJSON(self) -> str:
         """Convert config to JSON string with enum handling."""
         config_dict = self.model_dump()
         config_dict["model"] = self.model.value
         return json.dumps(config_dict, indent=2)
+
+
+class UntisElementType(str, Enum):
+    """Whose timetable a clock shows.
+
+    Attributes:
+        Own: The timetable of the logged in user
+        Klasse: A class
+        Teacher: A teacher
+        Room: A room
+    """
+
+    Own = "own"
+    Klasse = "klasse"
+    Teacher = "teacher"
+    Room = "room"
+
+
+class UntisElement(BaseModel):
+    """Untis element (class, teacher or room) a clock shows the timetable of.
+
+    Attributes:
+        type (UntisElementType): Kind of element
+        name (Optional[str]): Short name of the element as shown in WebUntis, e.g. '5a'
+    """
+
+    type: UntisElementType = UntisElementType.Own
+    name: Optional[str] = None
+
+
+class ClockConfig(ConfigModel):
+    """Configuration of one clock served by a fleet mode API instance.
+
+    Attributes:
+        clock_id (str): Identifier the clock uses to fetch its data (letters, digits, _.-)
+        untis (Optional[credentials]): Untis login, never part of responses
+        untis_element (UntisElement): Timetable the clock shows
+    """
+
+    clock_id: str = Field(pattern=r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+    untis: Optional[credentials] = Field(default=None, exclude=True)
+    untis_element: UntisElement = Field(default_factory=UntisElement)
+
+
+class UntisState(BaseModel):
+    """Runtime state of the Untis integration.
+
+    Attributes:
+        session: Logged in webuntis session, if any
+        connected (bool): Whether the last login or fetch succeeded
+        timetable (List[Period]): Timetable periods sorted by start time (untis_api.Period)
+        holidays (List): Holidays reported by the server (webuntis HolidayObjects)
+        current_period: Period running right now, if any
+        next_period: Next period to start, if any
+        updated (Optional[float]): Unix time of the last successful timetable fetch
+        days (int): Number of days the timetable covers from the day it was fetched
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    session: Any = Field(default=None, exclude=True)
+    connected: bool = False
+    timetable: List[Any] = Field(default_factory=list, exclude=True)
+    holidays: List[Any] = Field(default_factory=list, exclude=True)
+    current_period: Any = Field(default=None, exclude=True)
+    next_period: Any = Field(default=None, exclude=True)
+    updated: Optional[float] = None
+    days: int = 0
+
+
+class MicrosoftState(BaseModel):
+    """Runtime state of the Microsoft integration.
+
+    Tokens and the device flow never leave the process, they are excluded from dumps.
+
+    Attributes:
+        app: MSAL public client application
+        token_cache: MSAL token cache used by the app
+        flow (Optional[dict]): Pending device flow
+        result (Optional[dict]): Last token response
+        accounts (Optional[list]): Cached accounts
+        messages (List[Dict]): Last fetched mails (EmailMessage fields)
+        notifications (List[Dict]): Last fetched notifications
+        inbox_updated (Optional[float]): Unix time messages and notifications were fetched
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    app: Any = Field(default=None, exclude=True)
+    token_cache: Any = Field(default=None, exclude=True)
+    flow: Optional[Dict[str, Any]] = Field(default=None, exclude=True)
+    result: Optional[Dict[str, Any]] = Field(default=None, exclude=True)
+    accounts: Optional[List[Any]] = Field(default=None, exclude=True)
+    messages: List[Dict[str, Any]] = Field(default_factory=list, exclude=True)
+    notifications: List[Dict[str, Any]] = Field(default_factory=list, exclude=True)
+    inbox_updated: Optional[float] = None
+
+
+class NetworkState(BaseModel):
+    """Runtime state of the network integration.
+
+    Attributes:
+        bus: D-Bus system bus connection
+        wifi_device (Optional[str]): Object path of the WiFi device
+        access_points (List[Dict]): Networks found by the last scan, strongest first
+        scanned (Optional[float]): Unix time of the last scan
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    bus: Any = Field(default=None, exclude=True)
+    wifi_device: Optional[str] = None
+    access_points: List[Dict[str, Any]] = Field(default_factory=list)
+    scanned: Optional[float] = None
+
+
+class UntisStatus(BaseModel):
+    """Public view of the untis slice sent in change events.
+
+    Attributes:
+        connected (bool): Whether the Untis session is up
+        timetable_entries (int): Number of cached timetable periods
+        holidays (int): Number of cached holidays
+        updated (Optional[float]): Unix time of the last successful timetable fetch
+    """
+
+    connected: bool
+    timetable_entries: int
+    holidays: int
+    updated: Optional[float] = None
+
+
+class MicrosoftStatus(BaseModel):
+    """Public view of the microsoft slice sent in change events.
+
+    Attributes:
+        authenticated (bool): Whether an access token is available
+        expires_at (Optional[float]): Unix time the access token expires
+        device_flow_active (bool): Whether a device login is waiting for the user
+        device_flow_expires_at (Optional[float]): Unix time the device login expires
+    """
+
+    authenticated: bool
+    expires_at: Optional[float] = None
+    device_flow_active: bool
+    device_flow_expires_at: Optional[float] = None
+
+
+class NetworkStatus(BaseModel):
+    """Public view of the network slice sent in change events.
+
+    Attributes:
+        dbus_connected (bool): Whether the D-Bus system bus is connected
+        wifi_device (Optional[str]): Object path of the WiFi device
+    """
+
+    dbus_connected: bool
+    wifi_device: Optional[str] = None
+
+
+class StateEvent(BaseModel):
+    """Change event pushed to stream clients.
+
+    Attributes:
+        id (int): Store sequence number, pass it back to resume the stream
+        type (str): Slice that changed (config, untis, microsoft, network)
+        version (int): Version of that slice
+        data (Dict[str, Any]): Public view of the slice
+    """
+
+    id: int
+    type: str
+    version: int
+    data: Dict[str, Any]
+
+
+class JobStatus(BaseModel):
+    """State of a scheduled background job.
+
+    Attributes:
+        name (str): Job name
+        interval (Optional[float]): Seconds between runs, None for one-shot jobs
+        leader_only (bool): Whether only the elected worker runs the job
+        running (bool): Whether the job is running right now
+        runs (int): Completed runs
+        failures (int): Failed or timed out runs
+        consecutive_failures (int): Failures since the last successful run
+        restarts (int): Times the job's supervisor had to be restarted
+        last_run (Optional[float]): Unix time the last run started
+        last_duration (Optional[float]): Seconds the last run took
+        last_status (Optional[str]): ok, error, timeout, cancelled or standby
+        last_error (Optional[str]): Error of the last run, if it failed
+        next_run (Optional[float]): Unix time of the next run
+    """
+
+    name: str
+    interval: Optional[float] = None
+    leader_only: bool = False
+    running: bool
+    runs: int
+    failures: int
+    consecutive_failures: int
+    restarts: int
+    last_run: Optional[float] = None
+    last_duration: Optional[float] = None
+    last_status: Optional[str] = None
+    last_error: Optional[str] = None
+    next_run: Optional[float] = None
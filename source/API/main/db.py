@@ -1,7 +1,6 @@
 from dataClasses import *
-import msal
-import webuntis
 import os
+from store import Store
 
 origins = [
     "http://localhost",
@@ -9,35 +8,33 @@ origins = [
     "http://localhost:3000",
 ]
 
-DB = {
-    # Microsoft API runtime data
-    "ms_result": None,
-    "ms_accounts": None,
-    "ms_flow": None,
-    "ms_app": None,
-    "token_cache": msal.SerializableTokenCache(),
-    # Untis API runtime data
-    "untis_session": None,
-    "untis_state": "disconnected",
-    "timeTable": [],
-    "currentPeriod": webuntis.objects.PeriodObject,
-    "nextPeriod": webuntis.objects.PeriodObject,
-    "holidays": [],
-    # DBus runtime data
-    "bus": None,
-    "wifi_device": None,
-    # configs
-    "config": ConfigModel(model=ClockType.Mini, setup=False, wallmounted=False),
-}
-
-SECURE_DB = {
-    # Microsoft API credentials
-    "token_cache": msal.SerializableTokenCache(),
-    "client_id": "cda7262c-6d80-4c31-adb6-5d9027364fa7",
-    "scopes": ["User.Read", "Mail.Read"],
-    "graph_endpoint": "https://graph.microsoft.com/v1.0",
-    "cache_path": os.path.join(".", "cache.bin"),
-    "authority": "https://login.microsoftonline.com/076218b1-9f9c-4129-bbb0-337d5a8fe3e3",
-    # Untis API credentials
-    "untis_creds": None,
-}
+
+def default_slices() -> dict:
+    """Fresh runtime state, used at startup and on factory reset."""
+    return {
+        "config": ConfigModel(model=ClockType.Mini, setup=False, wallmounted=False),
+        "untis": UntisState(),
+        "microsoft": MicrosoftState(),
+        "network": NetworkState(),
+    }
+
+
+# Runtime state, see store.py. Secrets stay in SECURE_DB so they never reach subscribers.
+store = Store(**default_slices())
+
+
+def default_secure_db() -> dict:
+    """Credentials and endpoints the API starts with, used at startup and on factory reset."""
+    return {
+        # Microsoft API credentials
+        "client_id": "cda7262c-6d80-4c31-adb6-5d9027364fa7",
+        "scopes": ["User.Read", "Mail.Read"],
+        "graph_endpoint": "https://graph.microsoft.com/v1.0",
+        "cache_path": os.path.join(".", "cache.bin"),
+        "authority": "https://login.microsoftonline.com/076218b1-9f9c-4129-bbb0-337d5a8fe3e3",
+        # Untis API credentials
+        "untis_creds": None,
+    }
+
+
+SECURE_DB = default_secure_db()
@@ -0,0 +1,164 @@
+from fastapi import APIRouter, Header, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional
+from pydantic import BaseModel
+from dataClasses import MicrosoftStatus, NetworkStatus, StateEvent, UntisStatus
+from db import store
+from util import log
+
+router = APIRouter(prefix="/events", tags=["Events"])
+
+# Seconds between keepalives on an idle stream
+KEEPALIVE = 15
+
+
+# --- Event Payloads ---
+def untis_status(untis) -> UntisStatus:
+    return UntisStatus(
+        connected=untis.connected,
+        timetable_entries=len(untis.timetable),
+        holidays=len(untis.holidays),
+        updated=untis.updated,
+    )
+
+
+def microsoft_status(microsoft) -> MicrosoftStatus:
+    result = microsoft.result or {}
+    flow_expires = (microsoft.flow or {}).get("expires_at")
+    flow_active = bool(flow_expires and flow_expires > time.time())
+    return MicrosoftStatus(
+        authenticated=bool(result.get("access_token")),
+        expires_at=result.get("expires_on"),
+        device_flow_active=flow_active,
+        device_flow_expires_at=flow_expires if flow_active else None,
+    )
+
+
+def network_status(network) -> NetworkStatus:
+    return NetworkStatus(
+        dbus_connected=network.bus is not None, wifi_device=network.wifi_device
+    )
+
+
+STATUS = {
+    "config": lambda config: config,
+    "untis": untis_status,
+    "microsoft": microsoft_status,
+    "network": network_status,
+}
+
+
+def make_event(sequence: int, name: str, version: int, value: BaseModel) -> StateEvent:
+    """Change event with the public view of a slice."""
+    data = STATUS[name](value).model_dump(mode="json")
+    return StateEvent(id=sequence, type=name, version=version, data=data)
+
+
+def snapshot() -> List[StateEvent]:
+    """One event per slice with its current state."""
+    sequence = store.sequence()
+    return [
+        make_event(sequence, name, store.version(name), store.get(name))
+        for name in STATUS
+    ]
+
+
+async def event_stream(
+    since: Optional[int] = None,
+) -> AsyncIterator[Optional[StateEvent]]:
+    """Change events from `since` on, yielding None when a keepalive is due.
+
+    Without `since`, or when the changes after it are no longer in the store history, the
+    stream starts with a full snapshot. Events whose payload did not change are skipped.
+    """
+    subscription = store.subscribe(STATUS)
+    try:
+        backlog = store.changes_since(since) if since is not None else None
+        if backlog is None:
+            pending = snapshot()
+        else:
+            pending = [
+                make_event(c.sequence, c.slice, c.version, c.value) for c in backlog
+            ]
+
+        sent: Dict[str, dict] = {}
+        dropped = 0
+        while True:
+            for event in pending:
+                if sent.get(event.type) == event.data:
+                    continue
+                sent[event.type] = event.data
+                yield event
+
+            try:
+                change = await asyncio.wait_for(subscription.get(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                pending = []
+                yield None
+                continue
+
+            if subscription.dropped != dropped:
+                # this client fell behind and lost changes, resync it
+                dropped = subscription.dropped
+                sent.clear()
+                pending = snapshot()
+            else:
+                pending = [
+                    make_event(
+                        change.sequence, change.slice, change.version, change.value
+                    )
+                ]
+    finally:
+        subscription.close()
+
+
+def parse_since(since: Optional[int], last_event_id: Optional[str]) -> Optional[int]:
+    """Resume point from the query or from the EventSource Last-Event-ID header."""
+    if since is not None:
+        return since
+    try:
+        return int(last_event_id) if last_event_id else None
+    except ValueError:
+        return None
+
+
+# --- API Endpoints ---
+@router.get("/stream")
+async def stream_events(
+    since: Optional[int] = None, last_event_id: Optional[str] = Header(None)
+):
+    """Server-Sent Events stream of state changes."""
+    since = parse_since(since, last_event_id)
+
+    async def body():
+        async for event in event_stream(since):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"id: {event.id}\nevent: {event.type}\ndata: {event.model_dump_json()}\n\n"
+
+    log(f"Event stream opened (since={since})", module="events")
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def websocket_events(websocket: WebSocket, since: Optional[int] = None):
+    """WebSocket stream of state changes, one JSON event per message."""
+    await websocket.accept()
+    log(f"Event websocket opened (since={since})", module="events")
+    try:
+        async for event in event_stream(since):
+            if event is None:
+                await websocket.send_json({"type": "keepalive"})
+            else:
+                await websocket.send_text(event.model_dump_json())
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        log(f"Event websocket error: {str(e)}", level="warning", module="events")
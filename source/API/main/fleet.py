@@ -0,0 +1,507 @@
+"""Fleet mode: one API instance serving many clocks.
+
+Enabled with OPENCLOCK_FLEET=1. Every clock registered under /fleet gets a partition: its own
+Store with config (ClockConfig), untis and microsoft slices, so versions and cached responses
+work per clock the way they do for the clock the API runs on. Clocks showing the same Untis
+element (class, teacher, room, or the account's own timetable) on the same server and school
+form a fetch group: one login and one timetable fetch per group and minute, fanned out to the
+partitions of its clocks. Microsoft tokens stay per clock (one MSAL app and token cache each),
+one job refreshes them all.
+
+Clocks, their Untis logins and token caches are kept in CONFIG_DIR/fleet, readable by the API
+user only. Partitions live in process memory: run fleet mode with a single worker (the API
+refuses to start with OPENCLOCK_SHARED_STATE set as well).
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from config_api import CONFIG_DIR
+from dataClasses import (
+    ClockConfig,
+    MicrosoftState,
+    UntisElementType,
+    UntisState,
+    credentials,
+)
+from db import SECURE_DB
+from journal import write_atomic
+from metrics import upstream
+from render_api import FrameRenderer
+from microsoft_api import build_msal_app
+from response_cache import ResponseCache
+from startup import lazy_import
+from store import Store
+from untis_api import SESSION_TIMEOUT, find_periods, resolve_periods
+from util import log
+from viewmodel import ViewModelBuilder
+
+webuntis = lazy_import("webuntis")
+msal = lazy_import("msal")
+
+FLEET_ENV = "OPENCLOCK_FLEET"
+FLEET_MODE = os.environ.get(FLEET_ENV) == "1"
+FLEET_DIR = CONFIG_DIR / "fleet"
+CLOCKS_FILE = "clocks.json"
+TOKEN_CACHE = "cache.bin"
+# Days of timetable fetched per group
+DAYS = 10
+# Seconds holidays are reused before a group fetches them again
+HOLIDAYS_MAX_AGE = 86400
+# Groups fetched at the same time
+FETCH_CONCURRENCY = 4
+# Frames cached per clock: the one shown, the client's base and a few to spare
+PARTITION_FRAMES = 4
+
+
+def group_key(config: ClockConfig) -> Optional[tuple]:
+    """Clocks with equal keys show the same timetable; None without an Untis login."""
+    creds = config.untis
+    if creds is None:
+        return None
+    element = config.untis_element
+    if element.type == UntisElementType.Own:
+        return (creds.server, creds.school, element.type.value, creds.username)
+    return (creds.server, creds.school, element.type.value, element.name)
+
+
+def clock_now(config: ClockConfig) -> datetime.datetime:
+    """Wall clock time of a clock, naive like the timetable periods."""
+    try:
+        zone = ZoneInfo(config.timezone)
+    except Exception:
+        zone = None
+    return datetime.datetime.now(zone).replace(tzinfo=None)
+
+
+class ClockPartition:
+    """State of one clock: its store, response cache, view model, frame cache and pending
+    Microsoft login."""
+
+    def __init__(self, config: ClockConfig):
+        self.store = Store(
+            history=16, config=config, untis=UntisState(), microsoft=MicrosoftState()
+        )
+        self.responses = ResponseCache(self.store, max_entries=4)
+        self.views = ViewModelBuilder(self.store, now=lambda: clock_now(self.config))
+        # its own frames, so its delta base isn't evicted by the other clocks' frames
+        self.frames = FrameRenderer(max_frames=PARTITION_FRAMES)
+        self.login: Optional[asyncio.Task] = None
+
+    @property
+    def config(self) -> ClockConfig:
+        return self.store.get("config")
+
+
+class UntisLogin:
+    """A webuntis session, shared by every group logging in with the same account."""
+
+    def __init__(self, creds: credentials):
+        self.creds = creds
+        self.session = None
+        self.since = 0.0
+        self.logins = 0
+        self._lock = asyncio.Lock()
+
+    async def get(self):
+        """Logged in session, renewed after SESSION_TIMEOUT."""
+        async with self._lock:
+            if self.session is None or time.time() - self.since > SESSION_TIMEOUT:
+                await self.close()
+                session = webuntis.Session(
+                    username=self.creds.username,
+                    password=self.creds.password,
+                    server=self.creds.server,
+                    school=self.creds.school,
+                    useragent="OpenClock",
+                )
+                with upstream("untis", "login"):
+                    self.session = await asyncio.to_thread(session.login)
+                self.since = time.time()
+                self.logins += 1
+            return self.session
+
+    async def close(self) -> None:
+        session, self.session = self.session, None
+        if session is not None:
+            try:
+                await asyncio.to_thread(session.logout)
+            except Exception:
+                pass
+
+
+class FetchGroup:
+    """Clocks sharing one timetable fetch."""
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.clocks: List[str] = []
+        self.element = None  # resolved webuntis element, kept across fetches
+        self.holidays: List[Any] = []
+        self.holidays_updated = 0.0
+        self.updated: Optional[float] = None
+        self.error: Optional[str] = None
+        self.fetches = 0
+        self.failures = 0
+
+    def status(self) -> Dict[str, Any]:
+        server, school, element_type, name = self.key
+        return {
+            "server": server,
+            "school": school,
+            "element": {"type": element_type, "name": name},
+            "clocks": list(self.clocks),
+            "updated": self.updated,
+            "fetches": self.fetches,
+            "failures": self.failures,
+            "error": self.error,
+        }
+
+
+def login_key(creds: credentials) -> tuple:
+    return (creds.server, creds.school, creds.username)
+
+
+def resolve_element(session, element_type: str, name: str):
+    """Webuntis object of the class, teacher or room called `name`."""
+    elements = {
+        UntisElementType.Klasse.value: session.klassen,
+        UntisElementType.Teacher.value: session.teachers,
+        UntisElementType.Room.value: session.rooms,
+    }[element_type]()
+    found = elements.filter(name=name)
+    if not found:
+        raise ValueError(f"No {element_type} called {name}")
+    return found[0]
+
+
+class Fleet:
+    """The clock partitions, their fetch groups and the shared Untis logins."""
+
+    def __init__(self, directory: Path = FLEET_DIR):
+        self.directory = directory
+        self.clocks: Dict[str, ClockPartition] = {}
+        self._groups: Dict[tuple, FetchGroup] = {}
+        self._logins: Dict[tuple, UntisLogin] = {}
+
+    # --- Registry ---
+    def load(self) -> int:
+        """Restore the registered clocks and their token caches."""
+        path = self.directory / CLOCKS_FILE
+        if not path.exists():
+            return 0
+        for item in json.loads(path.read_text())["clocks"]:
+            config = ClockConfig(**item["config"], untis=item.get("untis"))
+            partition = self.clocks[config.clock_id] = ClockPartition(config)
+            token_path = self.token_path(config.clock_id)
+            if token_path.exists():
+                cache = msal.SerializableTokenCache()
+                cache.deserialize(token_path.read_text())
+                partition.store.update("microsoft", token_cache=cache)
+        self.regroup()
+        log(
+            f"Fleet of {len(self.clocks)} clocks in {len(self._groups)} fetch groups",
+            module="fleet",
+        )
+        return len(self.clocks)
+
+    def save(self) -> None:
+        clocks = []
+        for partition in self.clocks.values():
+            config = partition.config
+            clocks.append(
+                {
+                    "config": config.model_dump(mode="json"),
+                    "untis": config.untis.model_dump() if config.untis else None,
+                }
+            )
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        write_atomic(
+            self.directory / CLOCKS_FILE, json.dumps({"clocks": clocks}).encode()
+        )
+
+    def get(self, clock_id: str) -> ClockPartition:
+        """Partition of a clock; KeyError if it is not registered."""
+        return self.clocks[clock_id]
+
+    def register(self, config: ClockConfig) -> Tuple[ClockPartition, bool]:
+        """Add or update a clock. Returns its partition and whether it needs a fetch."""
+        partition = self.clocks.get(config.clock_id)
+        if partition is None:
+            partition = self.clocks[config.clock_id] = ClockPartition(config)
+            refetch = config.untis is not None
+        else:
+            if config.untis is None:
+                config = config.model_copy(update={"untis": partition.config.untis})
+            refetch = group_key(config) != group_key(partition.config)
+            partition.store.replace("config", config)
+            if refetch:
+                partition.store.replace("untis", UntisState())
+        self.regroup()
+        self.save()
+        if refetch and self.adopt(partition):
+            refetch = False
+        return partition, refetch
+
+    def adopt(self, partition: ClockPartition) -> bool:
+        """Give a clock joining a group the timetable the group already fetched."""
+        group = self._groups.get(group_key(partition.config))
+        for clock_id in group.clocks if group else ():
+            untis = self.clocks[clock_id].store.get("untis")
+            if clock_id != partition.config.clock_id and untis.updated is not None:
+                current_period, next_period = find_periods(
+                    untis.timetable, clock_now(partition.config)
+                )
+                partition.store.replace(
+                    "untis",
+                    untis.model_copy(
+                        update={
+                            "current_period": current_period,
+                            "next_period": next_period,
+                        }
+                    ),
+                )
+                return True
+        return False
+
+    def remove(self, clock_id: str) -> None:
+        partition = self.clocks.pop(clock_id)
+        if partition.login is not None:
+            partition.login.cancel()
+        self.regroup()
+        self.save()
+        self.token_path(clock_id).unlink(missing_ok=True)
+
+    def regroup(self) -> None:
+        """Rebuild the fetch groups, keeping what existing groups already resolved."""
+        groups: Dict[tuple, FetchGroup] = {}
+        for clock_id, partition in sorted(self.clocks.items()):
+            key = group_key(partition.config)
+            if key is None:
+                continue
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = self._groups.get(key) or FetchGroup(key)
+                group.clocks = []
+            group.clocks.append(clock_id)
+        self._groups = groups
+
+    def groups(self) -> List[FetchGroup]:
+        return list(self._groups.values())
+
+    # --- Untis ---
+    def untis_login(self, creds: credentials) -> UntisLogin:
+        login = self._logins.get(login_key(creds))
+        if login is None or login.creds != creds:
+            login = self._logins[login_key(creds)] = UntisLogin(creds)
+        return login
+
+    async def fetch_group(self, group: FetchGroup) -> bool:
+        """Fetch the group's timetable once and hand it to each of its clocks."""
+        partitions = [self.clocks[c] for c in group.clocks if c in self.clocks]
+        if not partitions:
+            return True
+        login = self.untis_login(partitions[0].config.untis)
+        group.fetches += 1
+        try:
+            session = await login.get()
+            start = datetime.date.today()
+            end = start + datetime.timedelta(days=DAYS)
+            element_type, name = group.key[2], group.key[3]
+            with upstream("untis", "timetable"):
+                if element_type == UntisElementType.Own.value:
+                    timetable = await asyncio.to_thread(
+                        session.my_timetable, start=start, end=end
+                    )
+                else:
+                    if group.element is None:
+                        group.element = await asyncio.to_thread(
+                            resolve_element, session, element_type, name
+                        )
+                    timetable = await asyncio.to_thread(
+                        session.timetable,
+                        start=start,
+                        end=end,
+                        **{element_type: group.element},
+                    )
+                timetable = await asyncio.to_thread(resolve_periods, timetable)
+            if time.time() - group.holidays_updated > HOLIDAYS_MAX_AGE:
+                with upstream("untis", "holidays"):
+                    group.holidays = list(await asyncio.to_thread(session.holidays))
+                group.holidays_updated = time.time()
+        except Exception as e:
+            group.failures += 1
+            group.error = str(e) or type(e).__name__
+            await login.close()  # log in again next time
+            for partition in partitions:
+                partition.store.update("untis", connected=False)
+            log(
+                f"Untis fetch for {', '.join(group.clocks)} failed: {group.error}",
+                level="warning",
+                module="fleet",
+            )
+            return False
+
+        group.updated = time.time()
+        group.error = None
+        for partition in partitions:
+            current_period, next_period = find_periods(
+                timetable, clock_now(partition.config)
+            )
+            partition.store.update(
+                "untis",
+                session=session,
+                connected=True,
+                timetable=timetable,
+                holidays=group.holidays,
+                current_period=current_period,
+                next_period=next_period,
+                updated=group.updated,
+                days=DAYS,
+            )
+        return True
+
+    async def sync_untis(self) -> None:
+        """Scheduled job: one fetch per group. Raises if every group failed."""
+        groups = self.groups()
+        if not groups:
+            return
+        slots = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def fetch(group: FetchGroup) -> bool:
+            async with slots:
+                return await self.fetch_group(group)
+
+        results = await asyncio.gather(*(fetch(group) for group in groups))
+        failed = results.count(False)
+        log(
+            f"Fetched {len(groups) - failed}/{len(groups)} groups for {len(self.clocks)} clocks",
+            module="fleet",
+        )
+        if failed == len(groups):
+            raise RuntimeError(f"All {failed} Untis fetch groups failed")
+
+    # --- Microsoft ---
+    def token_path(self, clock_id: str) -> Path:
+        return self.directory / clock_id / TOKEN_CACHE
+
+    def save_token_cache(self, partition: ClockPartition) -> None:
+        cache = partition.store.get("microsoft").token_cache
+        if cache is None or not cache.has_state_changed:
+            return
+        path = self.token_path(partition.config.clock_id)
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        write_atomic(path, cache.serialize().encode())
+        cache.has_state_changed = False
+
+    async def msal_app(self, partition: ClockPartition):
+        """MSAL app of a clock, on its own token cache; built in a thread, stored on the
+        event loop."""
+        microsoft = partition.store.get("microsoft")
+        if microsoft.app is not None:
+            return microsoft.app
+        cache = microsoft.token_cache or msal.SerializableTokenCache()
+        app = await asyncio.to_thread(build_msal_app, cache)
+        current = partition.store.get("microsoft")
+        if current.app is not None:
+            return current.app  # a concurrent caller stored one in the meantime
+        return partition.store.update("microsoft", app=app, token_cache=cache).app
+
+    async def start_login(self, partition: ClockPartition) -> Dict[str, Any]:
+        """Start a device flow for a clock; it completes in the background."""
+        app = await self.msal_app(partition)
+        with upstream("microsoft", "device_flow"):
+            flow = await asyncio.to_thread(
+                app.initiate_device_flow, scopes=SECURE_DB["scopes"]
+            )
+        if "user_code" not in flow:
+            raise ValueError("Failed to create device flow")
+        flow["expires_at"] = int(time.time() + flow.get("expires_in", 0))
+        previous = partition.store.get("microsoft").flow
+        if previous:
+            previous["expires_at"] = 0  # stops MSAL polling for it
+        partition.store.update("microsoft", flow=flow)
+        partition.login = asyncio.create_task(self._complete_login(partition, flow))
+        return {
+            "status": "login_required",
+            "verification_uri": flow["verification_uri"],
+            "user_code": flow["user_code"],
+            "message": flow["message"],
+            "expires_at": flow["expires_at"],
+        }
+
+    async def _complete_login(self, partition: ClockPartition, flow: dict) -> None:
+        app = await self.msal_app(partition)
+        with upstream("microsoft", "device_flow_token") as call:
+            result = await asyncio.to_thread(app.acquire_token_by_device_flow, flow)
+            if "access_token" not in result:
+                call.fail()
+        if partition.store.get("microsoft").flow is not flow:
+            return  # a newer login replaced this one
+        if "access_token" not in result:
+            partition.store.update("microsoft", flow=None)
+            log(
+                f"Microsoft login of {partition.config.clock_id} failed: "
+                f"{result.get('error_description', result.get('error'))}",
+                level="warning",
+                module="fleet",
+            )
+            return
+        accounts = await asyncio.to_thread(app.get_accounts)
+        partition.store.update("microsoft", result=result, flow=None, accounts=accounts)
+        self.save_token_cache(partition)
+        log(f"Microsoft login of {partition.config.clock_id} completed", module="fleet")
+
+    async def refresh_tokens(self) -> None:
+        """Scheduled job: refresh every clock's token silently, one clock at a time."""
+        failed = []
+        for clock_id, partition in list(self.clocks.items()):
+            cache = partition.store.get("microsoft").token_cache
+            if cache is None or not cache.find("Account"):
+                continue  # nobody logged in on this clock
+            try:
+                app = await self.msal_app(partition)
+                accounts = await asyncio.to_thread(app.get_accounts)
+                result = None
+                if accounts:
+                    with upstream("microsoft", "token_refresh") as call:
+                        result = await asyncio.to_thread(
+                            app.acquire_token_silent,
+                            scopes=SECURE_DB["scopes"],
+                            account=accounts[0],
+                        )
+                        if not result:
+                            call.fail()
+                if not result:
+                    raise ValueError("no token without user interaction")
+                partition.store.update("microsoft", result=result, accounts=accounts)
+                self.save_token_cache(partition)
+            except Exception as e:
+                failed.append(clock_id)
+                log(
+                    f"Token refresh of {clock_id} failed: {str(e)}",
+                    level="warning",
+                    module="fleet",
+                )
+        if failed:
+            raise RuntimeError(f"Token refresh failed for {', '.join(failed)}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clocks": len(self.clocks),
+            "groups": len(self._groups),
+            "logins": len(self._logins),
+            "fetches": sum(group.fetches for group in self._groups.values()),
+            "failures": sum(group.failures for group in self._groups.values()),
+            "renders": sum(p.frames.renders for p in self.clocks.values()),
+            "keyframes": sum(p.frames.keyframes for p in self.clocks.values()),
+            "deltas": sum(p.frames.deltas for p in self.clocks.values()),
+        }
+
+
+fleet = Fleet()
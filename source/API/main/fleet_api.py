@@ -0,0 +1,193 @@
+"""Endpoints of fleet mode (see fleet.py), only mounted with OPENCLOCK_FLEET=1.
+
+Lightweight clients only ask for their own clock: /fleet/clocks/{clock_id}/snapshot for the
+data (ETag/304 from the partition's versions) and /fleet/clocks/{clock_id}/render/delta for
+the panel, so a driver/thinclient.py pointed at OPENCLOCK_API=<api>/fleet/clocks/<clock_id>
+works unchanged.
+"""
+
+from fastapi import APIRouter, HTTPException, Request, Response
+import datetime
+import hashlib
+import time
+from typing import Any, Dict, List, Optional
+from pydantic import ValidationError
+from conditional import EPOCH, matches
+from dataClasses import ClockConfig, UntisElementType
+from events_api import microsoft_status, untis_status
+from fleet import DAYS, ClockPartition, clock_now, fleet
+from render_api import delta_response, render_frame
+from scheduler import scheduler
+from untis_api import format_timetable, validate_server_url
+from util import handle_error, log
+
+router = APIRouter(prefix="/fleet", tags=["Fleet"])
+
+
+def get_partition(clock_id: str) -> ClockPartition:
+    try:
+        return fleet.get(clock_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown clock {clock_id}")
+
+
+def microsoft_expiry(partition: ClockPartition) -> tuple:
+    """Token and device flow expire without a store change."""
+    microsoft = partition.store.get("microsoft")
+    now = time.time()
+    return (
+        (microsoft.result or {}).get("expires_on", 0) > now,
+        (microsoft.flow or {}).get("expires_at", 0) > now,
+    )
+
+
+def snapshot(partition: ClockPartition) -> Dict[str, Any]:
+    """Everything a clock displays, in one document."""
+    untis = partition.store.get("untis")
+    return {
+        "config": partition.config,
+        "untis": {
+            **untis_status(untis).model_dump(),
+            "timetable": format_timetable(untis.timetable, DAYS),
+        },
+        "microsoft": microsoft_status(partition.store.get("microsoft")),
+    }
+
+
+def snapshot_etag(partition: ClockPartition) -> str:
+    key = repr(
+        (
+            EPOCH,
+            partition.config.clock_id,
+            partition.store.versions(),
+            microsoft_expiry(partition),
+            datetime.date.today(),
+        )
+    )
+    return f'W/"{hashlib.blake2b(key.encode(), digest_size=12).hexdigest()}"'
+
+
+# --- API Endpoints ---
+@router.get("/clocks")
+async def list_clocks() -> List[Dict[str, Any]]:
+    """Registered clocks and their Untis connection state."""
+    return [
+        {
+            "config": partition.config.model_dump(mode="json"),
+            "untis": untis_status(partition.store.get("untis")),
+        }
+        for partition in fleet.clocks.values()
+    ]
+
+
+@router.put("/clocks/{clock_id}")
+async def register_clock(clock_id: str, config: ClockConfig):
+    """Add or update a clock (the path's clock_id wins over the body's). Without `untis`
+    the clock keeps its saved Untis login."""
+    untis = config.untis
+    if untis is not None:
+        untis = untis.model_copy(update={"server": validate_server_url(untis.server)})
+    try:
+        config = ClockConfig(
+            **{**config.model_dump(), "clock_id": clock_id}, untis=untis
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    element = config.untis_element
+    if element.type != UntisElementType.Own and not element.name:
+        raise HTTPException(
+            status_code=400, detail=f"untis_element needs the {element.type.value}"
+        )
+    try:
+        partition, refetch = fleet.register(config)
+        if refetch:
+            scheduler.trigger("fleet_untis")
+        log(f"Registered clock {clock_id}", module="fleet")
+        return partition.config.model_dump(mode="json")
+    except Exception as e:
+        raise handle_error(e, "Failed to register clock")
+
+
+@router.delete("/clocks/{clock_id}")
+async def remove_clock(clock_id: str):
+    """Forget a clock, its Untis login and its Microsoft tokens."""
+    get_partition(clock_id)
+    try:
+        fleet.remove(clock_id)
+        log(f"Removed clock {clock_id}", module="fleet")
+        return {"status": "success", "message": f"Clock {clock_id} removed"}
+    except Exception as e:
+        raise handle_error(e, "Failed to remove clock")
+
+
+@router.get("/groups")
+async def list_groups() -> List[Dict[str, Any]]:
+    """Untis fetch groups: which clocks share a fetch, and how it went."""
+    return [group.status() for group in fleet.groups()]
+
+
+@router.get("/clocks/{clock_id}/snapshot")
+async def get_snapshot(request: Request, clock_id: str):
+    """Config, timetable and Microsoft status of one clock, 304 while unchanged."""
+    partition = get_partition(clock_id)
+    try:
+        tag = snapshot_etag(partition)
+        headers = {"ETag": tag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and matches(if_none_match, tag):
+            return Response(status_code=304, headers=headers)
+        key = (
+            "fleet.snapshot",
+            clock_id,
+            microsoft_expiry(partition),
+            datetime.date.today(),
+        )
+        response = await partition.responses.response(
+            request,
+            key,
+            partition.store.names(),
+            lambda: snapshot(partition),
+        )
+        response.headers.update(headers)
+        return response
+    except Exception as e:
+        raise handle_error(e, "Failed to get clock snapshot")
+
+
+@router.post("/clocks/{clock_id}/microsoft/login")
+async def login_microsoft(clock_id: str):
+    """Start a Microsoft device login for a clock; the token is saved once it completes."""
+    partition = get_partition(clock_id)
+    try:
+        return await fleet.start_login(partition)
+    except Exception as e:
+        raise handle_error(e, "Failed to start Microsoft login")
+
+
+@router.get("/clocks/{clock_id}/render/delta")
+async def get_render_delta(
+    clock_id: str,
+    base: Optional[str] = None,
+    chain: int = 0,
+    seconds: bool = False,
+):
+    """The clock's frame (its model, mounting and timezone) as /render/delta sends it."""
+    partition = get_partition(clock_id)
+    try:
+        config = partition.config
+        at = clock_now(config).replace(microsecond=0)
+        if not seconds:
+            at = at.replace(second=0)
+        frame = await render_frame(
+            at,
+            seconds,
+            config.model,
+            config.wallmounted,
+            partition.views,
+            partition.frames,
+        )
+        return await delta_response(frame, base, chain, partition.frames)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise handle_error(e, "Failed to render clock frame")
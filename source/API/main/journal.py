@@ -0,0 +1,363 @@
+"""Crash-safe persistence of the runtime state.
+
+Store commits are appended to a write-ahead journal (`state.journal`), one record per line:
+`<crc32 hex> <json>`. Commits of journaled fields only mark their slice dirty; the
+`state_journal` job writes the dirty slices every couple of seconds and fsyncs (in a thread),
+so a power cut loses at most that much. Once the journal grows past COMPACT_RECORDS it is
+compacted: all slices go to `state.snapshot.tmp`, which is fsynced and renamed over
+`state.snapshot`, then the journal is replaced by an empty one the same way. Replay at startup
+loads the snapshot and applies the journal on top of it, stopping at the first torn or corrupt
+record (the tail a crash left behind), so the last known timetable and tokens are back before
+any upstream call.
+
+The config slice is not journaled, config.json stays its source of truth.
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from db import store
+from startup import lazy_import
+from store import Change, Store
+from untis_api import Period, find_periods
+from util import log
+
+webuntis = lazy_import("webuntis")
+
+STATE_DIR = Path(__file__).parent
+SNAPSHOT = "state.snapshot"
+JOURNAL = "state.journal"
+# Seconds between journal flushes (the most a power cut can lose)
+FLUSH_INTERVAL = 2
+# Records after which the journal is compacted into a new snapshot
+COMPACT_RECORDS = 500
+FORMAT = 1
+
+
+# --- Slice Serialization ---
+def raw(items: List[Any]) -> List[dict]:
+    """Server data behind webuntis result objects."""
+    return [item._data for item in items]
+
+
+def dump_untis(untis) -> Dict[str, Any]:
+    return {
+        "connected": untis.connected,
+        "updated": untis.updated,
+        "days": untis.days,
+        "timetable": [period.record() for period in untis.timetable],
+        "holidays": raw(untis.holidays),
+    }
+
+
+def load_untis(store: Store, data: Dict[str, Any]) -> None:
+    # periods come back with their names, nothing needs the session that fetched them
+    timetable = [Period.from_record(period) for period in data.get("timetable", [])]
+    holidays = [
+        # holidays only read their own data, never the session
+        webuntis.objects.HolidayObject(data=holiday, parent=None, session=None)
+        for holiday in data.get("holidays", [])
+    ]
+    current_period, next_period = find_periods(timetable, datetime.datetime.now())
+    store.update(
+        "untis",
+        connected=False,  # the session itself is gone
+        updated=data.get("updated"),
+        days=data.get("days", 0),
+        timetable=timetable,
+        holidays=holidays,
+        current_period=current_period,
+        next_period=next_period,
+    )
+
+
+def dump_microsoft(microsoft) -> Dict[str, Any]:
+    # the token cache itself is persisted to SECURE_DB["cache_path"] by microsoft_api
+    return {"flow": microsoft.flow, "result": microsoft.result}
+
+
+# name: (dump, load) of the persistent part of a slice
+JOURNALED_SLICES: Dict[str, Tuple[Callable, Callable]] = {
+    "untis": (dump_untis, load_untis),
+    "microsoft": (
+        dump_microsoft,
+        lambda store, data: store.update("microsoft", **data),
+    ),
+    "network": (
+        lambda network: {"wifi_device": network.wifi_device},
+        lambda store, data: store.update("network", **data),
+    ),
+}
+
+
+# name: fields a record is written for; commits of other fields (the session, the current
+# period moving on) don't rewrite the slice. untis.updated moves on with every fetch, even of an
+# unchanged timetable: it goes into the records the other fields cause and into the snapshot
+# a clean shutdown writes, but alone it doesn't rewrite the whole timetable every minute.
+JOURNALED_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "untis": ("connected", "days", "timetable", "holidays"),
+    "microsoft": ("flow", "result"),
+    "network": ("wifi_device",),
+}
+
+
+# --- Records ---
+def encode(record: Dict[str, Any]) -> bytes:
+    payload = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return f"{zlib.crc32(payload.encode()):08x} {payload}\n".encode()
+
+
+def decode(line: bytes) -> Optional[Dict[str, Any]]:
+    """Record of a journal line, None if it is torn or corrupt."""
+    try:
+        checksum, payload = line.rstrip(b"\n").split(b" ", 1)
+        if not line.endswith(b"\n") or int(checksum, 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Replace `path` with `data` so that a crash leaves either the old or the new file."""
+    tmp = path.with_name(path.name + ".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+    fsync_dir(path.parent)
+
+
+def fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """Write-ahead journal plus snapshot of the journaled store slices."""
+
+    def __init__(self, store: Store, directory: Path = STATE_DIR):
+        self.store = store
+        self.snapshot_path = directory / SNAPSHOT
+        self.journal_path = directory / JOURNAL
+        self.dirty: set = set()
+        # per slice: serialized data last written, to skip commits of runtime-only fields
+        self.written: Dict[str, str] = {}
+        self.sequence = 0
+        self.records = 0
+        self.flushes = 0
+        self.compactions = 0
+        self.replayed = 0
+        self.discarded = 0
+        self._fd: Optional[int] = None
+        # the job writes from a thread, a shutdown may flush at the same time
+        self._lock = threading.Lock()
+
+    # --- Replay ---
+    def replay(self) -> bool:
+        """Restore the slices from the snapshot and journal. False if there was nothing."""
+        slices: Dict[str, Any] = {}
+        if self.snapshot_path.exists():
+            snapshot = decode(self.snapshot_path.read_bytes())
+            if snapshot is None or snapshot.get("format") != FORMAT:
+                log(
+                    "Discarding corrupt state snapshot",
+                    level="warning",
+                    module="journal",
+                )
+            else:
+                slices.update(snapshot["slices"])
+                self.sequence = snapshot["sequence"]
+
+        if self.journal_path.exists():
+            with open(self.journal_path, "rb") as f:
+                lines = f.readlines()
+            valid = 0
+            for line in lines:
+                record = decode(line)
+                if record is None:
+                    break
+                valid += 1
+                # records from before a compaction that crashed are in the snapshot
+                if record["sequence"] > self.sequence:
+                    slices[record["slice"]] = record["data"]
+                    self.sequence = record["sequence"]
+            self.records = valid
+            self.discarded = len(lines) - valid
+            if self.discarded:
+                # drop the torn tail so new records don't end up behind it
+                write_atomic(self.journal_path, b"".join(lines[:valid]))
+                log(
+                    f"Discarded {self.discarded} torn journal record(s)",
+                    level="warning",
+                    module="journal",
+                )
+
+        for name, data in slices.items():
+            if name not in JOURNALED_SLICES:
+                continue
+            try:
+                JOURNALED_SLICES[name][1](self.store, data)
+                self.written[name] = self.serialize(name)
+                self.replayed += 1
+            except Exception as e:
+                log(
+                    f"Failed to restore {name}: {str(e)}",
+                    level="error",
+                    module="journal",
+                )
+        log(
+            f"Restored {self.replayed} slice(s) from {self.records} journal record(s)",
+            module="journal",
+        )
+        return bool(slices)
+
+    # --- Writing ---
+    def start(self) -> None:
+        """Open the journal for appending and start tracking store commits."""
+        self._fd = os.open(
+            self.journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600
+        )
+        self.store.add_listener(self.on_change)
+
+    def close(self) -> None:
+        """Flush, compact and stop tracking commits (clean shutdown)."""
+        self.store.remove_listener(self.on_change)
+        self.flush()
+        self.compact()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def on_change(self, change: Change) -> None:
+        fields = JOURNALED_FIELDS.get(change.slice, ())
+        if any(field in fields for field in change.changed):
+            self.dirty.add(change.slice)
+
+    def serialize(self, name: str, value: Any = None) -> str:
+        dump, _ = JOURNALED_SLICES[name]
+        if value is None:
+            value = self.store.get(name)
+        return json.dumps(dump(value), sort_keys=True)
+
+    def take(self) -> Dict[str, Any]:
+        """Snapshots of the dirty slices; on the event loop, where the commits happen."""
+        if self._fd is None:
+            return {}
+        dirty, self.dirty = self.dirty, set()
+        return {name: self.store.get(name) for name in sorted(dirty)}
+
+    def flush(self) -> int:
+        """Append the dirty slices that changed and fsync. Returns the records written."""
+        return self.write(self.take())
+
+    def write(self, slices: Dict[str, Any]) -> int:
+        """Append records of the slice snapshots that changed and fsync. Only touches the
+        journal's own state, so it can run in a thread."""
+        with self._lock:
+            return self._write(slices)
+
+    def _write(self, slices: Dict[str, Any]) -> int:
+        if not slices or self._fd is None:
+            return 0
+        records = []
+        for name, value in slices.items():
+            data = self.serialize(name, value)
+            if data == self.written.get(name):
+                continue
+            self.sequence += 1
+            records.append(
+                encode(
+                    {
+                        "sequence": self.sequence,
+                        "slice": name,
+                        "time": time.time(),
+                        "data": json.loads(data),
+                    }
+                )
+            )
+            self.written[name] = data
+        if records:
+            os.write(self._fd, b"".join(records))
+            os.fsync(self._fd)
+            self.records += len(records)
+            self.flushes += 1
+        return len(records)
+
+    def compact(self, slices: Optional[Dict[str, Any]] = None) -> None:
+        """Fold the journal into a new snapshot (of `slices`, default the store's current
+        ones) and start an empty journal."""
+        with self._lock:
+            self._compact(slices)
+
+    def _compact(self, slices: Optional[Dict[str, Any]]) -> None:
+        slices = slices or {name: self.store.get(name) for name in JOURNALED_SLICES}
+        snapshot = {
+            "format": FORMAT,
+            "sequence": self.sequence,
+            "time": time.time(),
+            "slices": {
+                name: json.loads(self.serialize(name, value))
+                for name, value in slices.items()
+            },
+        }
+        write_atomic(self.snapshot_path, encode(snapshot))
+        # the snapshot covers every record, a crash from here on replays it alone
+        write_atomic(self.journal_path, b"")
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND, 0o600)
+        self.records = 0
+        self.compactions += 1
+
+    def reset(self) -> None:
+        """Delete the snapshot and journal (factory reset): nothing is replayed on the next
+        start, commits from here on go to a new, empty journal."""
+        with self._lock:
+            self.dirty.clear()
+            self.written.clear()
+            for path in (self.snapshot_path, self.journal_path):
+                path.unlink(missing_ok=True)
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = os.open(
+                    self.journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600
+                )
+            self.records = 0
+
+    async def run(self) -> None:
+        """Scheduled job: flush, and compact once the journal is long enough.
+
+        The slices are taken on the event loop, serializing and fsyncing them runs in a
+        thread so a slow SD card doesn't stall requests.
+        """
+        await asyncio.to_thread(self.write, self.take())
+        if self.records >= COMPACT_RECORDS:
+            slices = {name: self.store.get(name) for name in JOURNALED_SLICES}
+            await asyncio.to_thread(self.compact, slices)
+            log(f"Compacted state journal at {self.sequence}", module="journal")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sequence": self.sequence,
+            "records": self.records,
+            "flushes": self.flushes,
+            "compactions": self.compactions,
+            "replayed": self.replayed,
+            "discarded": self.discarded,
+        }
+
+
+journal = Journal(store)
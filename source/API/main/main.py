@@ -1,64 +1,48 @@
+import startup
+
+# first, so the imports below are timed (see /system/startup)
+startup.install_import_timer()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import asyncio
+import datetime
 import traceback
-import json
 import logging
-from enum import Enum
-from pathlib import Path
+import os
 from dataClasses import *
 from fastapi import HTTPException
 
-from microsoft_api import router as ms_router, ms_refresh_token_loop
-from untis_api import router as untis_router, untis_update_loop
+from microsoft_api import (
+    router as ms_router,
+    ms_inbox_update,
+    ms_refresh_token,
+    restore_token_cache,
+)
+from untis_api import router as untis_router, untis_update, timetable_is_fresh
 from network_api import router as network_router
 from config_api import router as config_router, load_config, save_config
-from system_api import router as system_router
-from db import DB, SECURE_DB, origins
+from system_api import router as system_router, system_status
+from events_api import router as events_router
+from dashboard_api import router as dashboard_router
+from render_api import router as render_router
+from fleet_api import router as fleet_router
+from fleet import FLEET_ENV, FLEET_MODE, fleet
+from db import store, SECURE_DB, origins
 from util import handle_error, log
-
-
-# --- Helper Functions ---
-def get_relative_path(filename: str) -> str:
-    """Get path relative to this file's directory."""
-    return Path(__file__).parent / filename
-
-
-class EnumEncoder(json.JSONEncoder):
-    """JSON encoder with enum support."""
-
-    def default(self, obj):
-        if isinstance(obj, Enum):
-            return obj.value
-        return json.JSONEncoder.default(self, obj)
-
-
-async def save_state():
-    """Save application state to file."""
-    try:
-        state = {"microsoft": DB.get("microsoft", {}), "untis": DB.get("untis", {})}
-        with open(get_relative_path("state.json"), "w") as f:
-            json.dump(state, f, cls=EnumEncoder, indent=4)
-        log("State saved successfully", module="main")
-    except Exception as e:
-        log(f"Failed to save state: {str(e)}", level="error", module="main")
-        raise RuntimeError(f"Failed to save state: {str(e)}")
-
-
-async def load_state():
-    """Load application state from file."""
-    try:
-        with open(get_relative_path("state.json"), "r") as f:
-            state = json.load(f)
-            DB["microsoft"] = state.get("microsoft", {})
-            DB["untis"] = state.get("untis", {})
-        logging.info("State loaded successfully")
-    except Exception as e:
-        tb = traceback.extract_tb(e.__traceback__)
-        filename, line_no, func, text = tb[-1]
-        error_loc = f"File: {filename}, Line: {line_no}, Function: {func}"
-        logging.error(f"Failed to load state: {str(e)} at {error_loc}")
+from scheduler import scheduler
+from shared_state import LEASE_TTL, SHARED_STATE_ENV, open_shared_state
+from warmup import warmup
+from journal import FLUSH_INTERVAL, journal
+import conditional
+from conditional import cacheable, conditional_requests
+from admission import admission_control, stats as admission_stats
+from metrics import http_metrics, registry, stats_metrics
+from render_api import renderer
+from response_cache import responses
+from singleflight import flights
+from viewmodel import views
 
 
 # --- Lifespan and App Setup ---
@@ -71,24 +55,135 @@ async def lifespan(app: FastAPI):
         # Load configuration at startup
         try:
             config = await load_config()
-            DB["config"] = config
+            store.replace("config", config)
             log("Configuration loaded successfully", module="main")
         except Exception as e:
             log(f"Failed to load configuration: {str(e)}", level="error", module="main")
-            # Continue with default config in DB
+            # Continue with the default config in the store
+
+        # Share state with the other workers, if there are any
+        if FLEET_MODE and os.environ.get(SHARED_STATE_ENV):
+            # fleet partitions live in process memory, every worker would run its own fleet
+            raise RuntimeError(
+                f"{FLEET_ENV}=1 needs a single worker, unset {SHARED_STATE_ENV}"
+            )
+        shared = open_shared_state(store, on_elected=scheduler.wake_leader_jobs)
+        if shared:
+            shared.start()
+            scheduler.is_leader = shared.is_leader
+            scheduler.add("state_sync", shared.sync, interval=1, timeout=5, backoff=1)
+            scheduler.add(
+                "leader_lease",
+                shared.keep_lease,
+                interval=LEASE_TTL / 3,
+                timeout=5,
+                backoff=1,
+                max_backoff=LEASE_TTL / 3,
+            )
+            registry.collector(
+                lambda: stats_metrics(
+                    "openclock_shared_state",
+                    "State shared between workers",
+                    shared.stats(),
+                    counters=("publishes", "pulls", "merges"),
+                )
+            )
 
-        # Start background tasks
-        ms_task = asyncio.create_task(ms_refresh_token_loop())
-        untis_task = asyncio.create_task(untis_update_loop())
+        # Restore what the last run persisted, the rest of the warm-up runs in the background
+        warmup.declare(
+            "restore_state",
+            "restore_token_cache",
+            "untis_session",
+            "untis_timetable",
+            "untis_master_data",
+            "microsoft_token",
+            "dbus",
+        )
+        await warmup.step("restore_state", journal.replay)
+        await warmup.step("restore_token_cache", restore_token_cache)
+        journal.start()
+        warmup.is_leader = lambda: scheduler.is_leader()
+        scheduler.add(
+            "state_journal",
+            journal.run,
+            interval=FLUSH_INTERVAL,
+            timeout=10,
+            backoff=FLUSH_INTERVAL,
+            max_backoff=60,
+            leader_only=True,  # one writer for the journal files
+        )
+        scheduler.once("warmup", warmup.run, delay=0, timeout=120, backoff=60)
 
+        # Start background jobs; the warm-up does their first run
+        scheduler.add(
+            "ms_token_refresh",
+            ms_refresh_token,
+            interval=3600,
+            delay=3600,
+            jitter=60,
+            timeout=60,
+            backoff=60,
+            max_backoff=3600,
+            leader_only=True,
+        )
+        scheduler.add(
+            "ms_inbox_update",
+            ms_inbox_update,
+            interval=300,
+            delay=30,
+            jitter=30,
+            timeout=60,
+            backoff=60,
+            max_backoff=1800,
+            leader_only=True,
+        )
+        scheduler.add(
+            "untis_update",
+            untis_update,
+            interval=60,
+            delay=60,
+            jitter=5,
+            timeout=120,
+            backoff=60,
+            max_backoff=300,
+            leader_only=True,
+        )
+        if FLEET_MODE:
+            fleet.load()
+            scheduler.add(
+                "fleet_untis",
+                fleet.sync_untis,
+                interval=60,
+                jitter=5,
+                timeout=120,
+                backoff=60,
+                max_backoff=300,
+            )
+            scheduler.add(
+                "fleet_ms_refresh",
+                fleet.refresh_tokens,
+                interval=3600,
+                delay=5,
+                jitter=60,
+                timeout=600,
+                backoff=60,
+                max_backoff=3600,
+            )
+        scheduler.once(
+            "preload_integrations", startup.preload, delay=1, timeout=300, backoff=60
+        )
+        scheduler.start()
+
+        startup.uninstall_import_timer()
+        startup.mark("lifespan_ready")
         yield
 
         log("Shutting down application", module="main")
         # Save final state
         try:
-            if DB.get("config"):
-                await save_config(DB["config"])
-            await save_state()
+            await save_config(store.get("config"))
+            if scheduler.is_leader():
+                journal.close()
             log("Application state saved", module="main")
         except Exception as e:
             log(
@@ -97,15 +192,11 @@ async def lifespan(app: FastAPI):
                 module="main",
             )
 
-        # Cleanup tasks
-        for task in [ms_task, untis_task]:
-            task.cancel()
-            try:
-                await task
-            except asyncio.CancelledError:
-                pass
-            except Exception as e:
-                log(f"Task cleanup error: {str(e)}", level="error", module="main")
+        # Stop background jobs
+        await scheduler.stop()
+        if shared:
+            await shared.drain()
+            shared.close()
 
     except Exception as e:
         log(f"Lifespan error: {str(e)}", level="error", module="main")
@@ -131,7 +222,12 @@ try:
         (network_router, "Network API"),
         (config_router, "Config API"),
         (system_router, "System API"),
+        (events_router, "Events API"),
+        (dashboard_router, "Dashboard API"),
+        (render_router, "Render API"),
     ]
+    if FLEET_MODE:
+        routers.append((fleet_router, "Fleet API"))
 
     for router, name in routers:
         try:
@@ -151,14 +247,163 @@ except Exception as e:
     raise RuntimeError(f"App initialization error: {str(e)} at {error_loc}")
 
 
+# ETag/304 for endpoints whose body only depends on the store
+cacheable("/config/", slices=("config",))
+cacheable("/config/get", slices=("config",))
+cacheable("/config/getTimezones", max_age=86400)
+cacheable(
+    "/untis/timetable",
+    slices=("untis",),
+    extra=datetime.date.today,
+    fresh=lambda request: timetable_is_fresh(
+        int(request.query_params.get("dayRange", 10))
+    ),
+)
+cacheable(
+    "/status",
+    slices=("config",),
+    extra=warmup.fingerprint,
+)
+# the last one added runs first: 304s don't wait for a slot
+app.middleware("http")(admission_control)
+app.middleware("http")(conditional_requests)
+
+startup.mark("app_imported")
+
+
+@app.middleware("http")
+async def record_first_response(request, call_next):
+    """Record when the first request was answered (cold-start profiling)."""
+    response = await call_next(request)
+    startup.first_response()
+    return response
+
+
+# outermost: also counts 304s and shed requests
+app.middleware("http")(http_metrics)
+
+
+# --- Metrics read from the modules that keep them (at /system/metrics) ---
+@registry.collector
+def job_metrics():
+    return stats_metrics(
+        "openclock_job",
+        "Background jobs",
+        {
+            job.name: {
+                "runs": job.runs,
+                "failures": job.failures,
+                "restarts": job.restarts,
+                "consecutive_failures": job.consecutive_failures,
+                "running": job.running,
+                "last_run_timestamp_seconds": job.last_start,
+            }
+            for job in scheduler.jobs()
+        },
+        counters=("runs", "failures", "restarts"),
+        label="job",
+    )
+
+
+@registry.collector
+def cache_metrics():
+    return [
+        *stats_metrics(
+            "openclock_response_cache",
+            "Pre-serialized responses",
+            responses.stats(),
+            counters=("hits", "misses"),
+        ),
+        *stats_metrics(
+            "openclock_conditional",
+            "Conditional requests",
+            {"not_modified": conditional.hits},
+            counters=("not_modified",),
+        ),
+        *stats_metrics(
+            "openclock_render",
+            "Rendered frames",
+            renderer.stats(),
+            counters=("renders", "hits", "keyframes", "deltas"),
+        ),
+        *stats_metrics(
+            "openclock_view_model",
+            "Display view model",
+            views.stats(),
+            counters=("builds", "hits"),
+        ),
+        *stats_metrics(
+            "openclock_single_flight",
+            "Deduplicated upstream calls",
+            flights.stats(),
+            counters=("calls", "shared"),
+        ),
+        *stats_metrics(
+            "openclock_admission",
+            "Admission control",
+            admission_stats(),
+            counters=("admitted", "shed"),
+            label="route",
+        ),
+    ]
+
+
+@registry.collector
+def state_metrics():
+    untis = store.get("untis")
+    microsoft = store.get("microsoft")
+    metrics = [
+        *stats_metrics(
+            "openclock_state",
+            "State store",
+            {name: {"version": version} for name, version in store.versions().items()},
+            label="slice",
+        ),
+        *stats_metrics(
+            "openclock_state",
+            "State store",
+            {
+                "sequence": store.sequence(),
+                "timetable_periods": len(untis.timetable),
+                "holidays": len(untis.holidays),
+                "untis_connected": untis.connected,
+                "microsoft_logged_in": bool(microsoft.result),
+                "messages": len(microsoft.messages),
+                "notifications": len(microsoft.notifications),
+                "access_points": len(store.get("network").access_points),
+            },
+        ),
+        *stats_metrics(
+            "openclock_journal",
+            "State journal",
+            journal.stats(),
+            counters=("records", "flushes", "compactions", "replayed", "discarded"),
+        ),
+        *stats_metrics(
+            "openclock_process",
+            "Process",
+            {
+                "start_time_seconds": startup.PROCESS_START,
+                "uptime_seconds": startup.since_start(),
+                "metrics_collector_errors": registry.collector_errors,
+            },
+            counters=("metrics_collector_errors",),
+        ),
+    ]
+    if FLEET_MODE:
+        metrics += stats_metrics(
+            "openclock_fleet",
+            "Fleet mode",
+            fleet.stats(),
+            counters=("fetches", "failures", "renders", "keyframes", "deltas"),
+        )
+    return metrics
+
+
 @app.get("/status", tags=["System"])
-async def get_status() -> Dict[str, Union[bool, str]]:
-    """Get system status."""
+async def get_status() -> Dict[str, Any]:
+    """Get system status, including the startup warm-up progress."""
     try:
-        return {
-            "setup": DB["config"].setup,
-            "model": DB["config"].model,
-            "wallmounted": DB["config"].wallmounted,
-        }
+        return system_status()
     except Exception as e:
         raise handle_error(e, "Failed to get system status")
@@ -0,0 +1,296 @@
+"""Prometheus metrics of the API and its background loops.
+
+Counters, gauges and histograms are dicts keyed by label values, updated inline by the code
+they measure: a dict lookup and an add, all on the event loop (upstream calls are timed around
+the await, not inside the worker thread). What other modules already count (scheduler jobs,
+caches, the store, the journal) is read by collectors when /system/metrics is scraped instead
+of being counted twice. The output is the Prometheus text exposition format (0.0.4).
+"""
+
+import bisect
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from fastapi import Request
+from starlette.routing import Match
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; the Pi answers cached endpoints in milliseconds, upstream logins take seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """One metric family: name, help, label names and a value per label combination."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{self.label_text(key)} {format_value(value)}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self.key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels: object) -> None:
+        """For collectors exporting a count kept elsewhere."""
+        self._values[self.key(labels)] = value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels: object) -> None:
+        self._values[self.key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self.key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # label key -> [count per bucket (not cumulative), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self.key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = f'le="{format_value(bound)}"'
+                yield f"{self.name}_bucket{self.label_text(key, le)} {cumulative}"
+            yield f"{self.name}_sum{self.label_text(key)} {format_value(total)}"
+            yield f"{self.name}_count{self.label_text(key)} {count}"
+
+
+class Registry:
+    """The instrumented metrics plus collectors producing metrics at scrape time."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Metric]]] = []
+        self.collector_errors = 0
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collector(self, func: Callable[[], Iterable[Metric]]):
+        """Register `func`, called on every scrape; usable as a decorator."""
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        metrics = list(self._metrics)
+        for collect in self._collectors:
+            try:
+                metrics.extend(collect())
+            except Exception:
+                # one broken source must not take the whole scrape down
+                self.collector_errors += 1
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+# --- Instrumented Metrics ---
+http_requests = registry.counter(
+    "openclock_http_requests_total",
+    "HTTP requests answered, by route template and status",
+    ("method", "route", "status"),
+)
+http_duration = registry.histogram(
+    "openclock_http_request_duration_seconds",
+    "Time to answer an HTTP request",
+    ("method", "route"),
+)
+http_in_progress = registry.gauge(
+    "openclock_http_requests_in_progress", "HTTP requests being answered"
+)
+upstream_calls = registry.counter(
+    "openclock_upstream_calls_total",
+    "Calls to Untis, Microsoft, D-Bus and subprocesses, by outcome",
+    ("service", "operation", "outcome"),
+)
+upstream_duration = registry.histogram(
+    "openclock_upstream_duration_seconds",
+    "Duration of calls to Untis, Microsoft, D-Bus and subprocesses",
+    ("service", "operation"),
+)
+job_duration = registry.histogram(
+    "openclock_job_duration_seconds", "Duration of background job runs", ("job",)
+)
+
+
+class upstream:
+    """Time a call to an external service: `with upstream("untis", "login"): ...`.
+
+    An exception leaving the block counts as outcome "error", `fail()` marks calls that
+    report failure without raising.
+    """
+
+    def __init__(self, service: str, operation: str):
+        self.service = service
+        self.operation = operation
+        self.failed = False
+
+    def fail(self) -> None:
+        self.failed = True
+
+    def __enter__(self) -> "upstream":
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        upstream_duration.observe(
+            time.monotonic() - self._started,
+            service=self.service,
+            operation=self.operation,
+        )
+        outcome = "error" if exc_type is not None or self.failed else "ok"
+        upstream_calls.inc(
+            service=self.service, operation=self.operation, outcome=outcome
+        )
+        return False
+
+    # also an async context manager, to share an `async with` with the request it times
+    async def __aenter__(self) -> "upstream":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return self.__exit__(exc_type, exc, tb)
+
+
+def route_of(request: Request) -> str:
+    """Route template of a request (bounded label values, e.g. /fleet/clocks/{clock_id})."""
+    route = request.scope.get("route")
+    if route is None:
+        # answered before routing (304s, shed requests): find the route it would have hit
+        for candidate in request.app.router.routes:
+            match, _ = candidate.matches(request.scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", None) or "unmatched"
+
+
+async def http_metrics(request: Request, call_next):
+    """Count and time every HTTP request by route template."""
+    started = time.monotonic()
+    http_in_progress.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        http_in_progress.dec()
+        route = route_of(request)
+        http_duration.observe(
+            time.monotonic() - started, method=request.method, route=route
+        )
+        http_requests.inc(method=request.method, route=route, status=status)
+
+
+def stats_metrics(
+    prefix: str,
+    help: str,
+    stats: Dict[str, object],
+    counters: Iterable[str] = (),
+    label: Optional[str] = None,
+) -> List[Metric]:
+    """Metrics from a stats() dict: `counters` keys become <prefix>_<key>_total counters,
+    the other numeric keys <prefix>_<key> gauges. With `label`, `stats` maps values of that
+    label to stats dicts, one series each."""
+    counters = set(counters)
+    rows = stats if label else {None: stats}
+    families: Dict[str, Metric] = {}
+    for label_value, row in rows.items():
+        for key, value in row.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue  # None (never happened yet) or not a number
+            metric = families.get(key)
+            if metric is None:
+                labels = (label,) if label else ()
+                if key in counters:
+                    metric = Counter(f"{prefix}_{key}_total", f"{help}: {key}", labels)
+                else:
+                    metric = Gauge(f"{prefix}_{key}", f"{help}: {key}", labels)
+                families[key] = metric
+            metric.set(value, **({label: label_value} if label else {}))
+    return list(families.values())
@@ -1,28 +1,72 @@
 from fastapi import APIRouter, HTTPException
-import msal
 import logging
 import time
 import asyncio
-import aiohttp
 import traceback
-from typing import List, Dict, Union, Optional
-from db import DB, SECURE_DB
+import os
+from pathlib import Path
+from typing import Any, List, Dict, Union, Optional
+from db import store, SECURE_DB
 from dataClasses import EmailMessage
 from util import log
+from metrics import upstream
+from startup import lazy_import
+from singleflight import single_flight
+
+msal = lazy_import("msal")
+aiohttp = lazy_import("aiohttp")
 
 router = APIRouter(prefix="/microsoft", tags=["Microsoft"])
 
 
+def get_token_cache():
+    """MSAL token cache of the microsoft slice, created on first use."""
+    microsoft = store.get("microsoft")
+    if microsoft.token_cache is None:
+        cache = msal.SerializableTokenCache()
+        microsoft = store.update("microsoft", token_cache=cache)
+    return microsoft.token_cache
+
+
+def restore_token_cache() -> bool:
+    """Load the token cache saved by a previous run."""
+    path = Path(SECURE_DB["cache_path"])
+    if not path.exists():
+        return False
+    get_token_cache().deserialize(path.read_text())
+    return True
+
+
+def save_token_cache() -> None:
+    """Persist the token cache if it changed, readable by the API user only."""
+    cache = get_token_cache()
+    if not cache.has_state_changed:
+        return
+    path = Path(SECURE_DB["cache_path"])
+    tmp = path.with_suffix(".tmp")
+    with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        f.write(cache.serialize())
+    os.replace(tmp, path)
+    cache.has_state_changed = False
+
+
+def build_msal_app(token_cache):
+    """MSAL application on `token_cache`; blocking, it looks up the authority."""
+    return msal.PublicClientApplication(
+        client_id=SECURE_DB["client_id"],
+        authority=SECURE_DB["authority"],
+        token_cache=token_cache,
+    )
+
+
 def init_msal_app():
     """Initialize MSAL application."""
     try:
-        if "ms_app" not in DB or not DB["ms_app"]:
-            DB["ms_app"] = msal.PublicClientApplication(
-                client_id=SECURE_DB["client_id"],
-                authority=SECURE_DB["authority"],
-                token_cache=DB["token_cache"],
-            )
-        return DB["ms_app"]
+        microsoft = store.get("microsoft")
+        if not microsoft.app:
+            app = build_msal_app(get_token_cache())
+            microsoft = store.update("microsoft", app=app)
+        return microsoft.app
     except Exception as e:
         tb = traceback.extract_tb(e.__traceback__)
         filename, line_no, func, text = tb[-1]
@@ -31,6 +75,17 @@ def init_msal_app():
         raise RuntimeError(f"MSAL initialization failed: {str(e)} at {error_loc}")
 
 
+async def load_msal_app():
+    """init_msal_app() with the app built in a thread; the store is only updated on the
+    event loop, where its listeners and subscribers live."""
+    microsoft = store.get("microsoft")
+    if microsoft.app:
+        return microsoft.app
+    app = await asyncio.to_thread(build_msal_app, get_token_cache())
+    # a concurrent caller may have stored one in the meantime
+    return store.get("microsoft").app or store.update("microsoft", app=app).app
+
+
 @router.post("/client-id")
 async def set_client_id(client_id: str):
     """Set Microsoft client ID."""
@@ -80,10 +135,11 @@ async def initiate_ms_login(force: bool = False):
     """Start Microsoft login flow or return existing token/flow info."""
     try:
         # Check if we have a valid token and force is not requested
-        if not force and DB.get("ms_result") and DB["ms_result"].get("access_token"):
-            accounts = DB["ms_app"].get_accounts() if DB.get("ms_app") else []
+        microsoft = store.get("microsoft")
+        if not force and microsoft.result and microsoft.result.get("access_token"):
+            accounts = microsoft.app.get_accounts() if microsoft.app else []
             if accounts:
-                expires_on = DB["ms_result"].get("expires_on", 0)
+                expires_on = microsoft.result.get("expires_on", 0)
                 current_time = time.time()
                 time_left = max(0, expires_on - current_time)
 
@@ -92,27 +148,28 @@ async def initiate_ms_login(force: bool = False):
                     "account": accounts[0].get("username", "Unknown"),
                     "expires_at": expires_on,
                     "time_left_seconds": int(time_left),
-                    "scopes": DB["ms_result"].get("scope", []),
+                    "scopes": microsoft.result.get("scope", []),
                 }
 
         # Check for existing valid device flow before creating new one
-        if not force and DB.get("ms_flow"):
+        if not force and microsoft.flow:
             current_time = time.time()
-            flow_expires = DB["ms_flow"].get("expires_at", 0)
+            flow_expires = microsoft.flow.get("expires_at", 0)
 
             if current_time < flow_expires:
                 log("Returning existing device flow", module="microsoft")
                 return {
                     "status": "login_required",
-                    "verification_uri": DB["ms_flow"]["verification_uri"],
-                    "user_code": DB["ms_flow"]["user_code"],
-                    "message": DB["ms_flow"]["message"],
+                    "verification_uri": microsoft.flow["verification_uri"],
+                    "user_code": microsoft.flow["user_code"],
+                    "message": microsoft.flow["message"],
                     "expires_at": int(flow_expires),
                 }
 
         # Only create new flow if forced or no valid flow exists
         app = init_msal_app()
-        flow = app.initiate_device_flow(scopes=SECURE_DB["scopes"])
+        with upstream("microsoft", "device_flow"):
+            flow = app.initiate_device_flow(scopes=SECURE_DB["scopes"])
         if "user_code" not in flow:
             log("Failed to create device flow", level="error", module="microsoft")
             raise ValueError("Failed to create device flow")
@@ -122,9 +179,9 @@ async def initiate_ms_login(force: bool = False):
 
         # Clear existing token if forcing new login
         if force:
-            DB["ms_result"] = None
+            store.update("microsoft", result=None)
 
-        DB["ms_flow"] = flow
+        store.update("microsoft", flow=flow)
         log("Created new device flow", module="microsoft")
 
         return {
@@ -144,113 +201,155 @@ async def initiate_ms_login(force: bool = False):
 async def get_ms_accounts() -> List[Dict]:
     """Get all Microsoft accounts from cache."""
     try:
-        accounts = DB["ms_app"].get_accounts()
+        accounts = store.get("microsoft").app.get_accounts()
         return accounts if accounts else []
     except Exception as e:
         log(f"Failed to get accounts: {e}")
         return []
 
 
+@single_flight("microsoft.device_flow_token")
+async def device_flow_token() -> Optional[Dict[str, Any]]:
+    """Complete the pending device flow, shared by concurrent callers.
+
+    MSAL polls until the user signed in or the flow expired, which can take minutes, so it
+    runs in a thread. Only a result with a token is stored; None if there is none.
+    """
+    flow = store.get("microsoft").flow
+    app = await load_msal_app()
+    with upstream("microsoft", "device_flow_token") as call:
+        result = await asyncio.to_thread(app.acquire_token_by_device_flow, flow)
+        if "access_token" not in result:
+            call.fail()
+    if store.get("microsoft").flow is not flow:
+        return None  # a newer login replaced this one
+    if "access_token" not in result:
+        store.update("microsoft", flow=None)
+        log(
+            f"Microsoft login failed: "
+            f"{result.get('error_description', result.get('error'))}",
+            level="warning",
+            module="microsoft",
+        )
+        return None
+    accounts = await asyncio.to_thread(app.get_accounts)
+    store.update("microsoft", result=result, flow=None, accounts=accounts)
+    save_token_cache()
+    return result
+
+
+@single_flight("microsoft.messages")
+async def fetch_messages():
+    """Fetch messages from Microsoft Graph, shared by concurrent callers."""
+    # Check if we have a token or an active device flow
+    microsoft = store.get("microsoft")
+    if not microsoft.result and not microsoft.flow:
+        log("No active authentication flow")
+        raise HTTPException(status_code=401, detail="No active authentication flow")
+
+    # Attempt to acquire token if not present
+    result = microsoft.result or await device_flow_token()
+    if not result:
+        raise HTTPException(status_code=401, detail="Authentication not completed")
+
+    headers = {"Authorization": f'Bearer {result["access_token"]}'}
+
+    async with aiohttp.ClientSession() as session:
+        # a 401 or an invalid body raises inside the block: counted as an error
+        async with upstream("graph", "messages"), session.get(
+            f'{SECURE_DB["graph_endpoint"]}/me/messages', headers=headers
+        ) as response:
+            data = await response.json()
+
+            if response.status == 401:
+                store.update("microsoft", result=None)  # Clear invalid token
+                log("Token expired")
+                raise HTTPException(status_code=401, detail="Token expired")
+
+            if "value" not in data:
+                log("Invalid response")
+                raise HTTPException(status_code=500, detail="Invalid response")
+
+            messages = []
+            for msg in data["value"]:
+                messages.append(
+                    EmailMessage(
+                        subject=msg.get("subject", ""),
+                        from_email=msg.get("from", {})
+                        .get("emailAddress", {})
+                        .get("address", ""),
+                        received_date=msg.get("receivedDateTime", ""),
+                        body=msg.get("body", {}).get("content", ""),
+                    )
+                )
+            store.update(
+                "microsoft",
+                messages=[message.model_dump() for message in messages],
+                inbox_updated=time.time(),
+            )
+            return messages
+
+
 @router.get("/messages")
 async def get_ms_messages():
     """Get messages from Microsoft Graph."""
     try:
-        # Check if we have an active device flow
-        if "ms_flow" not in DB or not DB["ms_flow"]:
-            log("No active authentication flow")
-            raise HTTPException(status_code=401, detail="No active authentication flow")
-
-        # Attempt to acquire token if not present
-        if not DB.get("ms_result"):
-            app = init_msal_app()
-            DB["ms_result"] = app.acquire_token_by_device_flow(DB["ms_flow"])
-            if not DB["ms_result"]:
-                raise HTTPException(
-                    status_code=401, detail="Authentication not completed"
-                )
-
-        headers = {"Authorization": f'Bearer {DB["ms_result"]["access_token"]}'}
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f'{SECURE_DB["graph_endpoint"]}/me/messages', headers=headers
-            ) as response:
-                data = await response.json()
-
-                if response.status == 401:
-                    DB["ms_result"] = None  # Clear invalid token
-                    log("Token expired")
-                    raise HTTPException(status_code=401, detail="Token expired")
-
-                if "value" not in data:
-                    log("Invalid response")
-                    raise HTTPException(status_code=500, detail="Invalid response")
-
-                messages = []
-                for msg in data["value"]:
-                    messages.append(
-                        EmailMessage(
-                            subject=msg.get("subject", ""),
-                            from_email=msg.get("from", {})
-                            .get("emailAddress", {})
-                            .get("address", ""),
-                            received_date=msg.get("receivedDateTime", ""),
-                            body=msg.get("body", {}).get("content", ""),
-                        )
-                    )
-                return messages
-
+        return await fetch_messages()
     except Exception as e:
         log(f"Failed to get messages: {e}")
         return []
 
 
+@single_flight("microsoft.notifications")
+async def fetch_notifications():
+    """Fetch notifications from Microsoft Graph, shared by concurrent callers."""
+    # Check if we have a token or an active device flow
+    microsoft = store.get("microsoft")
+    if not microsoft.result and not microsoft.flow:
+        log("No active authentication flow")
+        raise HTTPException(status_code=401, detail="No active authentication flow")
+
+    # Attempt to acquire token if not present
+    result = microsoft.result or await device_flow_token()
+    if not result:
+        raise HTTPException(status_code=401, detail="Authentication not completed")
+
+    headers = {"Authorization": f'Bearer {result["access_token"]}'}
+
+    async with aiohttp.ClientSession() as session:
+        # a 401 or an invalid body raises inside the block: counted as an error
+        async with upstream("graph", "notifications"), session.get(
+            f'{SECURE_DB["graph_endpoint"]}/me/notifications', headers=headers
+        ) as response:
+            data = await response.json()
+
+            if response.status == 401:
+                store.update("microsoft", result=None)  # Clear invalid token
+                raise HTTPException(status_code=401, detail="Token expired")
+
+            if "value" not in data:
+                raise HTTPException(status_code=500, detail="Invalid response")
+
+            notifications = []
+            for notification in data["value"]:
+                notifications.append(
+                    {
+                        "title": notification.get("title", ""),
+                        "body": notification.get("body", ""),
+                        "receivedDateTime": notification.get("receivedDateTime", ""),
+                    }
+                )
+            store.update(
+                "microsoft", notifications=notifications, inbox_updated=time.time()
+            )
+            return notifications
+
+
 @router.get("/notifications")
 async def get_ms_notifications():
     """Get notifications from Microsoft Graph."""
     try:
-        # Check if we have an active device flow
-        if "ms_flow" not in DB or not DB["ms_flow"]:
-            log("No active authentication flow")
-            raise HTTPException(status_code=401, detail="No active authentication flow")
-
-        # Attempt to acquire token if not present
-        if not DB.get("ms_result"):
-            app = init_msal_app()
-            DB["ms_result"] = app.acquire_token_by_device_flow(DB["ms_flow"])
-            if not DB["ms_result"]:
-                raise HTTPException(
-                    status_code=401, detail="Authentication not completed"
-                )
-
-        headers = {"Authorization": f'Bearer {DB["ms_result"]["access_token"]}'}
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f'{SECURE_DB["graph_endpoint"]}/me/notifications', headers=headers
-            ) as response:
-                data = await response.json()
-
-                if response.status == 401:
-                    DB["ms_result"] = None  # Clear invalid token
-                    raise HTTPException(status_code=401, detail="Token expired")
-
-                if "value" not in data:
-                    raise HTTPException(status_code=500, detail="Invalid response")
-
-                notifications = []
-                for notification in data["value"]:
-                    notifications.append(
-                        {
-                            "title": notification.get("title", ""),
-                            "body": notification.get("body", ""),
-                            "receivedDateTime": notification.get(
-                                "receivedDateTime", ""
-                            ),
-                        }
-                    )
-                return notifications
-
+        return await fetch_notifications()
     except Exception as e:
         log(f"Failed to get notifications: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -276,9 +375,16 @@ async def logout_ms_account():
                 )
 
         # Clear all session data
-        DB["ms_result"] = None
-        DB["ms_flow"] = None
-        DB["account"] = None
+        store.update(
+            "microsoft",
+            result=None,
+            flow=None,
+            accounts=None,
+            messages=[],
+            notifications=[],
+            inbox_updated=None,
+        )
+        save_token_cache()
 
         log(
             f"Logout completed, removed {accounts_removed} accounts", module="microsoft"
@@ -293,40 +399,98 @@ async def logout_ms_account():
         return {"status": "error", "message": f"Logout failed: {str(e)}"}
 
 
-async def ms_refresh_token_loop():
-    """Background task to refresh Microsoft token."""
-    while True:
-        try:
-            if DB["ms_result"]:
-                accounts = DB["ms_app"].get_accounts()
-                if accounts:
-                    chosen = accounts[0]
-                    result = DB["ms_app"].acquire_token_silent(
-                        scopes=SECURE_DB["scopes"], account=chosen
-                    )
-                    if result:
-                        DB["ms_result"] = result
-                        logging.info("MS token refreshed")
-        except Exception as e:
-            log(f"MS token refresh error: {e}")
-        await asyncio.sleep(3600)
+async def acquire_token_silently() -> bool:
+    """Get a token for the first cached account without user interaction."""
+    if not get_token_cache().find("Account"):
+        return False  # nobody logged in, no need to contact Microsoft
+    app = await load_msal_app()
+    accounts = await asyncio.to_thread(app.get_accounts)
+    if not accounts:
+        return False
+    with upstream("microsoft", "token_refresh") as call:
+        result = await asyncio.to_thread(
+            app.acquire_token_silent, scopes=SECURE_DB["scopes"], account=accounts[0]
+        )
+        if not result:
+            call.fail()
+    if not result:
+        return False
+    store.update("microsoft", result=result, accounts=accounts)
+    save_token_cache()
+    return True
+
+
+async def ms_refresh_token():
+    """Scheduled job: refresh the Microsoft token silently. Raises on failure."""
+    if not store.get("microsoft").result or not get_token_cache().find("Account"):
+        return  # nobody logged in
+    if not await acquire_token_silently():
+        raise RuntimeError("Microsoft token refresh failed without user interaction")
+    log("MS token refreshed", module="microsoft")
+
+
+async def ms_inbox_update():
+    """Scheduled job: keep messages and notifications current for the display."""
+    if not store.get("microsoft").result:
+        return
+    messages, notifications = await asyncio.gather(
+        fetch_messages(), fetch_notifications()
+    )
+    log(
+        f"Fetched {len(messages)} messages and {len(notifications)} notifications",
+        module="microsoft",
+    )
+
+
+def device_flow_status() -> Dict[str, Union[bool, Optional[float]]]:
+    """Whether a device flow is waiting for the user (also part of the dashboard)."""
+    flow = store.get("microsoft").flow
+    if flow:
+        # Check if flow has expired
+        expires_at = flow.get("expires_at", 0)
+        current_time = time.time()
+        is_active = expires_at > current_time
+
+        return {
+            "active": is_active,
+            "expires_at": expires_at if is_active else None,
+        }
+    return {"active": False, "expires_at": None}
+
+
+def login_status() -> Dict[str, Any]:
+    """What /login would report, without starting a device flow.
+
+    No time_left_seconds, so the result only changes with the state; use expires_at.
+    """
+    microsoft = store.get("microsoft")
+    result = microsoft.result or {}
+    if result.get("access_token"):
+        expires_on = result.get("expires_on", 0)
+        accounts = microsoft.accounts or []
+        return {
+            "status": "authenticated",
+            "account": accounts[0].get("username", "Unknown") if accounts else None,
+            "expires_at": expires_on,
+            "scopes": result.get("scope", []),
+        }
+    flow = microsoft.flow
+    if flow and flow.get("expires_at", 0) > time.time():
+        return {
+            "status": "login_required",
+            "verification_uri": flow["verification_uri"],
+            "user_code": flow["user_code"],
+            "message": flow["message"],
+            "expires_at": int(flow["expires_at"]),
+        }
+    return {"status": "logged_out"}
 
 
 @router.get("/device-flow-status")
 async def get_device_flow_status() -> Dict[str, Union[bool, Optional[float]]]:
     """Check if there is an active device flow."""
     try:
-        if "ms_flow" in DB and DB["ms_flow"]:
-            # Check if flow has expired
-            expires_at = DB["ms_flow"].get("expires_at", 0)
-            current_time = time.time()
-            is_active = expires_at > current_time
-
-            return {
-                "active": is_active,
-                "expires_at": expires_at if is_active else None,
-            }
-        return {"active": False, "expires_at": None}
+        return device_flow_status()
     except Exception as e:
         log(f"Failed to get device flow status: {e}")
         return {"active": False, "expires_at": None}
@@ -1,16 +1,23 @@
 from fastapi import APIRouter, HTTPException
-import dbus
 import asyncio
 import logging
 import time
 import traceback
 from typing import List, Dict
 from dataClasses import NetworkCredentials
-from db import DB
+from db import store
 from util import log
+from metrics import upstream
+from startup import lazy_import
+from singleflight import single_flight
+
+dbus = lazy_import("dbus")
 
 router = APIRouter(prefix="/network", tags=["Network"])
 
+# Seconds a scan result is reused by the dashboard
+ACCESS_POINTS_MAX_AGE = 30
+
 
 def handle_error(e: Exception, message: str) -> HTTPException:
     """Utility function for consistent error handling."""
@@ -24,13 +31,31 @@ def handle_error(e: Exception, message: str) -> HTTPException:
 def init_dbus():
     """Initialize DBus connection."""
     try:
-        if "bus" not in DB or not DB["bus"]:
-            DB["bus"] = dbus.SystemBus()
-        return DB["bus"]
+        network = store.get("network")
+        if not network.bus:
+            network = store.update("network", bus=dbus.SystemBus())
+        return network.bus
     except Exception as e:
         raise handle_error(e, "Failed to initialize DBus")
 
 
+def find_wifi_device(bus):
+    """Object path of the first WiFi device, None if there is none (blocking D-Bus calls)."""
+    nm = bus.get_object(
+        "org.freedesktop.NetworkManager", "/org/freedesktop/NetworkManager"
+    )
+    nm_props = dbus.Interface(nm, "org.freedesktop.DBus.Properties")
+    devices = nm_props.Get("org.freedesktop.NetworkManager", "AllDevices")
+
+    for device_path in devices:
+        device = bus.get_object("org.freedesktop.NetworkManager", device_path)
+        props = dbus.Interface(device, "org.freedesktop.DBus.Properties")
+        device_type = props.Get("org.freedesktop.NetworkManager.Device", "DeviceType")
+        if device_type == 2:  # WiFi device
+            return device_path
+    return None
+
+
 def get_wifi_device():
     """Get WiFi device with error handling."""
     try:
@@ -38,26 +63,35 @@ def get_wifi_device():
         if not bus:
             raise ValueError("DBus not initialized")
 
-        nm = bus.get_object(
-            "org.freedesktop.NetworkManager", "/org/freedesktop/NetworkManager"
-        )
-        nm_props = dbus.Interface(nm, "org.freedesktop.DBus.Properties")
-        devices = nm_props.Get("org.freedesktop.NetworkManager", "AllDevices")
-
-        for device_path in devices:
-            device = bus.get_object("org.freedesktop.NetworkManager", device_path)
-            props = dbus.Interface(device, "org.freedesktop.DBus.Properties")
-            device_type = props.Get(
-                "org.freedesktop.NetworkManager.Device", "DeviceType"
-            )
-            if device_type == 2:  # WiFi device
-                return device_path
+        device_path = find_wifi_device(bus)
+        if device_path is not None:
+            store.update("network", wifi_device=str(device_path))
+            return device_path
         log("No WiFi device found")
     except Exception as e:
         log(f"Failed to get WiFi device: {str(e)}")
         return None
 
 
+async def load_wifi_device():
+    """init_dbus() and get_wifi_device() for the warm-up: the D-Bus calls run in a thread,
+    the store is updated on the event loop (its listeners and subscribers live there).
+    """
+    network = store.get("network")
+    bus = network.bus or await asyncio.to_thread(dbus.SystemBus)
+    store.update("network", bus=bus)
+    try:
+        device_path = await asyncio.to_thread(find_wifi_device, bus)
+    except Exception as e:
+        log(f"Failed to get WiFi device: {str(e)}")
+        return None
+    if device_path is None:
+        log("No WiFi device found")
+        return None
+    store.update("network", wifi_device=str(device_path))
+    return device_path
+
+
 @router.get("/scan", response_model=List[Dict[str, str]])
 async def scan_networks():
     """Scan for available WiFi networks."""
@@ -72,67 +106,87 @@ async def scan_networks():
         return []
 
 
-@router.get("/access-points")
-async def get_access_points():
-    """Get available WiFi access points and check if connected."""
-    try:
-        log("Starting access point scan", module="network")
-        bus = init_dbus()
+@single_flight("network.access_points")
+async def scan_access_points():
+    """Scan for access points, shared by concurrent callers."""
+    log("Starting access point scan", module="network")
+    bus = init_dbus()
 
-        device_path = get_wifi_device()
-        if not device_path:
-            log("No WiFi device found", level="error", module="network")
-            raise HTTPException(status_code=404, detail="No WiFi device found")
+    device_path = get_wifi_device()
+    if not device_path:
+        log("No WiFi device found", level="error", module="network")
+        raise HTTPException(status_code=404, detail="No WiFi device found")
 
-        # Create device object and interface
-        device = bus.get_object("org.freedesktop.NetworkManager", device_path)
-        wifi_interface = dbus.Interface(
-            device, "org.freedesktop.NetworkManager.Device.Wireless"
-        )
-        device_props = dbus.Interface(device, "org.freedesktop.DBus.Properties")
+    # Create device object and interface
+    device = bus.get_object("org.freedesktop.NetworkManager", device_path)
+    wifi_interface = dbus.Interface(
+        device, "org.freedesktop.NetworkManager.Device.Wireless"
+    )
+    device_props = dbus.Interface(device, "org.freedesktop.DBus.Properties")
 
-        # Get active connection
-        active_ap_path = device_props.Get(
-            "org.freedesktop.NetworkManager.Device.Wireless", "ActiveAccessPoint"
-        )
+    # Get active connection
+    active_ap_path = device_props.Get(
+        "org.freedesktop.NetworkManager.Device.Wireless", "ActiveAccessPoint"
+    )
 
-        # Request scan
+    # Request scan (the calls are timed, not the wait for the scan to complete)
+    with upstream("dbus", "scan"):
         wifi_interface.RequestScan(dbus.Dictionary({}, signature="sv"))
-        time.sleep(2)  # Wait for scan completion
+    await asyncio.sleep(2)  # Wait for scan completion
 
-        # Get access points
+    # Get access points
+    with upstream("dbus", "access_points"):
         access_points = wifi_interface.GetAccessPoints()
-        networks_dict = {}
-
-        for ap_path in access_points:
-            ap = bus.get_object("org.freedesktop.NetworkManager", ap_path)
-            ap_props = dbus.Interface(ap, "org.freedesktop.DBus.Properties")
-
-            ssid = bytes(
-                ap_props.Get("org.freedesktop.NetworkManager.AccessPoint", "Ssid")
-            ).decode("utf-8")
-            strength = ap_props.Get(
-                "org.freedesktop.NetworkManager.AccessPoint", "Strength"
-            )
-            hwAddress = ap_props.Get(
-                "org.freedesktop.NetworkManager.AccessPoint", "HwAddress"
-            )
-            # Check if this is the active access point
-            connected = ap_path == active_ap_path
-
-            if ssid not in networks_dict:
-                networks_dict[ssid] = {
-                    "ssid": ssid,
-                    "strength": int(strength),
-                    "connected": connected,
-                    "id": f"{hwAddress}_{ssid}",  # Create a unique __ID__ by combining hwAddress and ssid
-                }
-            if connected:
-                networks_dict[ssid]["connected"] = True
-        networks = list(networks_dict.values())
-        log(f"Found {len(networks)} unique networks", module="network")
-        return sorted(networks, key=lambda x: x["strength"], reverse=True)
+    networks_dict = {}
+
+    for ap_path in access_points:
+        ap = bus.get_object("org.freedesktop.NetworkManager", ap_path)
+        ap_props = dbus.Interface(ap, "org.freedesktop.DBus.Properties")
+
+        ssid = bytes(
+            ap_props.Get("org.freedesktop.NetworkManager.AccessPoint", "Ssid")
+        ).decode("utf-8")
+        strength = ap_props.Get(
+            "org.freedesktop.NetworkManager.AccessPoint", "Strength"
+        )
+        hwAddress = ap_props.Get(
+            "org.freedesktop.NetworkManager.AccessPoint", "HwAddress"
+        )
+        # Check if this is the active access point
+        connected = ap_path == active_ap_path
+
+        if ssid not in networks_dict:
+            networks_dict[ssid] = {
+                "ssid": ssid,
+                "strength": int(strength),
+                "connected": connected,
+                "id": f"{hwAddress}_{ssid}",  # Create a unique __ID__ by combining hwAddress and ssid
+            }
+        if connected:
+            networks_dict[ssid]["connected"] = True
+    networks = list(networks_dict.values())
+    log(f"Found {len(networks)} unique networks", module="network")
+    networks = sorted(networks, key=lambda x: x["strength"], reverse=True)
+    store.update("network", access_points=networks, scanned=time.time())
+    return networks
 
+
+async def recent_access_points(max_age: float = ACCESS_POINTS_MAX_AGE) -> List[Dict]:
+    """Access points of the last scan if it is recent enough, else of a new one."""
+    network = store.get("network")
+    if network.scanned is not None and time.time() - network.scanned < max_age:
+        return network.access_points
+    return await scan_access_points()
+
+
+@router.get("/access-points")
+async def get_access_points():
+    """Get available WiFi access points and check if connected."""
+    try:
+        return await scan_access_points()
+
+    except HTTPException:
+        raise
     except Exception as e:
         log(f"Failed to get access points: {str(e)}", level="error", module="network")
         tb = traceback.extract_tb(e.__traceback__)
@@ -151,12 +205,12 @@ async def connect_network(credentials: NetworkCredentials):
     try:
         log(f"Attempting to connect to network: {credentials.ssid}", module="network")
         device_path = get_wifi_device()
-        global DB
+        bus = init_dbus()
         # Get NetworkManager interface
-        nm = DB["bus"].get_object(
+        nm = bus.get_object(
             "org.freedesktop.NetworkManager", "/org/freedesktop/NetworkManager"
         )
-        settings = DB["bus"].get_object(
+        settings = bus.get_object(
             "org.freedesktop.NetworkManager", "/org/freedesktop/NetworkManager/Settings"
         )
         settings_interface = dbus.Interface(
@@ -198,12 +252,13 @@ async def connect_network(credentials: NetworkCredentials):
             signature="sa{sv}",
         )
 
-        new_connection = settings_interface.AddConnection(connection_settings)
+        with upstream("dbus", "connect"):
+            new_connection = settings_interface.AddConnection(connection_settings)
 
-        # Activate the connection
-        nm_interface = dbus.Interface(nm, "org.freedesktop.NetworkManager")
-        wifi_device = get_wifi_device()
-        nm_interface.ActivateConnection(new_connection, wifi_device, "/")
+            # Activate the connection
+            nm_interface = dbus.Interface(nm, "org.freedesktop.NetworkManager")
+            wifi_device = get_wifi_device()
+            nm_interface.ActivateConnection(new_connection, wifi_device, "/")
 
         log(f"Successfully connected to {credentials.ssid}", module="network")
         return {"status": "success", "message": f"Connected to {credentials.ssid}"}
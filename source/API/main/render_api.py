@@ -0,0 +1,325 @@
+"""Server-side rendering of the display.
+
+Builds the screen with the driver's own layout and rasterizer (driver/screen.py,
+driver/rasterizer.py), so a thin client gets exactly the pixels the panel driver would send:
+the packed 1bpp panel buffer (EPD_WIDTH x EPD_HEIGHT, 1 = black, rows of EPD_WIDTH / 8 bytes)
+or a PNG preview of it. Frames are cached by display list hash and tagged with the hash of
+their content, so an unchanged screen costs a layout pass and a 304. /render/delta sends
+only what changed since the frame the client has (driver/framedelta.py). Lessons and
+notification cards come from the display view model (viewmodel.py).
+"""
+
+from fastapi import APIRouter, HTTPException, Request, Response
+import asyncio
+import datetime
+import hashlib
+import io
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+from dataClasses import ClockType
+from db import store
+from response_cache import dumps
+from startup import lazy_import
+from util import handle_error
+from viewmodel import ViewModelBuilder, views
+
+DRIVER_DIR = Path(
+    os.environ.get(
+        "OPENCLOCK_DRIVER_DIR", Path(__file__).resolve().parents[3] / "driver"
+    )
+)
+# after the API's own modules, the driver's must not shadow them
+if str(DRIVER_DIR) not in sys.path:
+    sys.path.append(str(DRIVER_DIR))
+
+screen = lazy_import("screen")
+rasterizer = lazy_import("rasterizer")
+displaylist = lazy_import("displaylist")
+timesource = lazy_import("timesource")
+framedelta = lazy_import("framedelta")
+
+router = APIRouter(prefix="/render", tags=["Render"])
+
+MAX_FRAMES = 32
+
+
+class Frame(NamedTuple):
+    packed: bytes
+    digest: str
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.digest}"'
+
+
+class SharedRasterizer:
+    """One driver rasterizer for every FrameRenderer; it keeps scratch state, so renders
+    take turns."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rasterizer = None
+
+    def render(self, display_list: list, wallmount: bool) -> bytes:
+        with self._lock:
+            if self._rasterizer is None:
+                self._rasterizer = rasterizer.NumpyRasterizer(screen.FONTS)
+            return bytes(self._rasterizer.renderPacked(display_list, wallmount))
+
+
+rasterize = SharedRasterizer()
+
+
+class FrameRenderer:
+    """Display list -> packed frame cache, plus the deltas sent between its frames.
+
+    One per clock: a client's base frame has to stay cached until its next poll, which a
+    cache shared by many clocks can't promise.
+    """
+
+    def __init__(self, max_frames: int = MAX_FRAMES):
+        self.max_frames = max_frames
+        self._lock = threading.Lock()
+        self._frames: "OrderedDict[tuple, Frame]" = OrderedDict()
+        self._png: Dict[str, bytes] = {}
+        self._deltas: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.renders = 0
+        self.hits = 0
+        self.keyframes = 0
+        self.deltas = 0
+
+    def layout(
+        self, model: ClockType, at: datetime.datetime, seconds: bool, view: dict
+    ) -> list:
+        """Display list of the screen of `model` at `at`, showing `view`."""
+        if model != ClockType.Mini:
+            raise HTTPException(
+                status_code=404, detail=f"No screen layout for {model.value}"
+            )
+        return screen.buildScreen(
+            timesource.FixedClock(at), showSeconds=seconds, view=view
+        )
+
+    def frame(self, display_list: list, wallmount: bool) -> Frame:
+        """Packed frame of a display list, rendered only if it is not cached."""
+        key = (displaylist.hashList(display_list), wallmount)
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self.hits += 1
+                self._frames.move_to_end(key)
+                return frame
+        packed = rasterize.render(display_list, wallmount)
+        with self._lock:
+            self.renders += 1
+            frame = Frame(packed, hashlib.sha1(packed).hexdigest())
+            self._frames[key] = frame
+            while len(self._frames) > self.max_frames:
+                _, dropped = self._frames.popitem(last=False)
+                self._png.pop(dropped.etag, None)
+            return frame
+
+    def png(self, frame: Frame) -> bytes:
+        """PNG of the frame in layout orientation (what the panel shows)."""
+        png = self._png.get(frame.etag)
+        if png is None:
+            buffer = io.BytesIO()
+            rasterizer.unpackFrame(frame.packed).save(buffer, "PNG", optimize=True)
+            png = self._png[frame.etag] = buffer.getvalue()
+        return png
+
+    def find(self, digest: Optional[str]) -> Optional[Frame]:
+        """Cached frame with this content hash, if it is still cached."""
+        with self._lock:
+            for frame in self._frames.values():
+                if frame.digest == digest:
+                    return frame
+        return None
+
+    def delta(self, frame: Frame, base: Optional[str], chain: int) -> bytes:
+        """Delta message from the client's frame `base` to `frame`; a keyframe if `base`
+        is no longer cached or the client has chained enough deltas."""
+        previous = None
+        if chain < framedelta.KEYFRAME_INTERVAL:
+            previous = self.find(base)
+        key = (previous.digest if previous else None, frame.digest)
+        with self._lock:
+            message = self._deltas.get(key)
+            if message is not None:
+                self._deltas.move_to_end(key)
+                return message
+        message = framedelta.encodeFrame(
+            frame.packed,
+            previous.packed if previous else None,
+            rowBytes=screen.EPD_WIDTH // 8,
+        )
+        with self._lock:
+            if framedelta.isKeyframe(message):
+                self.keyframes += 1
+            else:
+                self.deltas += 1
+            self._deltas[key] = message
+            while len(self._deltas) > self.max_frames:
+                self._deltas.popitem(last=False)
+        return message
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "frames": len(self._frames),
+            "renders": self.renders,
+            "hits": self.hits,
+            "keyframes": self.keyframes,
+            "deltas": self.deltas,
+        }
+
+
+renderer = FrameRenderer()
+
+
+async def render_frame(
+    at: Optional[datetime.datetime] = None,
+    seconds: bool = False,
+    model: Optional[ClockType] = None,
+    wallmounted: Optional[bool] = None,
+    view_model: Optional[ViewModelBuilder] = None,
+    frames: Optional[FrameRenderer] = None,
+) -> Frame:
+    """Frame for the clock configuration (or the overrides) at `at` (default: this minute),
+    with the current view model of `view_model` and the frame cache `frames` (default:
+    this clock's)."""
+    frames = frames or renderer
+    config = store.get("config")
+    model = model or config.model
+    wallmount = config.wallmounted if wallmounted is None else wallmounted
+    if at is None:
+        at = datetime.datetime.now().replace(microsecond=0)
+        if not seconds:
+            at = at.replace(second=0)
+
+    def render():
+        view = (view_model or views).current()
+        return frames.frame(frames.layout(model, at, seconds, view), wallmount)
+
+    return await asyncio.to_thread(render)
+
+
+def frame_headers(frame: Frame) -> Dict[str, str]:
+    return {
+        "ETag": frame.etag,
+        "Cache-Control": "no-cache",
+        "X-Frame-Width": str(screen.EPD_WIDTH),
+        "X-Frame-Height": str(screen.EPD_HEIGHT),
+    }
+
+
+def not_modified(request: Request, frame: Frame) -> bool:
+    return request.headers.get("if-none-match") == frame.etag
+
+
+async def delta_response(
+    frame: Frame,
+    base: Optional[str],
+    chain: int,
+    frames: Optional[FrameRenderer] = None,
+) -> Response:
+    """Delta message from the client's frame `base` to `frame` (304 if it is `base`),
+    `frame` coming from the frame cache `frames` (default: this clock's)."""
+    if base == frame.digest:
+        return Response(status_code=304, headers=frame_headers(frame))
+    message = await asyncio.to_thread((frames or renderer).delta, frame, base, chain)
+    return Response(
+        message,
+        media_type="application/octet-stream",
+        headers=frame_headers(frame),
+    )
+
+
+# --- API Endpoints ---
+@router.get("/frame")
+async def get_frame(
+    request: Request,
+    at: Optional[datetime.datetime] = None,
+    seconds: bool = False,
+    model: Optional[ClockType] = None,
+    wallmounted: Optional[bool] = None,
+):
+    """Panel-ready frame: packed 1bpp buffer as sent to the e-paper driver."""
+    try:
+        frame = await render_frame(at, seconds, model, wallmounted)
+        if not_modified(request, frame):
+            return Response(status_code=304, headers=frame_headers(frame))
+        return Response(
+            frame.packed,
+            media_type="application/octet-stream",
+            headers=frame_headers(frame),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise handle_error(e, "Failed to render frame")
+
+
+@router.get("/frame.png")
+async def get_frame_png(
+    request: Request,
+    at: Optional[datetime.datetime] = None,
+    seconds: bool = False,
+    model: Optional[ClockType] = None,
+    wallmounted: Optional[bool] = None,
+):
+    """PNG preview of the frame, for the web UI."""
+    try:
+        frame = await render_frame(at, seconds, model, wallmounted)
+        if not_modified(request, frame):
+            return Response(status_code=304, headers=frame_headers(frame))
+        png = await asyncio.to_thread(renderer.png, frame)
+        return Response(png, media_type="image/png", headers=frame_headers(frame))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise handle_error(e, "Failed to render frame preview")
+
+
+@router.get("/view-model")
+async def get_view_model(request: Request):
+    """What the screen shows: 3 timetable columns of 10 slots and 12 notification cards,
+    text fitted to the cells, with a content hash per cell (see viewmodel.py)."""
+    try:
+        view = await asyncio.to_thread(views.current)
+        tag = f'"{view["hash"]}"'
+        if request.headers.get("if-none-match") == tag:
+            return Response(status_code=304, headers={"ETag": tag})
+        return Response(
+            dumps(view),
+            media_type="application/json",
+            headers={"ETag": tag, "Cache-Control": "no-cache"},
+        )
+    except Exception as e:
+        raise handle_error(e, "Failed to build view model")
+
+
+@router.get("/delta")
+async def get_delta(
+    base: Optional[str] = None,
+    chain: int = 0,
+    at: Optional[datetime.datetime] = None,
+    seconds: bool = False,
+    model: Optional[ClockType] = None,
+    wallmounted: Optional[bool] = None,
+):
+    """Frame as a delta against `base`, the hash of the last frame the client applied.
+
+    `chain` is the number of deltas applied since the last keyframe. Without a known base
+    the response is a keyframe; if the frame is still `base`, 304.
+    """
+    try:
+        frame = await render_frame(at, seconds, model, wallmounted)
+        return await delta_response(frame, base, chain)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise handle_error(e, "Failed to render frame delta")
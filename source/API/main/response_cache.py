@@ -0,0 +1,136 @@
+"""Pre-serialized responses for the hot read endpoints.
+
+An endpoint hands `responses.response()` a key, the store slices its payload depends on and a
+function building the payload. The payload is built and encoded once per version of those
+slices (orjson when installed), a gzip variant is compressed right away, and every further
+request gets the stored bytes without touching FastAPI's encoder. Concurrent misses share one
+build through the single-flight registry.
+"""
+
+import gzip
+import inspect
+import json
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, NamedTuple, Optional, Tuple
+from fastapi import Request, Response
+from pydantic import BaseModel
+from db import store
+from singleflight import flights
+from store import Store
+
+try:
+    import orjson
+except ImportError:  # optional, json does the same, slower
+    orjson = None
+
+# Smaller bodies are not worth compressing
+GZIP_MIN_SIZE = 512
+GZIP_LEVEL = 6
+MAX_ENTRIES = 64
+
+
+def default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=default)
+    return json.dumps(
+        payload, default=default, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+class CachedBody(NamedTuple):
+    version: Tuple[int, ...]
+    body: bytes
+    gzipped: Optional[bytes]
+
+
+class ResponseCache:
+    """Encoded payloads keyed by endpoint and arguments, valid for one data version."""
+
+    def __init__(self, store: Store, max_entries: int = MAX_ENTRIES):
+        self.store = store
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, slices: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self.store.version(name) for name in slices)
+
+    async def get(
+        self, key: Hashable, slices: Iterable[str], build: Callable[[], Any]
+    ) -> CachedBody:
+        """Cached body for `key`, rebuilt when one of `slices` changed."""
+        slices = tuple(slices)
+        version = self.version(slices)
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == version:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        entry = await flights.do(
+            ("response", key, version), self._build, build, version
+        )
+        # the data may have changed while building; keep it only if it still matches
+        if entry.version == self.version(slices):
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    async def _build(
+        self, build: Callable[[], Any], version: Tuple[int, ...]
+    ) -> CachedBody:
+        payload = build()
+        if inspect.isawaitable(payload):
+            payload = await payload
+        body = dumps(payload)
+        gzipped = None
+        if len(body) >= GZIP_MIN_SIZE:
+            gzipped = gzip.compress(body, GZIP_LEVEL, mtime=0)
+        return CachedBody(version, body, gzipped)
+
+    def respond(self, request: Request, entry: CachedBody) -> Response:
+        headers = {"Vary": "Accept-Encoding"}
+        body = entry.body
+        if entry.gzipped is not None and "gzip" in request.headers.get(
+            "accept-encoding", ""
+        ):
+            body = entry.gzipped
+            headers["Content-Encoding"] = "gzip"
+        return Response(body, media_type="application/json", headers=headers)
+
+    async def response(
+        self,
+        request: Request,
+        key: Hashable,
+        slices: Iterable[str],
+        build: Callable[[], Any],
+    ) -> Response:
+        """Response for `key`, built and encoded only when its data changed."""
+        return self.respond(request, await self.get(key, slices, build))
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": sum(len(entry.body) for entry in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+responses = ResponseCache(store)
@@ -0,0 +1,247 @@
+"""Supervised scheduler for the API's background jobs.
+
+A job is an async function that does one unit of work and raises on failure. The scheduler runs
+it periodically (or once), adds jitter, backs off exponentially after failures, cancels runs that
+exceed their max runtime and never runs two instances of the same job at the same time. Each job
+is driven by its own supervisor task, which is restarted if it ever dies. Jobs marked
+`leader_only` only run in the worker process holding the leader lease.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from metrics import job_duration
+from util import log
+
+# Seconds between leadership checks of a one-shot leader-only job
+STANDBY_RECHECK = 15
+
+
+class Job:
+    """A scheduled job and its run history."""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        interval: Optional[float] = None,
+        delay: float = 0,
+        jitter: float = 0,
+        timeout: Optional[float] = None,
+        backoff: float = 30,
+        max_backoff: float = 3600,
+        leader_only: bool = False,
+    ):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.delay = delay
+        self.jitter = jitter
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.leader_only = leader_only
+
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.restarts = 0
+        self.last_start: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_status: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.next_run: Optional[float] = None
+        self.done = False
+        self.wake = asyncio.Event()
+
+    def next_delay(self) -> Optional[float]:
+        """Seconds until the next run, or None when the job is finished."""
+        if self.consecutive_failures:
+            delay = min(
+                self.max_backoff, self.backoff * 2 ** (self.consecutive_failures - 1)
+            )
+        elif self.interval is not None:
+            delay = self.interval
+        else:
+            return None
+        return delay + random.uniform(0, self.jitter)
+
+    async def run(self) -> None:
+        """Run the job once, recording duration and outcome."""
+        self.running = True
+        self.last_start = time.time()
+        started = time.monotonic()
+        try:
+            if self.timeout:
+                await asyncio.wait_for(self.func(), self.timeout)
+            else:
+                await self.func()
+            self.last_status = "ok"
+            self.last_error = None
+            self.consecutive_failures = 0
+        except asyncio.TimeoutError:
+            self.last_status = "timeout"
+            self.last_error = f"exceeded {self.timeout}s"
+            self.failures += 1
+            self.consecutive_failures += 1
+            log(
+                f"Job {self.name} timed out after {self.timeout}s",
+                level="warning",
+                module="scheduler",
+            )
+        except asyncio.CancelledError:
+            self.last_status = "cancelled"
+            raise
+        except Exception as e:
+            self.last_status = "error"
+            self.last_error = str(e)
+            self.failures += 1
+            self.consecutive_failures += 1
+            log(f"Job {self.name} failed: {str(e)}", level="error", module="scheduler")
+        finally:
+            self.running = False
+            self.runs += 1
+            self.last_duration = time.monotonic() - started
+            job_duration.observe(self.last_duration, job=self.name)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "leader_only": self.leader_only,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "restarts": self.restarts,
+            "last_run": self.last_start,
+            "last_duration": self.last_duration,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+            "next_run": self.next_run,
+        }
+
+
+class Scheduler:
+    """Owns the jobs and their supervisor tasks."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._running = False
+        # replaced by the shared state when several workers run; see shared_state.py
+        self.is_leader: Callable[[], bool] = lambda: True
+
+    def add(self, name: str, func: Callable[[], Awaitable[Any]], **options: Any) -> Job:
+        """Register a job. Without `interval` it runs once after `delay` seconds."""
+        if name in self._jobs:
+            raise ValueError(f"Job {name} already exists")
+        job = Job(name, func, **options)
+        self._jobs[name] = job
+        if self._running:
+            self._spawn(job)
+        return job
+
+    def once(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        delay: float = 0,
+        **options: Any,
+    ) -> Job:
+        """Register a one-shot job (still retried with backoff until it succeeds)."""
+        return self.add(name, func, interval=None, delay=delay, **options)
+
+    def get(self, name: str) -> Job:
+        return self._jobs[name]
+
+    def jobs(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def start(self) -> None:
+        self._running = True
+        for job in self._jobs.values():
+            self._spawn(job)
+        log(f"Scheduler started with {len(self._jobs)} jobs", module="scheduler")
+
+    async def stop(self) -> None:
+        self._running = False
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                log(f"Job cleanup error: {str(e)}", level="error", module="scheduler")
+        log("Scheduler stopped", module="scheduler")
+
+    def trigger(self, name: str) -> bool:
+        """Run a job now instead of at its next slot. False if it is already running."""
+        job = self._jobs[name]
+        if job.running:
+            return False
+        job.done = False
+        job.next_run = time.time()
+        job.wake.set()
+        if self._running and name not in self._tasks:
+            self._spawn(job, delay=0)
+        return True
+
+    def wake_leader_jobs(self) -> None:
+        """Run the leader-only jobs now, e.g. after this worker was elected."""
+        for job in self._jobs.values():
+            if job.leader_only:
+                self.trigger(job.name)
+
+    def _spawn(self, job: Job, delay: Optional[float] = None) -> None:
+        task = asyncio.create_task(self._supervise(job, delay), name=f"job:{job.name}")
+        self._tasks[job.name] = task
+        task.add_done_callback(lambda t, job=job: self._on_exit(job, t))
+
+    def _on_exit(self, job: Job, task: asyncio.Task) -> None:
+        if self._tasks.get(job.name) is task:
+            del self._tasks[job.name]
+        if task.cancelled() or not self._running or job.done:
+            return
+        # the supervisor itself died, which should not happen; bring it back
+        job.restarts += 1
+        log(
+            f"Supervisor of job {job.name} died ({task.exception()}), restarting",
+            level="error",
+            module="scheduler",
+        )
+        self._spawn(job)
+
+    async def _supervise(self, job: Job, delay: Optional[float] = None) -> None:
+        if delay is None:
+            delay = job.delay + random.uniform(0, job.jitter)
+        while True:
+            job.next_run = time.time() + delay
+            job.wake.clear()
+            try:
+                await asyncio.wait_for(job.wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+            if job.leader_only and not self.is_leader():
+                # another worker runs it; check again at the next slot
+                job.last_status = "standby"
+                delay = job.interval if job.interval is not None else STANDBY_RECHECK
+                continue
+
+            await job.run()
+
+            delay = job.next_delay()
+            if delay is None:
+                job.next_run = None
+                job.done = True
+                return
+
+
+scheduler = Scheduler()
@@ -0,0 +1,342 @@
+"""State shared between API worker processes.
+
+When the API runs with several uvicorn workers (`uvicorn main:app --workers 4`), set
+OPENCLOCK_SHARED_STATE to a SQLite file path. Each worker then mirrors the shareable part of its
+store slices into that database (WAL mode, so readers never block the writer) and pulls changes
+made by the other workers once a second. Runtime handles (webuntis session, MSAL app, D-Bus) stay
+per process; the token cache and device flow are shared so a login done through one worker is
+usable by all of them, and the timetable (plain untis_api.Period records) so every worker
+serves what the leader fetched. The database is written from a thread of its own. When two
+workers change the same slice between pulls, the later write is merged field by field, so
+`setSetup` on one worker and `setWallmount` on another both survive.
+
+The workers also elect a leader with a lease row. Only the leader runs the jobs marked
+`leader_only` (the Untis and Microsoft sync loops); if it dies, another worker takes over once
+the lease expires. Without OPENCLOCK_SHARED_STATE the API runs as a single process as before.
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import socket
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dataClasses import ConfigModel
+from microsoft_api import get_token_cache
+from store import Change, Store
+from untis_api import Period, find_periods
+from util import log
+
+SHARED_STATE_ENV = "OPENCLOCK_SHARED_STATE"
+LEASE_NAME = "sync_loops"
+LEASE_TTL = 15
+
+
+# --- Slice Serialization ---
+def dump_microsoft(microsoft) -> Dict[str, Any]:
+    cache = microsoft.token_cache
+    return {
+        "flow": microsoft.flow,
+        "result": microsoft.result,
+        "token_cache": cache.serialize() if cache is not None else None,
+        "messages": microsoft.messages,
+        "notifications": microsoft.notifications,
+        "inbox_updated": microsoft.inbox_updated,
+    }
+
+
+def load_microsoft(store: Store, data: Dict[str, Any]) -> None:
+    if data.get("token_cache"):
+        get_token_cache().deserialize(data["token_cache"])
+    store.update(
+        "microsoft",
+        flow=data.get("flow"),
+        result=data.get("result"),
+        messages=data.get("messages", []),
+        notifications=data.get("notifications", []),
+        inbox_updated=data.get("inbox_updated"),
+    )
+
+
+def dump_untis(untis) -> Dict[str, Any]:
+    # the timetable travels with `updated`, or a worker would take its own (empty or older)
+    # timetable for fresh and never fetch
+    return {
+        "connected": untis.connected,
+        "updated": untis.updated,
+        "days": untis.days,
+        "timetable": [period.record() for period in untis.timetable],
+    }
+
+
+def load_untis(store: Store, data: Dict[str, Any]) -> None:
+    timetable = [Period.from_record(period) for period in data.get("timetable", [])]
+    current_period, next_period = find_periods(timetable, datetime.datetime.now())
+    store.update(
+        "untis",
+        connected=data.get("connected", False),
+        updated=data.get("updated"),
+        days=data.get("days", 0),
+        timetable=timetable,
+        current_period=current_period,
+        next_period=next_period,
+    )
+
+
+# name: (dump, load) of the part of a slice that can cross process boundaries
+SHARED_SLICES = {
+    "config": (
+        lambda config: config.model_dump(mode="json"),
+        lambda store, data: store.replace("config", ConfigModel(**data)),
+    ),
+    "untis": (dump_untis, load_untis),
+    "microsoft": (dump_microsoft, load_microsoft),
+    "network": (
+        lambda network: {"wifi_device": network.wifi_device},
+        lambda store, data: store.update("network", **data),
+    ),
+}
+
+
+def merge(base: str, ours: str, theirs: str) -> str:
+    """Three-way merge of a slice per field: our value where we changed a field since `base`
+    (what we last saw in the database), the database's value everywhere else."""
+    base, ours, theirs = json.loads(base), json.loads(ours), json.loads(theirs)
+    merged = {
+        key: value if value != base.get(key) else theirs.get(key, value)
+        for key, value in ours.items()
+    }
+    return json.dumps(merged, sort_keys=True)
+
+
+class SharedState:
+    """SQLite mirror of the store plus leader election for one worker process.
+
+    Database work runs on one thread of its own (SQLite waits up to 5 s for a locked
+    database, the event loop must not); store commits stay on the event loop.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        store: Store,
+        on_elected: Optional[Callable[[], None]] = None,
+    ):
+        self.path = path
+        self.store = store
+        self.on_elected = on_elected
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.leader = False
+        # per slice, database thread: last revision pulled or written, and its data
+        self.seen: Dict[str, int] = {}
+        self.base: Dict[str, str] = {}
+        # per slice, event loop: serialized local data last published or applied
+        self.synced: Dict[str, str] = {}
+        self.publishes = 0
+        self.pulls = 0
+        self.merges = 0
+        self.pending: set = set()
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared")
+        # created here, used by the executor's thread only (and by start/close before and
+        # after it runs)
+        self.db = sqlite3.connect(
+            path, timeout=5, isolation_level=None, check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS slices (name TEXT PRIMARY KEY, "
+            "revision INTEGER NOT NULL, data TEXT NOT NULL, worker TEXT, updated REAL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, "
+            "owner TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        os.chmod(path, 0o600)  # holds the Microsoft token cache
+
+    def start(self) -> None:
+        """Adopt the shared state (or seed it with ours) and start mirroring commits."""
+        for name, data in self.read():
+            self.apply(name, data)
+        for name in SHARED_SLICES:
+            if name not in self.seen:
+                self.synced[name] = self.write(name, self.serialize(name))
+        self.elect(self.take_lease())
+        self.store.add_listener(self.on_change)
+        log(
+            f"Shared state at {self.path} (worker {self.worker}, leader={self.leader})",
+            module="shared",
+        )
+
+    def close(self) -> None:
+        self.store.remove_listener(self.on_change)
+        self._executor.shutdown(wait=True)  # pending publishes
+        if self.leader:
+            self.db.execute(
+                "DELETE FROM leases WHERE name = ? AND owner = ?",
+                (LEASE_NAME, self.worker),
+            )
+            self.leader = False
+        self.db.close()
+
+    def serialize(self, name: str) -> str:
+        dump, _ = SHARED_SLICES[name]
+        return json.dumps(dump(self.store.get(name)), sort_keys=True)
+
+    async def run(self, func: Callable, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    # --- Event Loop ---
+    def on_change(self, change: Change) -> None:
+        if change.slice in SHARED_SLICES:
+            self.publish(change.slice)
+
+    def publish(self, name: str) -> None:
+        """Queue a slice for writing unless it equals what we last synced."""
+        data = self.serialize(name)
+        if data == self.synced.get(name):
+            return
+        self.synced[name] = data
+        task = asyncio.ensure_future(self.published(name, data))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def published(self, name: str, data: str) -> None:
+        try:
+            written = await self.run(self.write, name, data)
+        except Exception as e:
+            log(f"Failed to publish {name}: {e}", level="error", module="shared")
+            self.synced.pop(name, None)  # try again with the next commit
+            return
+        self.publishes += 1
+        if written != data:
+            # another worker changed other fields since we last pulled: take them too
+            self.apply(name, written)
+
+    async def drain(self) -> None:
+        """Wait until the queued publishes are written."""
+        while self.pending:
+            await asyncio.gather(*self.pending)
+
+    def apply(self, name: str, data: str) -> None:
+        """Load a slice as written to the database into the store."""
+        if data == self.synced.get(name):
+            return
+        # mark as synced first so applying it does not publish it back
+        self.synced[name] = data
+        _, load = SHARED_SLICES[name]
+        load(self.store, json.loads(data))
+        # the local dump can differ in form (e.g. token cache), don't echo that either
+        self.synced[name] = self.serialize(name)
+        self.pulls += 1
+
+    def elect(self, leader: bool) -> None:
+        """Record the lease outcome. Calls `on_elected` when we become leader."""
+        elected = leader and not self.leader
+        if self.leader and not leader:
+            log(
+                f"Worker {self.worker} lost the leader lease",
+                level="warning",
+                module="shared",
+            )
+        self.leader = leader
+        if elected:
+            log(f"Worker {self.worker} is now the leader", module="shared")
+            if self.on_elected:
+                self.on_elected()
+
+    # --- Database Thread ---
+    def write(self, name: str, data: str) -> str:
+        """Write a slice, merged with what other workers wrote since we last saw it.
+        Returns the data written."""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT revision, data FROM slices WHERE name = ?", (name,)
+            ).fetchone()
+            revision = row[0] if row else 0
+            if row and revision != self.seen.get(name) and name in self.base:
+                data = merge(self.base[name], data, row[1])
+                self.merges += 1
+            self.db.execute(
+                "INSERT OR REPLACE INTO slices VALUES (?, ?, ?, ?, ?)",
+                (name, revision + 1, data, self.worker, time.time()),
+            )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.seen[name] = revision + 1
+        self.base[name] = data
+        return data
+
+    def read(self) -> List[Tuple[str, str]]:
+        """Slices other workers changed since we last looked."""
+        changed = []
+        rows = self.db.execute("SELECT name, revision, data FROM slices").fetchall()
+        for name, revision, data in rows:
+            if name not in SHARED_SLICES or revision <= self.seen.get(name, 0):
+                continue
+            self.seen[name] = revision
+            self.base[name] = data
+            changed.append((name, data))
+        return changed
+
+    def take_lease(self) -> bool:
+        """Take or extend the leader lease; whether we hold it."""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT owner, expires FROM leases WHERE name = ?", (LEASE_NAME,)
+            ).fetchone()
+            leader = row is None or row[0] == self.worker or row[1] < now
+            if leader:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO leases VALUES (?, ?, ?)",
+                    (LEASE_NAME, self.worker, now + LEASE_TTL),
+                )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return leader
+
+    # --- Jobs ---
+    def is_leader(self) -> bool:
+        return self.leader
+
+    async def sync(self) -> None:
+        """Scheduled job: pull remote changes."""
+        for name, data in await self.run(self.read):
+            self.apply(name, data)
+
+    async def keep_lease(self) -> None:
+        """Scheduled job: renew or try to take the leader lease."""
+        self.elect(await self.run(self.take_lease))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker": self.worker,
+            "leader": self.leader,
+            "publishes": self.publishes,
+            "pulls": self.pulls,
+            "merges": self.merges,
+            "revisions": dict(self.seen),
+        }
+
+
+def open_shared_state(
+    store: Store, on_elected: Optional[Callable[[], None]] = None
+) -> Optional[SharedState]:
+    """SharedState from OPENCLOCK_SHARED_STATE, or None when running single-process."""
+    path = os.environ.get(SHARED_STATE_ENV)
+    if not path:
+        return None
+    return SharedState(path, store, on_elected)
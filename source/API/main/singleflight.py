@@ -0,0 +1,67 @@
+"""Single-flight coalescing of upstream calls.
+
+Concurrent callers asking for the same operation with the same arguments share one in-flight
+call and its result (or exception) instead of each hitting the upstream service. The call runs
+in its own task, so a caller that goes away (client disconnect) does not cancel it for the rest.
+"""
+
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Registry of in-flight calls keyed by operation and arguments."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(
+        self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs
+    ) -> Any:
+        """Run `func(*args, **kwargs)` unless a call with `key` is already in flight."""
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.create_task(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "in_flight": len(self._calls),
+        }
+
+
+flights = SingleFlight()
+
+
+def single_flight(name: str):
+    """Decorator coalescing concurrent calls of an async function with equal arguments."""
+
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())))
+            return await flights.do(key, func, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,157 @@
+"""Cold-start profiling and lazy loading of the integration libraries.
+
+`install_import_timer()` (called first thing in main.py) times every module imported after it,
+`mark()` records startup phases and `first_response()` the time the first request was answered,
+all relative to the process start. `lazy_import()` defers heavy integration libraries (msal,
+webuntis, aiohttp, dbus) until first use; `preload()` loads them in a worker thread once the
+server is up. GET /system/startup reports it all.
+"""
+
+import asyncio
+import builtins
+import importlib
+import os
+import sys
+import threading
+import time
+import types
+from typing import Any, Dict, List, Optional
+
+# (name, cumulative seconds, self seconds) per module, in import order
+IMPORTS: List[tuple] = []
+# name: seconds it took to load a lazy module, None while not loaded yet
+LAZY: Dict[str, Optional[float]] = {}
+PHASES: Dict[str, float] = {}
+
+_original_import = builtins.__import__
+_stack: List[float] = []
+_main_thread = threading.get_ident()
+_first_response: Optional[float] = None
+
+
+def process_start() -> float:
+    """Unix time this process started, from /proc when available."""
+    try:
+        with open("/proc/self/stat") as f:
+            # the command name can contain spaces, the fields after it can't
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return _loaded
+
+
+_loaded = time.time()
+PROCESS_START = process_start()
+
+
+def since_start() -> float:
+    return time.time() - PROCESS_START
+
+
+# --- Import Timing ---
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules or threading.get_ident() != _main_thread:
+        return _original_import(name, globals, locals, fromlist, level)
+    started = time.perf_counter()
+    _stack.append(0.0)
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - started
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        IMPORTS.append((name, elapsed, elapsed - children))
+
+
+def install_import_timer() -> None:
+    """Time imports from now on (main thread only) until `uninstall_import_timer()`."""
+    if builtins.__import__ is not _timed_import:
+        builtins.__import__ = _timed_import
+
+
+def uninstall_import_timer() -> None:
+    builtins.__import__ = _original_import
+
+
+# --- Lazy Imports ---
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self.__name__)
+            LAZY[self.__name__] = time.perf_counter() - started
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+
+_lazy_modules: Dict[str, LazyModule] = {}
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Module proxy for `name`; the import happens when it is first used."""
+    if name not in _lazy_modules:
+        _lazy_modules[name] = LazyModule(name)
+        LAZY.setdefault(name, None)
+    return _lazy_modules[name]
+
+
+async def preload() -> None:
+    """Scheduled job: load the lazy modules in a thread so requests don't pay for it."""
+    for name, module in list(_lazy_modules.items()):
+        try:
+            await asyncio.to_thread(module._load)
+        except ImportError as e:
+            # e.g. dbus on a development machine; the endpoints using it will fail
+            from util import log  # not at the top, util pulls in fastapi
+
+            log(f"Failed to preload {name}: {e}", level="warning", module="startup")
+    mark("preloaded")
+
+
+# --- Phases ---
+def mark(phase: str) -> None:
+    """Record that startup reached `phase` (seconds since process start)."""
+    PHASES.setdefault(phase, since_start())
+
+
+def first_response() -> None:
+    """Record the first answered request; cheap no-op afterwards."""
+    global _first_response
+    if _first_response is None:
+        _first_response = since_start()
+        from util import log
+
+        log(
+            f"First response {_first_response:.2f}s after process start",
+            module="startup",
+        )
+
+
+def report(top: int = 25) -> Dict[str, Any]:
+    imports = sorted(IMPORTS, key=lambda entry: entry[2], reverse=True)[:top]
+    return {
+        "process_start": PROCESS_START,
+        "phases": dict(PHASES),
+        "first_response": _first_response,
+        "imports_total": sum(entry[2] for entry in IMPORTS),
+        "imports": [
+            {"module": name, "self_ms": own * 1000, "cumulative_ms": cumulative * 1000}
+            for name, cumulative, own in imports
+        ],
+        "lazy_ms": {
+            name: seconds * 1000 if seconds is not None else None
+            for name, seconds in LAZY.items()
+        },
+    }
@@ -0,0 +1,179 @@
+"""Versioned in-memory state store.
+
+Runtime state is split into typed slices (config, untis, microsoft, network). Every slice is an
+immutable snapshot: updates build a new copy, bump the slice version and notify subscribers, so
+readers never see a half-written slice and consumers can wait for changes instead of polling.
+"""
+
+import asyncio
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from pydantic import BaseModel
+
+
+class Change(NamedTuple):
+    """A committed update of one slice. `sequence` orders changes across all slices."""
+
+    sequence: int
+    slice: str
+    version: int
+    value: Any
+    changed: Tuple[str, ...]
+
+
+def _differs(old: Any, new: Any) -> bool:
+    if old is new:
+        return False
+    try:
+        return bool(old != new)
+    except Exception:
+        return True
+
+
+class Subscription:
+    """Queue of changes for one consumer. Slow consumers lose the oldest changes, not the newest."""
+
+    def __init__(self, store: "Store", slices: Optional[Iterable[str]], maxsize: int):
+        self.store = store
+        self.slices = set(slices) if slices else None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def push(self, change: Change) -> None:
+        if self.slices is not None and change.slice not in self.slices:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(change)
+
+    async def get(self) -> Change:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self.store.unsubscribe(self)
+
+    def __aiter__(self) -> AsyncIterator[Change]:
+        return self
+
+    async def __anext__(self) -> Change:
+        return await self.get()
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class Store:
+    """Holds the slices, their versions and the subscribers."""
+
+    def __init__(self, history: int = 256, **slices: BaseModel):
+        self._slices: Dict[str, BaseModel] = dict(slices)
+        self._versions: Dict[str, int] = {name: 0 for name in slices}
+        self._subscribers: set = set()
+        self._listeners: List[Callable[[Change], None]] = []
+        self._sequence = 0
+        self._history: deque = deque(maxlen=history)
+
+    def get(self, name: str) -> Any:
+        """Current snapshot of a slice. Treat it as read-only, change it with `update`."""
+        return self._slices[name]
+
+    def version(self, name: str) -> int:
+        return self._versions[name]
+
+    def versions(self) -> Dict[str, int]:
+        return dict(self._versions)
+
+    def names(self) -> Tuple[str, ...]:
+        return tuple(self._slices)
+
+    def sequence(self) -> int:
+        """Sequence number of the last committed change."""
+        return self._sequence
+
+    def changes_since(self, sequence: int) -> Optional[List[Change]]:
+        """Changes committed after `sequence`, or None if they are no longer in the history."""
+        if sequence >= self._sequence:
+            return []
+        if not self._history or self._history[0].sequence > sequence + 1:
+            return None
+        return [change for change in self._history if change.sequence > sequence]
+
+    def update(self, name: str, **changes: Any) -> Any:
+        """Copy-on-write update of some fields of a slice.
+
+        Runs without awaiting, so it is atomic on the event loop. Returns the new snapshot; if no
+        field actually changed the version stays the same and nobody is notified.
+        """
+        old = self._slices[name]
+        changed = tuple(k for k, v in changes.items() if _differs(getattr(old, k), v))
+        if not changed:
+            return old
+        new = old.model_copy(update={k: changes[k] for k in changed})
+        return self._commit(name, new, changed)
+
+    def replace(self, name: str, value: BaseModel) -> Any:
+        """Swap a whole slice, e.g. after loading or resetting it."""
+        old = self._slices[name]
+        changed = tuple(
+            k
+            for k in type(value).model_fields
+            if _differs(getattr(old, k, None), getattr(value, k))
+        )
+        if not changed:
+            return old
+        return self._commit(name, value, changed)
+
+    def _commit(self, name: str, value: BaseModel, changed: Tuple[str, ...]) -> Any:
+        self._slices[name] = value
+        self._versions[name] += 1
+        self._sequence += 1
+        change = Change(self._sequence, name, self._versions[name], value, changed)
+        self._history.append(change)
+        for listener in list(self._listeners):
+            listener(change)
+        for subscriber in list(self._subscribers):
+            subscriber.push(change)
+        return value
+
+    def subscribe(
+        self, slices: Optional[Iterable[str]] = None, maxsize: int = 100
+    ) -> Subscription:
+        """Get a queue of future changes, optionally limited to some slices."""
+        subscription = Subscription(self, slices, maxsize)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def add_listener(self, listener: Callable[[Change], None]) -> None:
+        """Call `listener` synchronously inside every commit (keep it short)."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Change], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def export(self) -> Dict[str, Dict[str, Any]]:
+        """JSON-safe dump of all slices; runtime handles are excluded by their models."""
+        return {
+            name: {
+                "version": self._versions[name],
+                "data": value.model_dump(mode="json"),
+            }
+            for name, value in self._slices.items()
+        }
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Response
 import os
 import subprocess
+from pathlib import Path
 from typing import Dict, Any, Union
 from asyncio.subprocess import create_subprocess_shell
-from db import DB, SECURE_DB
-from dataClasses import command, model
+from db import store, default_slices, default_secure_db, SECURE_DB
+from dataClasses import command, model, JobStatus
 from util import handle_error
 from util import log
 from datetime import datetime, timedelta
@@ -12,14 +13,29 @@ from enum import Enum
 from typing import Optional, List
 import json
 from fastapi import HTTPException
-from dataClasses import ConfigModel, ClockType
-from config_api import router as config_router
-import msal
-
+from config_api import save_config
+from scheduler import scheduler
+from warmup import warmup
+from journal import journal
+from metrics import CONTENT_TYPE, registry, upstream
+import startup
 
 router = APIRouter(prefix="/system", tags=["System"])
 
 
+def system_status() -> Dict[str, Any]:
+    """Body of /status (also part of the dashboard)."""
+    config = store.get("config")
+    status = warmup.status()
+    return {
+        "setup": config.setup,
+        "model": config.model,
+        "wallmounted": config.wallmounted,
+        "ready": status["ready"],
+        "warmup": status,
+    }
+
+
 class LogSource(str, Enum):
     JOURNAL = "journal"
     SYSLOG = "syslog"
@@ -80,10 +96,13 @@ async def run_terminal(command: command) -> Dict[str, Union[str, Any]]:
     """Execute terminal command."""
     try:
         log(f"Executing command: {command.command}", module="system")
-        process = await create_subprocess_shell(
-            command.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
+        with upstream("subprocess", "run") as call:
+            process = await create_subprocess_shell(
+                command.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+            if process.returncode:
+                call.fail()
         output = stdout.decode() if stdout else ""
         error = stderr.decode() if stderr else ""
 
@@ -149,11 +168,13 @@ async def get_logs(
             cmd = f"{journal_cmd}; echo '=== Syslog ==='; {syslog_cmd}"
 
         # Execute command
-        process = await create_subprocess_shell(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-
-        stdout, stderr = await process.communicate()
+        with upstream("subprocess", "logs") as call:
+            process = await create_subprocess_shell(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+            if process.returncode:
+                call.fail()
 
         if stderr:
             log(f"Log error: {stderr.decode()}", level="warning", module="system")
@@ -165,36 +186,63 @@ async def get_logs(
         return f"Error retrieving logs: {str(e)}"
 
 
+@router.get("/jobs")
+async def get_jobs() -> List[JobStatus]:
+    """Get the background jobs with their last and next runs."""
+    try:
+        return [JobStatus(**job.status()) for job in scheduler.jobs()]
+    except Exception as e:
+        raise handle_error(e, "Failed to get jobs")
+
+
+@router.post("/jobs/{name}/run")
+async def run_job(name: str):
+    """Run a background job now."""
+    try:
+        if not scheduler.trigger(name):
+            return {"status": "busy", "message": f"Job {name} is already running"}
+        log(f"Triggered job {name}", module="system")
+        return {"status": "success", "message": f"Job {name} triggered"}
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {name}")
+
+
+@router.get("/startup")
+async def get_startup_profile(top: int = 25):
+    """Get cold-start timings: phases, slowest imports and lazy module loads."""
+    try:
+        return startup.report(top)
+    except Exception as e:
+        raise handle_error(e, "Failed to get startup profile")
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: HTTP routes, upstream calls, background jobs, caches and state."""
+    try:
+        return Response(registry.render(), media_type=CONTENT_TYPE)
+    except Exception as e:
+        raise handle_error(e, "Failed to collect metrics")
+
+
 @router.post("/factory-reset")
 async def system_factory_reset():
     """Perform system-wide factory reset."""
     try:
-        # 1. Clear all runtime data
-        DB.clear()
+        # 1. Reset credentials to the defaults, forget the saved Microsoft login
+        token_cache = Path(SECURE_DB["cache_path"])
         SECURE_DB.clear()
+        SECURE_DB.update(default_secure_db())
+        token_cache.unlink(missing_ok=True)
 
-        # 2. Reinitialize DB with defaults
-        DB.update(
-            {
-                "ms_result": None,
-                "ms_accounts": None,
-                "ms_flow": None,
-                "ms_app": None,
-                "token_cache": msal.SerializableTokenCache(),
-                "untis_session": None,
-                "untis_state": "disconnected",
-                "timeTable": [],
-                "holidays": [],
-                "bus": None,
-                "wifi_device": None,
-                "config": ConfigModel(
-                    model=ClockType.Mini, setup=False, wallmounted=False
-                ),
-            }
-        )
+        # 2. Reset runtime state to defaults, without a saved state to replay on restart
+        for name, value in default_slices().items():
+            store.replace(name, value)
+        journal.reset()
 
-        # 3. Call config API factory reset
-        await config_router.factory_reset()
+        # 3. Write the default config back to the config file
+        if not await save_config(store.get("config")):
+            raise RuntimeError("Failed to save the default config")
 
         # 4. Restart background tasks
         # This will be handled by lifespan management
@@ -0,0 +1,11 @@
+import sys
+from pathlib import Path
+
+MAIN_DIR = Path(__file__).resolve().parents[1]
+DRIVER_DIR = MAIN_DIR.parents[2] / "driver"
+
+# the API modules import each other by name, like uvicorn running in source/API/main
+sys.path.insert(0, str(MAIN_DIR))
+# after the API's own modules, as in render_api
+if str(DRIVER_DIR) not in sys.path:
+    sys.path.append(str(DRIVER_DIR))
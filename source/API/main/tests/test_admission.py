@@ -0,0 +1,40 @@
+import asyncio
+import httpx
+from fastapi import FastAPI
+import admission
+from admission import Limit
+
+
+def test_limit_covers_every_path_of_a_route_template(monkeypatch):
+    app = FastAPI()
+    release = asyncio.Event()
+
+    @app.get("/fleet/clocks/{clock_id}/render/delta")
+    async def delta(clock_id: str):
+        await release.wait()
+        return {"clock": clock_id}
+
+    app.middleware("http")(admission.admission_control)
+    limit = Limit(concurrency=1, queue=0, timeout=1, retry_after=2)
+    monkeypatch.setattr(
+        admission,
+        "LIMITS",
+        {("GET", "/fleet/clocks/{clock_id}/render/delta"): limit},
+    )
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://t"
+        ) as client:
+            first = asyncio.create_task(client.get("/fleet/clocks/a/render/delta"))
+            while not limit.active:
+                await asyncio.sleep(0)
+            shed = await client.get("/fleet/clocks/b/render/delta")
+            release.set()
+            return (await first), shed
+
+    first, shed = asyncio.run(run())
+    assert first.json() == {"clock": "a"}
+    assert shed.status_code == 503 and shed.headers["retry-after"] == "2"
+    assert (limit.admitted, limit.shed) == (1, 1)
@@ -0,0 +1,12 @@
+import pytest
+from pydantic import ValidationError
+from dataClasses import ClockType, ConfigModel
+
+
+def test_quiet_times_are_validated():
+    config = ConfigModel(model=ClockType.Mini, quiet_start="21:30", quiet_end="7:00")
+    assert (config.quiet_start, config.quiet_end) == ("21:30", "07:00")
+
+    for value in ("24:00", "12:60", "7", "noon"):
+        with pytest.raises(ValidationError):
+            ConfigModel(model=ClockType.Mini, quiet_end=value)
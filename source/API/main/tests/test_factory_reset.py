@@ -0,0 +1,36 @@
+import asyncio
+import config_api
+import system_api
+from db import SECURE_DB, default_secure_db, default_slices, store
+from journal import Journal
+from store import Store
+
+
+def test_factory_reset_forgets_saved_login_and_state(tmp_path, monkeypatch):
+    token_cache = tmp_path / "cache.bin"
+    token_cache.write_text("{}")
+    monkeypatch.setitem(SECURE_DB, "cache_path", str(token_cache))
+    monkeypatch.setitem(SECURE_DB, "client_id", "someone-elses-app")
+    monkeypatch.setattr(config_api, "CONFIG_DIR", tmp_path)
+    monkeypatch.setattr(config_api, "CONFIG_FILE", tmp_path / "config.json")
+    journal = Journal(store, tmp_path)
+    monkeypatch.setattr(system_api, "journal", journal)
+    journal.start()
+    store.update("network", wifi_device="/devices/3")
+    journal.flush()
+    journal.compact()
+    store.update("network", wifi_device="/devices/4")
+    journal.flush()
+
+    result = asyncio.run(system_api.system_factory_reset())
+    assert not journal.snapshot_path.exists()
+    assert journal.flush() == 0 and journal.journal_path.stat().st_size == 0
+    journal.close()  # closes the old journal file, compacting the default state
+
+    assert result["status"] == "success"
+    assert not token_cache.exists()
+    assert SECURE_DB == default_secure_db()
+    assert store.get("network").wifi_device is None
+    restored = Store(**default_slices())
+    Journal(restored, tmp_path).replay()
+    assert restored.get("network").wifi_device is None
@@ -0,0 +1,168 @@
+import asyncio
+import datetime
+import pytest
+import fleet
+from dataClasses import (
+    ClockConfig,
+    ClockType,
+    UntisElement,
+    UntisElementType,
+    credentials,
+)
+from fleet import Fleet, group_key
+from untis_api import Period
+
+TEACHER = credentials(username="mue", password="p", server="s", school="x")
+STUDENT = credentials(username="ben", password="p", server="s", school="x")
+
+
+def clock(clock_id, creds=TEACHER, element_type=UntisElementType.Own, name=None):
+    return ClockConfig(
+        clock_id=clock_id,
+        model=ClockType.Mini,
+        untis=creds,
+        untis_element=UntisElement(type=element_type, name=name),
+    )
+
+
+def class_clock(clock_id, name="5a", creds=TEACHER):
+    return clock(clock_id, creds, UntisElementType.Klasse, name)
+
+
+def timetable(subject):
+    start = datetime.datetime.combine(datetime.date.today(), datetime.time(8))
+    return [Period(start=start, end=start.replace(hour=9), subjects=(subject,))]
+
+
+class Session:
+    """A logged in webuntis session: the own timetable is MA, the ones of classes DE."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.fetches = []
+
+    def my_timetable(self, start, end):
+        return self.fetch("own")
+
+    def timetable(self, start, end, klasse):
+        return self.fetch(klasse)
+
+    def fetch(self, element):
+        if self.fail:
+            raise ConnectionError("Untis is down")
+        self.fetches.append(element)
+        return timetable("MA" if element == "own" else "DE")
+
+    def klassen(self):
+        return Classes()
+
+    teachers = rooms = klassen
+
+    def holidays(self):
+        return []
+
+
+class Classes(list):
+    def filter(self, name):
+        return [f"class {name}"]
+
+
+class Login:
+    def __init__(self, session):
+        self.session = session
+        self.closed = 0
+
+    async def get(self):
+        return self.session
+
+    async def close(self):
+        self.closed += 1
+
+
+@pytest.fixture
+def clocks(tmp_path, monkeypatch):
+    """A fleet logging in to one fake session; periods come back resolved."""
+    clocks = Fleet(tmp_path)
+    login = Login(Session())
+    monkeypatch.setattr(clocks, "untis_login", lambda creds: login)
+    monkeypatch.setattr(fleet, "resolve_periods", lambda periods: periods)
+    return clocks
+
+
+def groups(clocks):
+    return sorted(sorted(group.clocks) for group in clocks.groups())
+
+
+def test_group_key_of_own_timetable_and_class():
+    assert group_key(clock("a")) == ("s", "x", "own", "mue")
+    assert group_key(clock("b", STUDENT)) == ("s", "x", "own", "ben")
+    # a class looks the same to every account of the school
+    assert group_key(class_clock("c")) == group_key(class_clock("d", creds=STUDENT))
+    assert group_key(ClockConfig(clock_id="e", model=ClockType.Mini)) is None
+
+
+def test_register_groups_clocks_by_element(clocks):
+    clocks.register(clock("office"))
+    clocks.register(class_clock("room-1"))
+    clocks.register(class_clock("room-2", creds=STUDENT))
+    clocks.register(class_clock("room-3", name="6b"))
+    clocks.register(ClockConfig(clock_id="lobby", model=ClockType.Mini))
+
+    assert groups(clocks) == [["office"], ["room-1", "room-2"], ["room-3"]]
+
+
+def test_changing_the_element_regroups(clocks):
+    clocks.register(class_clock("room-1"))
+    clocks.register(class_clock("room-2"))
+    asyncio.run(clocks.sync_untis())
+
+    partition, refetch = clocks.register(class_clock("room-2", name="6b"))
+
+    assert refetch
+    assert groups(clocks) == [["room-1"], ["room-2"]]
+    assert partition.store.get("untis").updated is None  # not 5a's timetable any more
+
+
+def test_joining_clock_adopts_the_groups_timetable(clocks):
+    clocks.register(class_clock("room-1"))
+    asyncio.run(clocks.sync_untis())
+
+    partition, refetch = clocks.register(class_clock("room-2"))
+
+    assert not refetch
+    untis = partition.store.get("untis")
+    assert untis.timetable == timetable("DE")
+    assert untis.updated == clocks.get("room-1").store.get("untis").updated
+
+
+def test_fetch_group_fans_one_fetch_out(clocks):
+    for clock_id in ("room-1", "room-2", "room-3"):
+        clocks.register(class_clock(clock_id))
+    (group,) = clocks.groups()
+    session = clocks.untis_login(TEACHER).session
+
+    assert asyncio.run(clocks.fetch_group(group))
+
+    assert session.fetches == ["class 5a"]
+    for clock_id in group.clocks:
+        untis = clocks.get(clock_id).store.get("untis")
+        assert untis.connected and untis.timetable == timetable("DE")
+        assert untis.days == fleet.DAYS
+
+
+def test_failed_fetch_disconnects_every_clock_of_the_group(clocks):
+    clocks.register(class_clock("room-1"))
+    clocks.register(class_clock("room-2"))
+    (group,) = clocks.groups()
+    login = clocks.untis_login(TEACHER)
+    asyncio.run(clocks.fetch_group(group))
+    login.session.fail = True
+
+    assert not asyncio.run(clocks.fetch_group(group))
+
+    assert group.failures == 1 and group.error == "Untis is down"
+    assert login.closed == 1
+    for clock_id in group.clocks:
+        untis = clocks.get(clock_id).store.get("untis")
+        assert not untis.connected
+        assert untis.timetable == timetable("DE")  # the last one stays on screen
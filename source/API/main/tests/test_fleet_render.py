@@ -0,0 +1,41 @@
+import asyncio
+import datetime
+import framedelta
+import render_api
+from dataClasses import ClockConfig, ClockType
+from fleet import ClockPartition
+from render_api import delta_response, render_frame
+
+AT = datetime.datetime(2026, 10, 19, 9, 0)
+CLOCKS = render_api.MAX_FRAMES + 8
+
+
+def test_every_clock_keeps_its_delta_base():
+    """More clocks showing different frames than one renderer caches frames for."""
+    partitions = [
+        ClockPartition(ClockConfig(clock_id=f"room-{i}", model=ClockType.Mini))
+        for i in range(CLOCKS)
+    ]
+
+    async def poll(partition, at, base=None):
+        frame = await render_frame(
+            at, False, ClockType.Mini, False, partition.views, partition.frames
+        )
+        response = await delta_response(frame, base, 1 if base else 0, partition.frames)
+        return frame, response.body
+
+    async def run():
+        frames = []
+        for i, partition in enumerate(partitions):
+            frame, message = await poll(partition, AT + datetime.timedelta(minutes=i))
+            assert framedelta.isKeyframe(message)
+            frames.append(frame)
+        for i, partition in enumerate(partitions):
+            at = AT + datetime.timedelta(minutes=CLOCKS + i)
+            _, message = await poll(partition, at, frames[i].digest)
+            assert not framedelta.isKeyframe(message)
+
+    renders = render_api.renderer.renders
+    asyncio.run(run())
+    assert render_api.renderer.renders == renders  # this clock's cache left alone
+    assert all(p.frames.deltas == 1 for p in partitions)
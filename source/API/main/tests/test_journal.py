@@ -0,0 +1,156 @@
+import asyncio
+import datetime
+import os
+from db import default_slices
+from journal import JOURNAL, SNAPSHOT, Journal
+from store import Store
+from untis_api import Period
+from viewmodel import ViewModelBuilder
+
+NOW = datetime.datetime(2026, 10, 19, 9, 10)
+
+
+def periods():
+    return [
+        Period(
+            start=NOW.replace(hour=8, minute=0),
+            end=NOW.replace(hour=8, minute=45),
+            subjects=("MA",),
+            rooms=("A1",),
+            teachers=("Mül",),
+            classes=("5a",),
+        ),
+        Period(
+            start=NOW.replace(hour=9, minute=0),
+            end=NOW.replace(hour=9, minute=45),
+            code="cancelled",
+            subjects=("DE",),
+            rooms=("B2",),
+        ),
+    ]
+
+
+def journaled_store(directory):
+    """A store whose untis slice went through the journal at `directory`."""
+    store = Store(**default_slices())
+    journal = Journal(store, directory)
+    journal.start()
+    store.update("untis", timetable=periods(), updated=1.0, days=10, connected=True)
+    assert journal.flush() == 1
+    journal.close()
+    return store
+
+
+def test_replay_restores_plain_periods_without_a_session(tmp_path):
+    journaled_store(tmp_path)
+    store = Store(**default_slices())
+    assert Journal(store, tmp_path).replay()
+    untis = store.get("untis")
+    assert untis.session is None
+    assert untis.connected is False
+    assert untis.timetable == periods()
+    assert untis.days == 10
+
+
+def test_view_model_of_replayed_timetable(tmp_path):
+    journaled_store(tmp_path)
+    store = Store(**default_slices())
+    Journal(store, tmp_path).replay()
+    view = ViewModelBuilder(store, now=lambda: NOW).current()
+    first, second = view["columns"][0]["slots"][:2]
+    assert (first["subject"], first["room"], first["start"]) == ("MA", "A1", "08:00")
+    assert first["current"] is False
+    assert second["cancelled"] is True and second["current"] is True
+
+
+def test_replay_applies_journal_on_top_of_snapshot(tmp_path):
+    store = Store(**default_slices())
+    journal = Journal(store, tmp_path)
+    journal.start()
+    store.update("network", wifi_device="/dev/wlan0")
+    journal.flush()
+    journal.compact()
+    store.update("network", wifi_device="/dev/wlan1")
+    journal.flush()
+    journal.close()
+
+    restored = Store(**default_slices())
+    Journal(restored, tmp_path).replay()
+    assert restored.get("network").wifi_device == "/dev/wlan1"
+
+
+def test_replay_stops_at_torn_record(tmp_path):
+    store = Store(**default_slices())
+    journal = Journal(store, tmp_path)
+    journal.start()
+    store.update("network", wifi_device="/dev/wlan0")
+    journal.flush()
+    store.update("network", wifi_device="/dev/wlan1")
+    journal.flush()
+    os.close(journal._fd)  # crash: no clean close, no compaction
+    journal._fd = None
+    path = tmp_path / JOURNAL
+    data = path.read_bytes()
+    path.write_bytes(data[:-5])  # power cut in the middle of the second record
+
+    restored = Store(**default_slices())
+    replaying = Journal(restored, tmp_path)
+    replaying.replay()
+    assert restored.get("network").wifi_device == "/dev/wlan0"
+    assert replaying.discarded == 1
+    assert path.read_bytes() == data[: data.index(b"\n") + 1]
+    assert not (tmp_path / SNAPSHOT).exists()
+
+
+def test_replay_discards_corrupt_snapshot(tmp_path):
+    store = Store(**default_slices())
+    journal = Journal(store, tmp_path)
+    journal.start()
+    store.update("network", wifi_device="/dev/wlan0")
+    journal.flush()
+    journal.close()  # compacts: the value is in the snapshot
+    path = tmp_path / SNAPSHOT
+    path.write_bytes(path.read_bytes().replace(b"wlan0", b"wlan9"))
+
+    restored = Store(**default_slices())
+    assert Journal(restored, tmp_path).replay() is False
+    assert restored.get("network").wifi_device is None
+
+
+def test_current_period_moving_on_writes_no_record(tmp_path):
+    store = Store(**default_slices())
+    journal = Journal(store, tmp_path)
+    journal.start()
+    store.update("untis", timetable=periods(), updated=1.0, days=10)
+    assert journal.flush() == 1
+    store.update("untis", current_period=periods()[0], next_period=periods()[1])
+    assert journal.dirty == set()
+    assert journal.flush() == 0
+    journal.close()
+
+
+def test_refetching_the_same_timetable_writes_no_record(tmp_path):
+    store = Store(**default_slices())
+    journal = Journal(store, tmp_path)
+    journal.start()
+    store.update("untis", timetable=periods(), updated=1.0, days=10)
+    assert journal.flush() == 1
+    store.update("untis", timetable=periods(), updated=61.0, days=10)
+    assert journal.flush() == 0
+    store.update("untis", timetable=periods()[:1], updated=121.0)
+    assert journal.flush() == 1
+    journal.close()
+
+    restored = Store(**default_slices())
+    Journal(restored, tmp_path).replay()
+    assert restored.get("untis").updated == 121.0
+
+
+def test_run_flushes_dirty_slices(tmp_path):
+    store = Store(**default_slices())
+    journal = Journal(store, tmp_path)
+    journal.start()
+    store.update("network", wifi_device="/dev/wlan0")
+    asyncio.run(journal.run())
+    assert journal.flushes == 1 and journal.dirty == set()
+    journal.close()
@@ -0,0 +1,97 @@
+import pytest
+from metrics import Counter, Gauge, Registry, stats_metrics, upstream, upstream_calls
+
+
+def by_name(metrics):
+    return {metric.name: metric for metric in metrics}
+
+
+def test_stats_metrics_counters_and_gauges():
+    metrics = by_name(
+        stats_metrics(
+            "openclock_cache",
+            "Response cache",
+            {"hits": 7, "entries": 3, "enabled": True, "last": None, "mode": "lru"},
+            counters=("hits",),
+        )
+    )
+    assert set(metrics) == {
+        "openclock_cache_hits_total",
+        "openclock_cache_entries",
+        "openclock_cache_enabled",
+    }
+    assert isinstance(metrics["openclock_cache_hits_total"], Counter)
+    assert isinstance(metrics["openclock_cache_entries"], Gauge)
+    assert list(metrics["openclock_cache_enabled"].samples()) == [
+        "openclock_cache_enabled 1"
+    ]
+
+
+def test_stats_metrics_with_label_shares_families():
+    metrics = by_name(
+        stats_metrics(
+            "openclock_job",
+            "Jobs",
+            {"sync": {"runs": 2, "seconds": 0.5}, "refresh": {"runs": 1}},
+            counters=("runs",),
+            label="job",
+        )
+    )
+    assert list(metrics["openclock_job_runs_total"].samples()) == [
+        'openclock_job_runs_total{job="sync"} 2',
+        'openclock_job_runs_total{job="refresh"} 1',
+    ]
+    assert list(metrics["openclock_job_seconds"].samples()) == [
+        'openclock_job_seconds{job="sync"} 0.5'
+    ]
+
+
+def test_registry_render():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    requests.inc(route='/a"b')
+    requests.inc(2, route='/a"b')
+    duration = registry.histogram("duration_seconds", "Duration", buckets=(0.1, 1))
+    duration.observe(0.05)
+    duration.observe(0.5)
+    duration.observe(5)
+    registry.collector(lambda: [Gauge("collected", "From a collector")])
+
+    def broken():
+        raise RuntimeError("source gone")
+
+    registry.collector(broken)
+
+    assert registry.render() == "\n".join(
+        [
+            "# HELP requests_total Requests",
+            "# TYPE requests_total counter",
+            'requests_total{route="/a\\"b"} 3',
+            "# HELP duration_seconds Duration",
+            "# TYPE duration_seconds histogram",
+            'duration_seconds_bucket{le="0.1"} 1',
+            'duration_seconds_bucket{le="1"} 2',
+            'duration_seconds_bucket{le="+Inf"} 3',
+            "duration_seconds_sum 5.55",
+            "duration_seconds_count 3",
+            "# HELP collected From a collector",
+            "# TYPE collected gauge",
+            "",
+        ]
+    )
+    assert registry.collector_errors == 1
+
+
+def test_upstream_counts_outcomes():
+    def calls(outcome):
+        return upstream_calls._values.get(("test", "op", outcome), 0)
+
+    with upstream("test", "op"):
+        pass
+    with upstream("test", "op") as call:
+        call.fail()
+    with pytest.raises(ValueError):
+        with upstream("test", "op"):
+            raise ValueError()
+
+    assert (calls("ok"), calls("error")) == (1, 2)
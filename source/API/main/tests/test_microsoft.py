@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import pytest
+from fastapi import HTTPException
+import microsoft_api
+from db import default_slices
+from store import Store
+
+
+class FakeApp:
+    def __init__(self, result):
+        self.result = result
+        self.threads = []
+
+    def acquire_token_by_device_flow(self, flow):
+        self.threads.append(threading.get_ident())
+        return self.result
+
+    def get_accounts(self):
+        return [{"username": "someone@example.org"}]
+
+
+def logging_in(monkeypatch, result):
+    store = Store(**default_slices())
+    store.update("microsoft", flow={"user_code": "ABC", "expires_at": 0})
+    app = FakeApp(result)
+
+    async def load_msal_app():
+        return app
+
+    monkeypatch.setattr(microsoft_api, "store", store)
+    monkeypatch.setattr(microsoft_api, "load_msal_app", load_msal_app)
+    monkeypatch.setattr(microsoft_api, "save_token_cache", lambda: None)
+    return store, app
+
+
+def test_device_flow_completes_in_a_thread(monkeypatch):
+    token = {"access_token": "t", "expires_on": 0}
+    store, app = logging_in(monkeypatch, token)
+
+    assert asyncio.run(microsoft_api.device_flow_token()) == token
+    assert app.threads and threading.get_ident() not in app.threads
+    microsoft = store.get("microsoft")
+    assert microsoft.result == token and microsoft.flow is None
+    assert microsoft.accounts == app.get_accounts()
+
+
+def test_failed_device_flow_is_not_stored(monkeypatch):
+    store, _ = logging_in(monkeypatch, {"error": "expired_token"})
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(microsoft_api.fetch_messages())
+    assert error.value.status_code == 401
+    microsoft = store.get("microsoft")
+    assert microsoft.result is None and microsoft.flow is None
+
+
+def test_refresh_job_raises_when_no_token_is_obtained(monkeypatch):
+    store = Store(**default_slices())
+    store.update("microsoft", result={"access_token": "old"})
+    monkeypatch.setattr(microsoft_api, "store", store)
+
+    asyncio.run(
+        microsoft_api.ms_refresh_token()
+    )  # nobody in the token cache: nothing to do
+
+    async def no_token():
+        return False
+
+    monkeypatch.setattr(microsoft_api, "acquire_token_silently", no_token)
+    store.get("microsoft").token_cache.find = lambda kind: [{"username": "someone"}]
+    with pytest.raises(RuntimeError):
+        asyncio.run(microsoft_api.ms_refresh_token())
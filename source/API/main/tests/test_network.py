@@ -0,0 +1,62 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import network_api
+from db import default_slices
+from metrics import upstream_duration
+from store import Store
+
+WIRELESS = "org.freedesktop.NetworkManager.Device.Wireless"
+ACCESS_POINT = "org.freedesktop.NetworkManager.AccessPoint"
+
+
+class FakeObject:
+    """NetworkManager device and access point objects, and their D-Bus interfaces."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def Get(self, interface, name):
+        if interface == WIRELESS:
+            return "/ap/1"  # ActiveAccessPoint
+        return {"Ssid": b"school", "Strength": 70, "HwAddress": "aa:bb"}[name]
+
+    def RequestScan(self, options):
+        pass
+
+    def GetAccessPoints(self):
+        return ["/ap/1"]
+
+
+def scan_seconds(operation):
+    series = upstream_duration._series.get(("dbus", operation))
+    return series[1] if series else 0.0
+
+
+def test_scan_times_dbus_calls_not_the_wait(monkeypatch):
+    async def wait(seconds):
+        time.sleep(0.2)  # stands in for the wait for the scan to complete
+
+    monkeypatch.setattr(network_api, "store", Store(**default_slices()))
+    monkeypatch.setattr(
+        network_api,
+        "init_dbus",
+        lambda: SimpleNamespace(get_object=lambda name, path: FakeObject(path)),
+    )
+    monkeypatch.setattr(network_api, "get_wifi_device", lambda: "/devices/3")
+    monkeypatch.setattr(
+        network_api,
+        "dbus",
+        SimpleNamespace(
+            Interface=lambda obj, name: obj, Dictionary=lambda *args, **kwargs: {}
+        ),
+    )
+    monkeypatch.setattr(network_api, "asyncio", SimpleNamespace(sleep=wait))
+    before = scan_seconds("scan") + scan_seconds("access_points")
+
+    networks = asyncio.run(network_api.scan_access_points())
+
+    assert networks == [
+        {"ssid": "school", "strength": 70, "connected": True, "id": "aa:bb_school"}
+    ]
+    assert scan_seconds("scan") + scan_seconds("access_points") - before < 0.1
@@ -0,0 +1,84 @@
+import asyncio
+import datetime
+import threading
+from db import default_slices
+from shared_state import SharedState, merge
+from store import Store
+from untis_api import Period
+
+
+def worker(path):
+    store = Store(**default_slices())
+    shared = SharedState(str(path), store)
+    shared.start()
+    return store, shared
+
+
+async def settle(*workers):
+    """Wait for queued publishes, then pull everywhere."""
+    for _, shared in workers:
+        await shared.drain()
+    for _, shared in workers:
+        await shared.sync()
+
+
+def test_merge_keeps_fields_each_side_changed():
+    base = '{"setup": false, "wallmounted": false}'
+    ours = '{"setup": true, "wallmounted": false}'
+    theirs = '{"setup": false, "wallmounted": true}'
+    assert merge(base, ours, theirs) == '{"setup": true, "wallmounted": true}'
+
+
+def test_concurrent_edits_of_one_slice_both_survive(tmp_path):
+    async def run():
+        a = worker(tmp_path / "state.db")
+        b = worker(tmp_path / "state.db")
+        a[0].update("config", setup=True)
+        b[0].update("config", wallmounted=True)
+        await settle(a, b)
+        for store, shared in (a, b):
+            config = store.get("config")
+            assert (config.setup, config.wallmounted) == (True, True)
+            shared.close()
+        assert a[1].merges + b[1].merges == 1  # whichever wrote second
+
+    asyncio.run(run())
+
+
+def test_publish_writes_off_the_event_loop(tmp_path):
+    async def run():
+        store, shared = worker(tmp_path / "state.db")
+        threads = []
+        write = shared.write
+        shared.write = lambda *args: threads.append(threading.get_ident()) or write(
+            *args
+        )
+        store.update("network", wifi_device="/devices/3")
+        assert threads == []  # queued, not written inside the commit
+        await settle((store, shared))
+        assert threads and threading.get_ident() not in threads
+        assert shared.publishes == 1
+        shared.close()
+
+    asyncio.run(run())
+
+
+def test_timetable_is_shared_with_its_fetch_time(tmp_path):
+    async def run():
+        leader = worker(tmp_path / "state.db")
+        follower = worker(tmp_path / "state.db")
+        now = datetime.datetime.now().replace(microsecond=0)
+        period = Period(
+            start=now - datetime.timedelta(minutes=5),
+            end=now + datetime.timedelta(minutes=40),
+            subjects=("MA",),
+        )
+        leader[0].update("untis", timetable=[period], updated=123.0, days=10)
+        await settle(leader, follower)
+        untis = follower[0].get("untis")
+        assert untis.timetable == [period] and untis.current_period == period
+        assert (untis.updated, untis.days) == (123.0, 10)
+        for _, shared in (leader, follower):
+            shared.close()
+
+    asyncio.run(run())
@@ -0,0 +1,64 @@
+import asyncio
+from pydantic import BaseModel
+from store import Store
+
+
+class Counter(BaseModel):
+    value: int = 0
+    label: str = ""
+
+
+def make_store(history=256):
+    return Store(history=history, a=Counter(), b=Counter())
+
+
+def test_changes_since_returns_later_changes_in_order():
+    store = make_store()
+    store.update("a", value=1)
+    store.update("b", label="x")
+    store.update("a", value=2, label="y")
+
+    changes = store.changes_since(1)
+    assert [(c.sequence, c.slice, c.version) for c in changes] == [
+        (2, "b", 1),
+        (3, "a", 2),
+    ]
+    assert changes[1].changed == ("value", "label")
+    assert changes[1].value is store.get("a")
+    assert store.changes_since(0)[0].value.value == 1
+    assert store.changes_since(store.sequence()) == []
+
+
+def test_unchanged_update_is_not_recorded():
+    store = make_store()
+    store.update("a", value=1)
+    assert store.update("a", value=1) is store.get("a")
+    assert store.sequence() == 1
+    assert store.version("a") == 1
+    assert len(store.changes_since(0)) == 1
+
+
+def test_changes_since_beyond_history_is_none():
+    store = make_store(history=3)
+    for value in range(1, 6):
+        store.update("a", value=value)
+
+    assert store.changes_since(1) is None
+    assert [c.value.value for c in store.changes_since(2)] == [3, 4, 5]
+    assert store.changes_since(4)[0].sequence == 5
+
+
+def test_subscribers_and_listeners_see_each_commit():
+    store = make_store()
+    heard = []
+    store.add_listener(lambda change: heard.append(change.sequence))
+
+    async def run():
+        with store.subscribe(slices=["b"]) as subscription:
+            store.update("a", value=1)
+            store.update("b", value=1)
+            return await asyncio.wait_for(subscription.get(), 1)
+
+    change = asyncio.run(run())
+    assert (change.slice, change.sequence) == ("b", 2)
+    assert heard == [1, 2]
@@ -0,0 +1,148 @@
+import asyncio
+import datetime
+import webuntis
+import untis_api
+from dataClasses import credentials
+from db import SECURE_DB, default_slices
+from store import Store
+from untis_api import DISPLAY_DAYS, Period, format_timetable, resolve_periods
+
+
+class Element:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class Elements(list):
+    def filter(self, id):
+        return [element for element in self if element.id in id]
+
+
+class Session:
+    """Master data of a session, as the webuntis period objects look it up."""
+
+    def subjects(self, from_cache=False):
+        return Elements([Element(1, "MA"), Element(2, "DE")])
+
+    def rooms(self, from_cache=False):
+        return Elements([Element(10, "A1")])
+
+    def klassen(self, from_cache=False):
+        return Elements([Element(20, "5a")])
+
+    def teachers(self, from_cache=False):
+        raise webuntis.errors.RemoteError("no right for getTeachers()")
+
+    def my_timetable(self, start, end):
+        """A math period every day of the range."""
+        self.ranges = getattr(self, "ranges", []) + [(end - start).days]
+        return [
+            period_object(
+                int((start + datetime.timedelta(days=day)).strftime("%Y%m%d")),
+                800,
+                845,
+                su=[{"id": 1}],
+            )
+            for day in range((end - start).days)
+        ]
+
+
+def period_object(date, start, end, **data):
+    return webuntis.objects.PeriodObject(
+        data={"date": date, "startTime": start, "endTime": end, **data},
+        parent=None,
+        session=Session(),
+    )
+
+
+def test_resolve_periods_sorts_and_resolves_names():
+    timetable = [
+        period_object(
+            20261019, 900, 945, su=[{"id": 2}], kl=[], ro=[], code="cancelled"
+        ),
+        period_object(
+            20261019,
+            800,
+            845,
+            su=[{"id": 1}],
+            ro=[{"id": 10}],
+            kl=[{"id": 20}],
+            te=[{"id": 30}],
+        ),
+    ]
+    first, second = resolve_periods(timetable)
+    assert first == Period(
+        start=datetime.datetime(2026, 10, 19, 8, 0),
+        end=datetime.datetime(2026, 10, 19, 8, 45),
+        subjects=("MA",),
+        rooms=("A1",),
+        classes=("5a",),
+    )  # teachers the account may not list are left out
+    assert second.code == "cancelled" and second.subjects == ("DE",)
+
+
+def test_resolve_periods_without_elements():
+    (period,) = resolve_periods([period_object(20261019, 800, 845)])
+    assert period.subjects == period.rooms == period.classes == ()
+
+
+def test_period_record_round_trip():
+    period = Period(
+        start=datetime.datetime(2026, 10, 19, 8, 0),
+        end=datetime.datetime(2026, 10, 19, 8, 45),
+        code="irregular",
+        subjects=("MA",),
+        teachers=("Mül", "Sch"),
+    )
+    assert Period.from_record(period.record()) == period
+
+
+def test_format_timetable_reads_plain_periods():
+    today = datetime.date.today()
+    start = datetime.datetime.combine(today, datetime.time(8))
+    period = Period(
+        start=start,
+        end=start + datetime.timedelta(minutes=45),
+        subjects=("MA",),
+        teachers=("Mül",),
+    )
+    later = period._replace(start=start + datetime.timedelta(days=3))
+    assert format_timetable([period, later], 1) == [
+        {
+            "subject": "MA",
+            "start": start.strftime("%Y-%m-%d %H:%M"),
+            "end": period.end.strftime("%Y-%m-%d %H:%M"),
+            "room": "Unknown",
+            "teachers": ["Mül"],
+            "classes": [],
+        }
+    ]
+
+
+def test_short_requests_still_store_the_days_the_display_needs(monkeypatch):
+    store = Store(**default_slices())
+    session = Session()
+    store.update("untis", session=session, connected=True)
+
+    async def session_is_fresh():
+        return True
+
+    monkeypatch.setattr(untis_api, "store", store)
+    monkeypatch.setattr(untis_api, "refresh_session_if_needed", session_is_fresh)
+    monkeypatch.setitem(
+        SECURE_DB,
+        "untis_creds",
+        credentials(username="u", password="p", server="s", school="x"),
+    )
+
+    async def run():
+        return await asyncio.gather(
+            untis_api.set_timetable(1), untis_api.set_timetable(DISPLAY_DAYS)
+        )
+
+    assert asyncio.run(run()) == [True, True]
+    assert session.ranges == [DISPLAY_DAYS]  # one fetch for both
+    untis = store.get("untis")
+    assert untis.days == DISPLAY_DAYS and len(untis.timetable) == DISPLAY_DAYS
+    assert len(format_timetable(untis.timetable, 1)) == 1
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import fleet
+import microsoft_api
+import network_api
+from dataClasses import ClockConfig, ClockType
+from db import default_slices
+from store import Store
+
+
+def record_commits(store):
+    commits = []
+    store.add_listener(lambda change: commits.append(threading.get_ident()))
+    return commits
+
+
+def test_msal_app_built_in_thread_stored_on_loop(monkeypatch):
+    store = Store(**default_slices())
+    monkeypatch.setattr(microsoft_api, "store", store)
+    monkeypatch.setattr(
+        microsoft_api, "build_msal_app", lambda cache: ("app", threading.get_ident())
+    )
+    commits = record_commits(store)
+
+    app = asyncio.run(microsoft_api.load_msal_app())
+    assert app[1] != threading.get_ident()
+    assert store.get("microsoft").app is app
+    assert commits and set(commits) == {threading.get_ident()}
+    assert asyncio.run(microsoft_api.load_msal_app()) is app
+
+
+def test_fleet_msal_app_built_in_thread_stored_on_loop(monkeypatch):
+    partition = fleet.ClockPartition(
+        ClockConfig(clock_id="room-101", model=ClockType.Mini)
+    )
+    monkeypatch.setattr(
+        fleet, "build_msal_app", lambda cache: ("app", threading.get_ident())
+    )
+    commits = record_commits(partition.store)
+
+    app = asyncio.run(fleet.Fleet(fleet.FLEET_DIR).msal_app(partition))
+    assert app[1] != threading.get_ident()
+    microsoft = partition.store.get("microsoft")
+    assert microsoft.app is app and microsoft.token_cache is not None
+    assert commits and set(commits) == {threading.get_ident()}
+
+
+def test_wifi_device_looked_up_in_thread_stored_on_loop(monkeypatch):
+    store = Store(**default_slices())
+    threads = []
+    monkeypatch.setattr(network_api, "store", store)
+    monkeypatch.setattr(
+        network_api,
+        "dbus",
+        SimpleNamespace(SystemBus=lambda: threads.append(threading.get_ident())),
+    )
+    monkeypatch.setattr(
+        network_api,
+        "find_wifi_device",
+        lambda bus: threads.append(threading.get_ident()) or "/devices/3",
+    )
+    commits = record_commits(store)
+
+    assert asyncio.run(network_api.load_wifi_device()) == "/devices/3"
+    assert store.get("network").wifi_device == "/devices/3"
+    assert threading.get_ident() not in threads
+    assert commits and set(commits) == {threading.get_ident()}
@@ -1,22 +1,31 @@
-from fastapi import APIRouter, HTTPException
-import webuntis
+from fastapi import APIRouter, HTTPException, Request
 import logging
 import asyncio
 import json
 import traceback
 import datetime
 import time
-from typing import Optional
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 from util import log
+from metrics import upstream
+from startup import lazy_import
+from singleflight import single_flight
+from response_cache import responses
 from pathlib import Path
-import webuntis.errors
-from db import DB, SECURE_DB
+from db import store, SECURE_DB
 from dataClasses import credentials
 
+webuntis = lazy_import("webuntis")
+
 router = APIRouter(prefix="/untis", tags=["Untis"])
 
 # Add new constant for session timeout
 SESSION_TIMEOUT = 1800  # 30 minutes in seconds
+# Seconds a fetched timetable is served before /timetable fetches it again
+TIMETABLE_MAX_AGE = 120  # untis_update refreshes it every minute
+# Days the display shows (today, tomorrow, the next school day); the stored timetable always
+# covers at least these, shorter requests are cut from it
+DISPLAY_DAYS = 10
 LAST_SESSION_REFRESH = time.time()
 
 
@@ -33,6 +42,72 @@ class UntisCredentialsError(Exception):
     pass
 
 
+# --- Periods ---
+class Period(NamedTuple):
+    """A timetable period with the names of its elements resolved.
+
+    Plain data, unlike webuntis PeriodObjects that look names up through their session: a
+    restored, shared or rendered period never needs a login or the network.
+    """
+
+    start: datetime.datetime
+    end: datetime.datetime
+    code: Optional[str] = None  # None, "cancelled" or "irregular"
+    subjects: Tuple[str, ...] = ()
+    rooms: Tuple[str, ...] = ()
+    teachers: Tuple[str, ...] = ()
+    classes: Tuple[str, ...] = ()
+
+    def record(self) -> Dict[str, Any]:
+        """JSON-safe form, for the journal and shared state."""
+        return {
+            **self._asdict(),
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Period":
+        return cls(
+            start=datetime.datetime.fromisoformat(record["start"]),
+            end=datetime.datetime.fromisoformat(record["end"]),
+            code=record.get("code"),
+            subjects=tuple(record.get("subjects", ())),
+            rooms=tuple(record.get("rooms", ())),
+            teachers=tuple(record.get("teachers", ())),
+            classes=tuple(record.get("classes", ())),
+        )
+
+
+def element_names(period, attribute: str) -> Tuple[str, ...]:
+    try:
+        return tuple(element.name for element in getattr(period, attribute))
+    except (KeyError, webuntis.errors.Error):
+        # the period has no such elements, or the account may not list them
+        return ()
+
+
+def resolve_periods(timetable: list) -> List[Period]:
+    """Plain periods of webuntis PeriodObjects, sorted by start time.
+
+    Looks the names up in the session's master data (cached per session), so it blocks:
+    run it in a thread, right after the fetch.
+    """
+    periods = [
+        Period(
+            start=period.start,
+            end=period.end,
+            code=period.code,
+            subjects=element_names(period, "subjects"),
+            rooms=element_names(period, "rooms"),
+            teachers=element_names(period, "teachers"),
+            classes=element_names(period, "klassen"),
+        )
+        for period in timetable
+    ]
+    return sorted(periods, key=lambda period: period.start)
+
+
 # --- Session Management ---
 async def refresh_session_if_needed():
     """Check and refresh session if timeout exceeded."""
@@ -41,10 +116,10 @@ async def refresh_session_if_needed():
     current_time = time.time()
     if current_time - LAST_SESSION_REFRESH > SESSION_TIMEOUT:
         try:
-            if DB.get("untis_session"):
-                DB["untis_session"].logout()
-            DB["untis_session"] = None
-            DB["untis_state"] = False
+            session = store.get("untis").session
+            if session:
+                session.logout()
+            store.update("untis", session=None, connected=False)
             success = await set_untis_session()
             if success:
                 LAST_SESSION_REFRESH = current_time
@@ -60,7 +135,11 @@ async def set_untis_session():
     """Initialize Untis session with context manager."""
     try:
         if not SECURE_DB.get("untis_creds"):
-            raise UntisCredentialsError("No credentials configured")
+            # another worker may have saved them (shared state mode)
+            try:
+                load_credentials()
+            except Exception:
+                raise UntisCredentialsError("No credentials configured")
 
         creds = SECURE_DB["untis_creds"]
         retry_count = 3
@@ -69,9 +148,10 @@ async def set_untis_session():
         while retry_count > 0:
             try:
                 # Force new session
-                if DB.get("untis_session"):
+                old_session = store.get("untis").session
+                if old_session:
                     try:
-                        DB["untis_session"].logout()
+                        old_session.logout()
                     except:
                         pass
 
@@ -81,10 +161,12 @@ async def set_untis_session():
                     server=creds.server,
                     school=creds.school,
                     useragent="OpenClock",
-                ).login()
+                )
+                # blocking HTTP, keep it off the event loop
+                with upstream("untis", "login"):
+                    session = await asyncio.to_thread(session.login)
 
-                DB["untis_session"] = session
-                DB["untis_state"] = True
+                store.update("untis", session=session, connected=True)
                 global LAST_SESSION_REFRESH
                 LAST_SESSION_REFRESH = time.time()
                 log("Untis session established", module="untis")
@@ -103,12 +185,18 @@ async def set_untis_session():
                 delay *= 2  # Exponential backoff
 
     except Exception as e:
-        DB["untis_state"] = False
+        store.update("untis", connected=False)
         log(f"Failed to create Untis session: {str(e)}", level="error", module="untis")
         return False
 
 
-async def set_timetable(dayRange: int) -> bool:
+async def set_timetable(dayRange: int = DISPLAY_DAYS) -> bool:
+    """Get and store the timetable of the next `dayRange` days, at least DISPLAY_DAYS."""
+    return await fetch_timetable(max(dayRange, DISPLAY_DAYS))
+
+
+@single_flight("untis.timetable")
+async def fetch_timetable(dayRange: int) -> bool:
     """Get and store timetable data."""
     try:
         if not await refresh_session_if_needed():
@@ -119,7 +207,7 @@ async def set_timetable(dayRange: int) -> bool:
             log("No Untis credentials configured", level="error", module="untis")
             return False
 
-        if not DB.get("untis_session"):
+        if not store.get("untis").session:
             log("No active Untis session", level="error", module="untis")
             if not await set_untis_session():
                 return False
@@ -129,14 +217,28 @@ async def set_timetable(dayRange: int) -> bool:
         end_date = start_date + datetime.timedelta(days=dayRange)
 
         # Get timetable for current student
-        timetable = DB["untis_session"].my_timetable(
-            start=start_date,
-            end=end_date,
-        )
+        with upstream("untis", "timetable"):
+            timetable = await asyncio.to_thread(
+                store.get("untis").session.my_timetable,
+                start=start_date,
+                end=end_date,
+            )
+            # names are looked up now, not by whoever reads the timetable later
+            timetable = await asyncio.to_thread(resolve_periods, timetable)
 
         if timetable:
-            DB["timeTable"] = sorted(timetable, key=lambda x: x.start, reverse=False)
-            log(f"Fetched {len(DB['timeTable'])} timetable entries", module="untis")
+            current_period, next_period = find_periods(
+                timetable, datetime.datetime.now()
+            )
+            store.update(
+                "untis",
+                timetable=timetable,
+                current_period=current_period,
+                next_period=next_period,
+                updated=time.time(),
+                days=dayRange,
+            )
+            log(f"Fetched {len(timetable)} timetable entries", module="untis")
             return True
 
         log("No timetable entries found", level="warning", module="untis")
@@ -153,9 +255,12 @@ async def set_timetable(dayRange: int) -> bool:
 async def set_next_holiday() -> bool:
     """Update holiday data."""
     try:
-        if not DB["untis_session"]:
+        session = store.get("untis").session
+        if not session:
             return False
-        DB["holidays"] = DB["untis_session"].holidays()
+        with upstream("untis", "holidays"):
+            holidays = await asyncio.to_thread(session.holidays)
+        store.update("untis", holidays=list(holidays))
         return True
     except Exception as e:
         logging.error(f"Failed to fetch holidays: {e}")
@@ -163,6 +268,17 @@ async def set_next_holiday() -> bool:
 
 
 # --- Utility Functions ---
+def find_periods(timetable: list, now: datetime.datetime) -> tuple:
+    """Current and next period of a timetable sorted by start time."""
+    current_period = None
+    for period in timetable:
+        if period.start <= now < period.end:
+            current_period = current_period or period
+        elif period.start > now:
+            return current_period, period
+    return current_period, None
+
+
 def handle_error(e: Exception, message: str) -> HTTPException:
     """Utility function for consistent error handling."""
     tb = traceback.extract_tb(e.__traceback__)
@@ -172,6 +288,13 @@ def handle_error(e: Exception, message: str) -> HTTPException:
     return HTTPException(status_code=500, detail=f"{message}: {str(e)} at {error_loc}")
 
 
+def load_credentials():
+    """Load saved Untis credentials into SECURE_DB."""
+    with open("creds.json", "r") as f:
+        SECURE_DB["untis_creds"] = credentials(**json.load(f))
+    return SECURE_DB["untis_creds"]
+
+
 async def save_credentials(creds: dict):
     """Save Untis credentials to file."""
     try:
@@ -236,83 +359,98 @@ async def setCreds(cred: credentials):
         raise handle_error(e, "Failed to set credentials")
 
 
+def format_timetable(timetable: list, dayRange: int) -> list:
+    """Timetable entries of the next `dayRange` days as plain dicts."""
+    end = datetime.datetime.combine(
+        datetime.date.today() + datetime.timedelta(days=dayRange), datetime.time()
+    )
+    formatted_timetable = []
+    for entry in timetable:
+        if entry.start >= end:
+            break
+        formatted_timetable.append(
+            {
+                "subject": entry.subjects[0] if entry.subjects else "Unknown",
+                "start": entry.start.strftime("%Y-%m-%d %H:%M"),
+                "end": entry.end.strftime("%Y-%m-%d %H:%M"),
+                "room": entry.rooms[0] if entry.rooms else "Unknown",
+                "teachers": list(entry.teachers),
+                "classes": list(entry.classes),
+            }
+        )
+    return formatted_timetable
+
+
+def timetable_is_fresh(dayRange: int) -> bool:
+    """Whether the stored timetable can answer a request for `dayRange` days."""
+    untis = store.get("untis")
+    if untis.updated is None or time.time() - untis.updated > TIMETABLE_MAX_AGE:
+        return False
+    return untis.days >= dayRange
+
+
 @router.get("/timetable")
-async def get_timetable(dayRange: int = 10):
-    """Get timetable for specified day range."""
+async def get_timetable(request: Request, dayRange: int = 10):
+    """Get timetable for specified day range, served from the response cache."""
     try:
-        if not await set_timetable(dayRange):
-            raise ValueError("Failed to fetch timetable")
-
-        timetable = DB.get("timeTable", [])
-
-        # Format response
-        formatted_timetable = []
-        for entry in timetable:
-            formatted_timetable.append(
-                {
-                    "subject": entry.subjects[0].name if entry.subjects else "Unknown",
-                    "start": entry.start.strftime("%Y-%m-%d %H:%M"),
-                    "end": entry.end.strftime("%Y-%m-%d %H:%M"),
-                    "room": entry.rooms[0].name if entry.rooms else "Unknown",
-                    "teachers": (
-                        [t.name for t in entry.teachers] if entry.teachers else []
-                    ),
-                    "classes": [c.name for c in entry.klassen] if entry.klassen else [],
-                }
-            )
-
-        return formatted_timetable
+        if not timetable_is_fresh(dayRange):
+            if not await set_timetable(dayRange):
+                raise ValueError("Failed to fetch timetable")
+
+        return await responses.response(
+            request,
+            ("untis.timetable", dayRange, datetime.date.today()),
+            ("untis",),
+            lambda: format_timetable(store.get("untis").timetable, dayRange),
+        )
 
     except Exception as e:
         raise handle_error(e, "Failed to get timetable")
 
 
+def untis_status() -> dict:
+    """Untis connection status (also part of the dashboard)."""
+    untis = store.get("untis")
+    return {
+        "session": untis.connected,
+        "timetable_entries": len(untis.timetable),
+        "holidays": len(untis.holidays),
+    }
+
+
 @router.get("/status")
 async def get_untis_status():
     """Get Untis connection status."""
     try:
-        return {
-            "session": DB["untis_state"],
-            "timetable_entries": len(DB["timeTable"]),
-            "holidays": len(DB["holidays"]),
-        }
+        return untis_status()
     except Exception as e:
         raise handle_error(e, "Failed to get Untis status")
 
 
-# --- Update Loop ---
-async def untis_update_loop():
-    """Background task for Untis updates."""
-    while True:
-        try:
-            await refresh_session_if_needed()
-
-            if DB["untis_state"] and DB.get("untis_session"):
-                if await set_timetable(10):
-                    log("Timetable updated successfully", module="untis")
-                else:
-                    log("Failed to update timetable", level="warning", module="untis")
-            else:
-                if not SECURE_DB["untis_creds"]:
-                    try:
-                        with open("creds.json", "r") as f:
-                            creds = json.load(f)
-                            SECURE_DB["untis_creds"] = credentials(**creds)
-                    except Exception as e:
-                        log(
-                            f"Credential loading error: {e}",
-                            level="error",
-                            module="untis",
-                        )
-                        await asyncio.sleep(300)
-                        continue
-                await set_untis_session()
+# --- Scheduled Job ---
+async def untis_update():
+    """Scheduled job: keep the Untis session and timetable current. Raises on failure."""
+    try:
+        await refresh_session_if_needed()
 
-        except Exception as e:
-            log(f"Untis update error: {e}", level="error", module="untis")
-            DB["untis_state"] = False
+        untis = store.get("untis")
+        if untis.connected and untis.session:
+            if not await set_timetable():
+                raise UntisSessionError("Failed to update timetable")
+            log("Timetable updated successfully", module="untis")
+            return
+
+        if not SECURE_DB.get("untis_creds"):
+            try:
+                load_credentials()
+            except Exception as e:
+                raise UntisCredentialsError(f"Credential loading error: {e}")
+        if not await set_untis_session():
+            raise UntisSessionError("Failed to create Untis session")
 
-        await asyncio.sleep(60)  # Check more frequently
+    except Exception:
+        store.update("untis", connected=False)
+        raise
 
 
 @router.post("/logout")
@@ -322,18 +460,24 @@ async def logout_untis():
         log("Starting Untis logout process", module="untis")
 
         # Close existing session if present
-        if DB.get("untis_session"):
+        session = store.get("untis").session
+        if session:
             try:
-                DB["untis_session"].logout()
+                session.logout()
                 log("Closed Untis session", module="untis")
             except Exception as e:
                 log(f"Error closing session: {str(e)}", level="warning", module="untis")
 
         # Clear all session and credential data
-        DB["untis_session"] = None
-        DB["untis_state"] = False
-        DB["timeTable"] = []
-        DB["holidays"] = []
+        store.update(
+            "untis",
+            session=None,
+            connected=False,
+            timetable=[],
+            holidays=[],
+            current_period=None,
+            next_period=None,
+        )
         SECURE_DB["untis_creds"] = None
 
         # Remove credentials file if it exists
@@ -3,7 +3,6 @@ import traceback
 import logging
 from typing import Dict, Any, Union
 from asyncio.subprocess import create_subprocess_shell
-from db import DB
 from dataClasses import command, model
 import datetime
 
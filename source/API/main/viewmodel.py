@@ -0,0 +1,241 @@
+"""Display view model: exactly what the screen shows, computed once per data change.
+
+The screen has three timetable columns (today, tomorrow, next day with lessons) of
+SLOTS lesson slots each and CARDS notification cards. The builder turns the untis and
+microsoft slices into that fixed shape: every string already fitted to its cell with the
+driver's own fonts (driver/textfit.py, so nothing overflows), current and cancelled flags
+set, and a content hash per cell, column and view, so a renderer only places strings and
+can skip cells whose hash it has already drawn.
+
+A view is rebuilt when one of its slices changes, or when it expires: at the next lesson
+boundary of today (the current marker moves) or at midnight (the columns move).
+"""
+
+import datetime
+import hashlib
+import html
+import re
+import threading
+import time
+from itertools import groupby
+from typing import Any, Callable, Dict, List, Optional
+from db import store
+from startup import lazy_import
+from store import Store
+
+# driver/ is put on sys.path by render_api
+screen = lazy_import("screen")
+
+SLOTS = 10
+CARDS = 12
+SLICES = ("untis", "microsoft")
+TITLES = ("Heute", "Morgen", "Nächster Tag\nmit Ereignis")
+
+TAG = re.compile(r"<[^>]+>")
+SPACE = re.compile(r"\s+")
+
+
+def content_hash(*parts: Any) -> str:
+    return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+
+
+def plain_text(body: Optional[str]) -> str:
+    """Mail bodies come as HTML, cards show one paragraph of text."""
+    return SPACE.sub(" ", html.unescape(TAG.sub(" ", body or ""))).strip()
+
+
+def received_at(value: str) -> Optional[datetime.datetime]:
+    """Local time of a Graph timestamp (ISO 8601, UTC)."""
+    try:
+        received = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    return received.astimezone().replace(tzinfo=None)
+
+
+# --- Cells ---
+def empty_slot() -> Dict[str, Any]:
+    slot = {
+        "empty": True,
+        "subject": "",
+        "start": "",
+        "end": "",
+        "room": "",
+        "current": False,
+        "cancelled": False,
+    }
+    slot["hash"] = content_hash(slot)
+    return slot
+
+
+def lesson_slot(periods: List[Any], now: datetime.datetime) -> Dict[str, Any]:
+    """Slot of the periods starting at the same time; a held one wins over cancelled ones."""
+    period = next((p for p in periods if p.code != "cancelled"), periods[0])
+    fitter = screen.textFitter
+    subject = "\n".join(period.subjects) or "?"
+    room = period.rooms[0] if period.rooms else ""
+    slot = {
+        "empty": False,
+        "subject": fitter.fit(
+            "timeTableLesson", subject, screen.LESSON_SUBJECT_WIDTH, 2
+        ),
+        "start": period.start.strftime("%H:%M"),
+        "end": period.end.strftime("%H:%M"),
+        "room": fitter.fit("info", room, screen.LESSON_ROOM_WIDTH),
+        "current": period.start <= now < period.end,
+        "cancelled": period.code == "cancelled",
+    }
+    slot["hash"] = content_hash(slot)
+    return slot
+
+
+def column(
+    title: str, day: Optional[datetime.date], periods: List[Any], now
+) -> Dict[str, Any]:
+    slots = [
+        lesson_slot(list(group), now)
+        for _, group in groupby(periods, key=lambda p: p.start)
+    ][:SLOTS]
+    slots += [empty_slot() for _ in range(SLOTS - len(slots))]
+    return {
+        "title": title,
+        "date": day.isoformat() if day else None,
+        "slots": slots,
+        "hash": content_hash(title, day, [slot["hash"] for slot in slots]),
+    }
+
+
+def card(
+    channel: str, sender: str, body: str, received, today: datetime.date
+) -> Dict[str, Any]:
+    fitter = screen.textFitter
+    if received is None:
+        when = ""
+    elif received.date() == today:
+        when = received.strftime("%H:%M")
+    else:
+        when = received.strftime("%d.%m.")
+    item = {
+        "empty": False,
+        "channel": fitter.fit("info", channel, screen.NOTIFICATION_CHANNEL_WIDTH),
+        "time": when,
+        "sender": fitter.fit("info", sender, screen.NOTIFICATION_TEXT_WIDTH),
+        "body": fitter.fit(
+            "info",
+            body,
+            screen.NOTIFICATION_TEXT_WIDTH,
+            screen.NOTIFICATION_BODY_LINES,
+        ),
+    }
+    item["hash"] = content_hash(item)
+    return item
+
+
+def empty_card() -> Dict[str, Any]:
+    item = {"empty": True, "channel": "", "time": "", "sender": "", "body": ""}
+    item["hash"] = content_hash(item)
+    return item
+
+
+# --- View ---
+def build_view(untis, microsoft, now: datetime.datetime) -> Dict[str, Any]:
+    """The whole view model from the untis and microsoft slices at `now`."""
+    today = now.date()
+    days = {
+        day: list(periods)
+        for day, periods in groupby(untis.timetable, key=lambda p: p.start.date())
+    }
+    tomorrow = today + datetime.timedelta(days=1)
+    next_day = min((day for day in days if day > tomorrow), default=None)
+    columns = [
+        column(title, day, days.get(day, []), now)
+        for title, day in zip(TITLES, (today, tomorrow, next_day))
+    ]
+
+    inbox = [
+        (
+            received_at(item.get("receivedDateTime", "")),
+            item.get("title", ""),
+            "",
+            plain_text(item.get("body")),
+        )
+        for item in microsoft.notifications
+    ] + [
+        (
+            received_at(item.get("received_date", "")),
+            item.get("subject", ""),
+            item.get("from_email", ""),
+            plain_text(item.get("body")),
+        )
+        for item in microsoft.messages
+    ]
+    inbox.sort(key=lambda item: item[0] or datetime.datetime.min, reverse=True)
+    cards = [
+        card(channel, sender, body, received, today)
+        for received, channel, sender, body in inbox[:CARDS]
+    ]
+    cards += [empty_card() for _ in range(CARDS - len(cards))]
+
+    # the current marker moves at the next lesson boundary, the columns at midnight
+    boundaries = [
+        moment
+        for period in days.get(today, [])
+        for moment in (period.start, period.end)
+        if moment > now
+    ]
+    boundaries.append(datetime.datetime.combine(tomorrow, datetime.time()))
+    return {
+        "columns": columns,
+        "cards": cards,
+        "valid_until": min(boundaries).isoformat(),
+        "hash": content_hash([c["hash"] for c in columns], [c["hash"] for c in cards]),
+    }
+
+
+class ViewModelBuilder:
+    """Current view model, rebuilt only when its data changed or it expired."""
+
+    def __init__(
+        self, store: Store, now: Callable[[], datetime.datetime] = datetime.datetime.now
+    ):
+        self.store = store
+        self.now = now  # wall clock of the clock the view is for
+        self._lock = threading.Lock()  # renders ask from worker threads
+        self._view: Optional[Dict[str, Any]] = None
+        self._versions: Optional[tuple] = None
+        self.builds = 0
+        self.hits = 0
+        self.last_build: Optional[float] = None
+
+    def current(self) -> Dict[str, Any]:
+        with self._lock:
+            versions = tuple(self.store.version(name) for name in SLICES)
+            now = self.now()
+            view = self._view
+            if (
+                view is not None
+                and versions == self._versions
+                and now < datetime.datetime.fromisoformat(view["valid_until"])
+            ):
+                self.hits += 1
+                return view
+            started = time.monotonic()
+            view = build_view(
+                self.store.get("untis"),
+                self.store.get("microsoft"),
+                now,
+            )
+            self.last_build = time.monotonic() - started
+            self.builds += 1
+            self._view, self._versions = view, versions
+            return view
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "builds": self.builds,
+            "hits": self.hits,
+            "last_build_seconds": self.last_build,
+        }
+
+
+views = ViewModelBuilder(store)
@@ -0,0 +1,131 @@
+"""Startup warm-up.
+
+main.py restores what the previous run persisted (state journal, MSAL token cache) before the
+server starts serving, then `run()` re-establishes the upstream connections concurrently in the background:
+Untis session followed by timetable and master data (holidays), a silent MSAL token, and the
+D-Bus connection to NetworkManager. Every step is timed; /status reports the steps and whether
+warm-up has finished.
+"""
+
+import asyncio
+import inspect
+import time
+from typing import Any, Callable, Dict, Optional
+from db import store
+from util import log
+
+# Seconds a single background step may take
+STEP_TIMEOUT = 60
+# Restored timetables younger than this are not fetched again during warm-up
+FRESH = 300
+
+
+class Warmup:
+    """Runs the warm-up steps and keeps their state and timing."""
+
+    def __init__(self):
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.is_leader: Callable[[], bool] = lambda: True
+
+    def _entry(self, name: str) -> Dict[str, Any]:
+        return self.steps.setdefault(
+            name, {"state": "pending", "duration": None, "error": None}
+        )
+
+    def declare(self, *names: str) -> None:
+        """List steps as pending so /status shows them before they start."""
+        for name in names:
+            self._entry(name)
+
+    def skip(self, *names: str) -> None:
+        for name in names:
+            self._entry(name)["state"] = "skipped"
+
+    async def step(
+        self, name: str, func: Callable[[], Any], upstream: bool = False
+    ) -> bool:
+        """Run one (sync or async) step. Upstream steps only run in the leader worker."""
+        entry = self._entry(name)
+        if upstream and not self.is_leader():
+            self.skip(name)
+            return False
+        entry["state"] = "running"
+        started = time.monotonic()
+        try:
+            result = func()
+            if inspect.isawaitable(result):
+                result = await asyncio.wait_for(result, STEP_TIMEOUT)
+            entry["state"] = "ok" if result is not False else "unavailable"
+            return result is not False
+        except Exception as e:
+            entry["state"] = "failed"
+            entry["error"] = str(e) or type(e).__name__
+            log(
+                f"Warm-up step {name} failed: {entry['error']}",
+                level="warning",
+                module="warmup",
+            )
+            return False
+        finally:
+            entry["duration"] = time.monotonic() - started
+
+    async def run(self) -> None:
+        """Scheduled job: the concurrent part of the warm-up."""
+        from microsoft_api import acquire_token_silently
+        from network_api import load_wifi_device
+        from untis_api import set_untis_session, set_timetable, set_next_holiday
+
+        async def untis():
+            updated = store.get("untis").updated
+            fresh = updated is not None and time.time() - updated < FRESH
+            if await self.step("untis_session", set_untis_session, upstream=True):
+                if fresh:
+                    # restored from the journal, untis_update refreshes it later
+                    self.skip("untis_timetable", "untis_master_data")
+                    return
+                await asyncio.gather(
+                    self.step("untis_timetable", set_timetable),
+                    self.step("untis_master_data", set_next_holiday),
+                )
+            else:
+                self.skip("untis_timetable", "untis_master_data")
+
+        async def dbus():
+            return await load_wifi_device() is not None
+
+        self.started = time.time()
+        await asyncio.gather(
+            untis(),
+            self.step("microsoft_token", acquire_token_silently, upstream=True),
+            self.step("dbus", dbus),
+        )
+        self.finished = time.time()
+        log(
+            f"Warm-up finished in {self.finished - self.started:.2f}s: "
+            + ", ".join(
+                f"{name}={entry['state']}" for name, entry in self.steps.items()
+            ),
+            module="warmup",
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self.finished is not None
+
+    def fingerprint(self) -> tuple:
+        """Changes whenever the step states in `status()` do."""
+        return (self.ready, tuple(step["state"] for step in self.steps.values()))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "duration": (
+                self.finished - self.started if self.ready and self.started else None
+            ),
+            "steps": {name: dict(entry) for name, entry in self.steps.items()},
+        }
+
+
+warmup = Warmup()
@@ -31,6 +31,10 @@ export interface Config {
     debug: boolean;
     hostname: string;
     timezone: string;
+    quiet_hours: boolean;
+    quiet_start: string;
+    quiet_end: string;
+    quiet_refresh: "minute" | "hour";
 }
 
 export interface MicrosoftLoginResponse {
@@ -52,4 +56,44 @@ export interface MicrosoftGetAccountsResponse {
     authority_type: string,
     local_account_id: string,
     realm: string
-}
\ No newline at end of file
+}
+
+export interface UntisStatus {
+    connected: boolean;
+    timetable_entries: number;
+    holidays: number;
+    updated: number | null;
+}
+
+export interface MicrosoftStatus {
+    authenticated: boolean;
+    expires_at: number | null;
+    device_flow_active: boolean;
+    device_flow_expires_at: number | null;
+}
+
+export interface NetworkStatus {
+    dbus_connected: boolean;
+    wifi_device: string | null;
+}
+
+export type StateEvent =
+    | { id: number; type: "config"; version: number; data: Config }
+    | { id: number; type: "untis"; version: number; data: UntisStatus }
+    | { id: number; type: "microsoft"; version: number; data: MicrosoftStatus }
+    | { id: number; type: "network"; version: number; data: NetworkStatus };
+
+export type DashboardView<T> = T | { error: string };
+
+export interface Dashboard {
+    status?: DashboardView<StatusResponse>;
+    config?: DashboardView<Config>;
+    untis?: DashboardView<{ session: boolean; timetable_entries: number; holidays: number }>;
+    microsoft?: DashboardView<
+        | { status: "authenticated"; account: string | null; expires_at: number; scopes: string[] }
+        | ({ status: "login_required" } & MicrosoftLoginResponse)
+        | { status: "logged_out" }
+    >;
+    device_flow?: DashboardView<{ active: boolean; expires_at: number | null }>;
+    access_points?: DashboardView<Network[]>;
+}